@@ -16,6 +16,148 @@ class Settings():
     BASE_PATH: str = "https://ailab.ndmctsgh.edu.tw/aiot_devteam/s/312fc3c9ab5a732f1f6c4/p/e3ac4199/"
     BASE_PREFIX: str = "/api/v1"
 
+    # ECG image rendering / caching
+    IMAGE_CACHE_MAX_BYTES: int = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    IMAGE_DEFAULT_DPI: int = int(os.getenv('IMAGE_DEFAULT_DPI', 300))
+    THUMBNAIL_DPI: int = int(os.getenv('THUMBNAIL_DPI', 20))
+
+    # Signal preprocessing / quality gate before inference
+    POWERLINE_HZ: float = float(os.getenv('POWERLINE_HZ', 60))
+    QUALITY_MIN_SCORE: float = float(os.getenv('QUALITY_MIN_SCORE', 0.5))
+    QUALITY_MIN_USABLE_LEADS: int = int(os.getenv('QUALITY_MIN_USABLE_LEADS', 8))
+    PREPROCESS_BUDGET_MS: float = float(os.getenv('PREPROCESS_BUDGET_MS', 20))
+
+    # AI inference
+    ENABLE_AI_INFERENCE: bool = os.getenv('ENABLE_AI_INFERENCE', False) == 'True'
+    WINDOW_OVERLAP_SECONDS: float = float(os.getenv('WINDOW_OVERLAP_SECONDS', 2))
+    INFERENCE_BATCH_SIZE: int = int(os.getenv('INFERENCE_BATCH_SIZE', 16))
+
+    # Inference backend: remote (AI API below) | local (ONNX Runtime on CPU, model exported to ONNX_MODEL_PATH;
+    # 0 intra-op threads = CPU count / WORKER_COUNT, input layout NCL = (batch, 12, 5000), NLC = (batch, 5000, 12))
+    INFERENCE_BACKEND: str = os.getenv('INFERENCE_BACKEND', 'remote')
+    ONNX_MODEL_PATH: str = os.getenv('ONNX_MODEL_PATH', '')
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv('ONNX_INTRA_OP_THREADS', 0))
+    ONNX_INPUT_LAYOUT: str = os.getenv('ONNX_INPUT_LAYOUT', 'NCL')
+    ONNX_LABELS: str = os.getenv('ONNX_LABELS', '')
+
+    # Remote inference: comma separated model replicas, timeouts (s), health checks (empty path = off),
+    # hedging after the replica's p95 latency, circuit breaker
+    AI_URLS: str = os.getenv('AI_URLS', 'http://192.192.91.111:18392')
+    AI_TIMEOUT_SECONDS: float = float(os.getenv('AI_TIMEOUT_SECONDS', 30))
+    AI_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv('AI_CONNECT_TIMEOUT_SECONDS', 3))
+    AI_HEALTH_PATH: str = os.getenv('AI_HEALTH_PATH', '')
+    AI_HEALTH_INTERVAL_SECONDS: float = float(os.getenv('AI_HEALTH_INTERVAL_SECONDS', 10))
+    AI_HEDGING: bool = os.getenv('AI_HEDGING', 'True') == 'True'
+    AI_BREAKER_FAILURES: int = int(os.getenv('AI_BREAKER_FAILURES', 5))
+    AI_BREAKER_RESET_SECONDS: float = float(os.getenv('AI_BREAKER_RESET_SECONDS', 30))
+    AI_MAX_CONCURRENCY: int = int(os.getenv('AI_MAX_CONCURRENCY', 16))
+
+    # Budget of a request unless the caller sends a shorter X-Request-Timeout (s)
+    REQUEST_TIMEOUT_SECONDS: float = float(os.getenv('REQUEST_TIMEOUT_SECONDS', 60))
+
+    # Stored record matrices: ecg (lossless codec at the source step; ECG_CODEC_RESOLUTION_UV when the upload has
+    # no integer counts; matrices off that grid, e.g. resampled ones, fall back to npy) | npy (raw float64)
+    RECORD_CODEC: str = os.getenv('RECORD_CODEC', 'ecg')
+    ECG_CODEC_RESOLUTION_UV: float = float(os.getenv('ECG_CODEC_RESOLUTION_UV', 1))
+
+    # Upload storage (local | s3), compression (none | gzip | zstd), retention (0 = keep)
+    STORAGE_BACKEND: str = os.getenv('STORAGE_BACKEND', 'local')
+    STORAGE_LOCAL_DIR: str = os.getenv('STORAGE_LOCAL_DIR', '')
+    STORAGE_COMPRESSION: str = os.getenv('STORAGE_COMPRESSION', 'zstd')
+    STORAGE_RETENTION_DAYS: int = int(os.getenv('STORAGE_RETENTION_DAYS', 0))
+    STORAGE_MAX_BYTES: int = int(os.getenv('STORAGE_MAX_BYTES', 0))
+    S3_BUCKET: str = os.getenv('S3_BUCKET', 'smart-ecg')
+    S3_PREFIX: str = os.getenv('S3_PREFIX', 'json')
+    S3_ENDPOINT_URL: str = os.getenv('S3_ENDPOINT_URL') or None
+    S3_ACCESS_KEY: str = os.getenv('S3_ACCESS_KEY') or None
+    S3_SECRET_KEY: str = os.getenv('S3_SECRET_KEY') or None
+    S3_REGION: str = os.getenv('S3_REGION') or None
+
+    # Transfer compression: uploads may be gzip / zstd, responses are compressed above the minimum size
+    MAX_UPLOAD_BYTES: int = int(os.getenv('MAX_UPLOAD_BYTES', 256 * 1024 * 1024))
+    RESPONSE_COMPRESSION_MIN_BYTES: int = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+
+    # Admission control for uploads: token buckets per JWT user and per IP (requests / minute, burst),
+    # concurrent uploads across the workers sharing the backend (0 = CPU count); backend memory | sqlite
+    ADMISSION_ENABLED: bool = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+    ADMISSION_BACKEND: str = os.getenv('ADMISSION_BACKEND', 'sqlite')
+    ADMISSION_SQLITE_PATH: str = os.getenv('ADMISSION_SQLITE_PATH', '')
+    RATE_LIMIT_USER_PER_MINUTE: float = float(os.getenv('RATE_LIMIT_USER_PER_MINUTE', 30))
+    RATE_LIMIT_USER_BURST: int = int(os.getenv('RATE_LIMIT_USER_BURST', 10))
+    RATE_LIMIT_IP_PER_MINUTE: float = float(os.getenv('RATE_LIMIT_IP_PER_MINUTE', 60))
+    RATE_LIMIT_IP_BURST: int = int(os.getenv('RATE_LIMIT_IP_BURST', 20))
+    MAX_CONCURRENT_UPLOADS: int = int(os.getenv('MAX_CONCURRENT_UPLOADS', 0))
+    ADMISSION_TRUST_FORWARDED: bool = os.getenv('ADMISSION_TRUST_FORWARDED', False) == 'True'
+
+    # Identical in-flight uploads are processed once (per host); their outcome is reused for this many seconds
+    SINGLE_FLIGHT_DIR: str = os.getenv('SINGLE_FLIGHT_DIR', '')
+    SINGLE_FLIGHT_RESULT_TTL: float = float(os.getenv('SINGLE_FLIGHT_RESULT_TTL', 300))
+    SINGLE_FLIGHT_LOCK_TIMEOUT: float = float(os.getenv('SINGLE_FLIGHT_LOCK_TIMEOUT', 120))
+
+    # Index of analyzed results for search (SQLAlchemy); DATABASE_URL overrides the PostgreSQL DB_* settings,
+    # e.g. sqlite:///file/smart.sqlite3 for a single host
+    ECG_INDEX_ENABLED: bool = os.getenv('ECG_INDEX_ENABLED', False) == 'True'
+    ECG_INDEX_TOP_LABELS: int = int(os.getenv('ECG_INDEX_TOP_LABELS', 5))
+    DATABASE_URL: str = os.getenv('DATABASE_URL', '')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', 10))
+
+    # FHIR validation of uploads: local profile check (offline, < 1 ms); remote FHIR server as a second tier:
+    # off | background (logged, does not delay the upload) | strict (rejects the upload)
+    FHIR_LOCAL_VALIDATION: bool = os.getenv('FHIR_LOCAL_VALIDATION', 'True') == 'True'
+    FHIR_REMOTE_VALIDATION: str = os.getenv('FHIR_REMOTE_VALIDATION', 'off')
+
+    # Write-back of AI results to the FHIR server as DiagnosticReport / Observation transaction Bundles,
+    # sent every FHIR_WRITEBACK_BATCH_SIZE reports or FHIR_WRITEBACK_FLUSH_SECONDS; AUTH = client credentials token
+    FHIR_WRITEBACK_ENABLED: bool = os.getenv('FHIR_WRITEBACK_ENABLED', False) == 'True'
+    FHIR_BASE_URL: str = os.getenv('FHIR_BASE_URL', 'http://172.18.0.53:10004/fhir')
+    FHIR_WRITEBACK_BATCH_SIZE: int = int(os.getenv('FHIR_WRITEBACK_BATCH_SIZE', 50))
+    FHIR_WRITEBACK_FLUSH_SECONDS: float = float(os.getenv('FHIR_WRITEBACK_FLUSH_SECONDS', 2))
+    FHIR_WRITEBACK_MAX_RETRIES: int = int(os.getenv('FHIR_WRITEBACK_MAX_RETRIES', 3))
+    FHIR_WRITEBACK_TIMEOUT_SECONDS: float = float(os.getenv('FHIR_WRITEBACK_TIMEOUT_SECONDS', 30))
+    FHIR_WRITEBACK_AUTH: bool = os.getenv('FHIR_WRITEBACK_AUTH', False) == 'True'
+
+    # Bulk $export: gzip NDJSON files of EXPORT_CHUNK_RECORDS lines each, concurrent jobs per worker,
+    # finished exports are deleted after EXPORT_RETENTION_HOURS
+    EXPORT_CHUNK_RECORDS: int = int(os.getenv('EXPORT_CHUNK_RECORDS', 1000))
+    EXPORT_MAX_JOBS: int = int(os.getenv('EXPORT_MAX_JOBS', 2))
+    EXPORT_RETENTION_HOURS: float = float(os.getenv('EXPORT_RETENTION_HOURS', 24))
+
+    # Webhooks: signed notifications of analyzed uploads to the callback URLs users register, from a persistent SQLite
+    # outbox; up to WEBHOOK_BATCH_SIZE events per POST, WEBHOOK_MAX_IN_FLIGHT concurrent POSTs per destination,
+    # failures retried after WEBHOOK_BACKOFF_SECONDS, doubling up to WEBHOOK_MAX_BACKOFF_SECONDS, WEBHOOK_MAX_ATTEMPTS times
+    WEBHOOKS_ENABLED: bool = os.getenv('WEBHOOKS_ENABLED', False) == 'True'
+    WEBHOOK_DB_PATH: str = os.getenv('WEBHOOK_DB_PATH', '')
+    WEBHOOK_BATCH_SIZE: int = int(os.getenv('WEBHOOK_BATCH_SIZE', 50))
+    WEBHOOK_FLUSH_SECONDS: float = float(os.getenv('WEBHOOK_FLUSH_SECONDS', 1))
+    WEBHOOK_MAX_IN_FLIGHT: int = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', 2))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 10))
+    WEBHOOK_BACKOFF_SECONDS: float = float(os.getenv('WEBHOOK_BACKOFF_SECONDS', 5))
+    WEBHOOK_MAX_BACKOFF_SECONDS: float = float(os.getenv('WEBHOOK_MAX_BACKOFF_SECONDS', 3600))
+    WEBHOOK_TIMEOUT_SECONDS: float = float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', 10))
+    # callback URLs must be https to public addresses; plain http only when allowed (e.g. a test receiver)
+    WEBHOOK_ALLOW_HTTP: bool = os.getenv('WEBHOOK_ALLOW_HTTP', False) == 'True'
+
+    # Readiness: not ready above this event-loop lag or this many calls waiting for a worker thread, or when a
+    # required dependency probe (inference, fhir, database; refreshed every HEALTH_PROBE_INTERVAL_SECONDS) fails
+    HEALTH_MAX_LOOP_LAG_MS: float = float(os.getenv('HEALTH_MAX_LOOP_LAG_MS', 250))
+    HEALTH_MAX_EXECUTOR_QUEUE: int = int(os.getenv('HEALTH_MAX_EXECUTOR_QUEUE', 32))
+    HEALTH_PROBE_INTERVAL_SECONDS: float = float(os.getenv('HEALTH_PROBE_INTERVAL_SECONDS', 10))
+    HEALTH_REQUIRED_PROBES: str = os.getenv('HEALTH_REQUIRED_PROBES', '')
+
+    # Logging: dictConfig file applied at startup (e.g. log_conf.yml, empty = keep the server's config)
+    LOG_CONFIG: str = os.getenv('LOG_CONFIG', '')
+    LOG_RATE_LIMIT_SECONDS: float = float(os.getenv('LOG_RATE_LIMIT_SECONDS', 60))
+    LOG_RATE_LIMIT_BURST: int = int(os.getenv('LOG_RATE_LIMIT_BURST', 5))
+
+    # Tracing exporter: none | console | file | otel (globally configured OpenTelemetry SDK)
+    TRACING_EXPORTER: str = os.getenv('TRACING_EXPORTER', 'none')
+    TRACING_FILE: str = os.getenv('TRACING_FILE', 'logs/traces.jsonl')
+
+    # Startup
+    PREWARM_ON_STARTUP: bool = os.getenv('PREWARM_ON_STARTUP', 'True') == 'True'
+    IMPORT_TIME_BUDGET_MS: float = float(os.getenv('IMPORT_TIME_BUDGET_MS', 800))
+
 basicSettings = Settings()
 
 class DatabaseSettings(BaseSettings):
@@ -0,0 +1,41 @@
+import contextvars
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+
+# absolute time.monotonic() by which the current request must be answered (None = no deadline)
+request_deadline_var = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the work could be done."""
+
+
+### Deadline of the incoming request: the caller's X-Request-Timeout (seconds) capped by the server default ###
+def set_request_deadline(header_value=None, default_seconds=60.0):
+
+    timeout = default_seconds
+    if header_value:
+        try:
+            timeout = min(timeout, max(0.0, float(header_value)))
+        except ValueError:
+            pass
+    deadline = time.monotonic() + timeout
+    request_deadline_var.set(deadline)
+    return deadline
+
+def current_deadline():
+    return request_deadline_var.get()
+
+### Seconds left before `deadline` (the current request's by default), None when unbounded ###
+def remaining_budget(deadline=None):
+    deadline = deadline if deadline is not None else request_deadline_var.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+if __name__ == "__main__":
+    pass
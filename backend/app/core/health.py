@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.middleware.exception import exception_message
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+class HealthMonitor():
+    """
+    Liveness / readiness state of one worker.
+      - loop lag:  a ticker sleeps `interval` s and measures how late it wakes up (smoothed over the last ticks)
+      - executor:  callers waiting for a thread of the run_in_threadpool limiter
+      - probes:    named async checks of the dependencies, run every `probe_interval` s in the background, so a
+                   readiness request never waits on a dependency
+    The worker is not ready while the loop lag or the executor queue is over its limit, or a `required` probe fails;
+    the load balancer then moves traffic to other workers before latency collapses here.
+    """
+
+    def __init__(self, max_loop_lag=0.25, max_executor_queue=32, interval=0.25, probe_interval=10.0, probe_timeout=2.0, required=()):
+        self.max_loop_lag = max_loop_lag
+        self.max_executor_queue = max_executor_queue
+        self.interval = interval
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.required = set(required)
+        self.loop_lag = 0.0
+        self.max_lag_seen = 0.0
+        self._probes = {}
+        self._results = {}
+        self._gauges = {}
+
+    def add_probe(self, name, check):
+        """`check` is a coroutine function returning True when the dependency is usable."""
+        self._probes[name] = check
+
+    def add_gauge(self, name, read):
+        """`read()` is reported with readiness (e.g. a queue length); it does not affect the decision."""
+        self._gauges[name] = read
+
+    ### Background loops: lag ticker and dependency probes ###
+    async def run(self):
+        probe_task = asyncio.create_task(self._probe_loop())
+        try:
+            await self._lag_loop()
+        finally:
+            probe_task.cancel()
+
+    async def _lag_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.loop_lag = 0.7 * self.loop_lag + 0.3 * lag if lag < self.loop_lag else lag  # rises at once, decays over a few ticks
+            self.max_lag_seen = max(self.max_lag_seen, lag)
+
+    async def _probe_loop(self):
+        while True:
+            await self.check_dependencies()
+            await asyncio.sleep(self.probe_interval)
+
+    async def check_dependencies(self):
+        names = list(self._probes)
+        outcomes = await asyncio.gather(*(self._probe(name) for name in names))
+        for name, (healthy, error, latency) in zip(names, outcomes):
+            previous = self._results.get(name)
+            if previous is not None and previous["healthy"] != healthy:
+                system_logger.warning("Dependency %s is now %s%s", name, "up" if healthy else "down", f" ({error})" if error else "")
+            self._results[name] = {"healthy": healthy, "error": error, "latency_ms": round(latency * 1000, 1), "checked": time.time()}
+
+    async def _probe(self, name):
+        start_time = time.perf_counter()
+        try:
+            healthy, error = bool(await asyncio.wait_for(self._probes[name](), self.probe_timeout)), None
+        except asyncio.TimeoutError:
+            healthy, error = False, f"timeout after {self.probe_timeout} s"
+        except Exception as e:
+            healthy, error = False, exception_message(e)
+        return healthy, error, time.perf_counter() - start_time
+
+    ### run_in_threadpool capacity (anyio's default limiter of this event loop) ###
+    def executor_stats(self):
+        from anyio import to_thread
+
+        statistics = to_thread.current_default_thread_limiter().statistics()
+        return {"busy": statistics.borrowed_tokens, "threads": statistics.total_tokens, "waiting": statistics.tasks_waiting}
+
+    ### (ready, report) from the cached state, cheap enough for every load balancer poll ###
+    def readiness(self):
+
+        executor = self.executor_stats()
+        reasons = []
+        if self.loop_lag > self.max_loop_lag:
+            reasons.append(f"event loop lag {self.loop_lag * 1000:.0f} ms")
+        if executor["waiting"] > self.max_executor_queue:
+            reasons.append(f"{executor['waiting']} calls waiting for a worker thread")
+        for name in self.required:
+            result = self._results.get(name)
+            if result is not None and not result["healthy"]:
+                reasons.append(f"{name} unavailable")
+
+        report = {
+            "status": "not ready" if reasons else "ready",
+            "reasons": reasons,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "max_loop_lag_ms": round(self.max_lag_seen * 1000, 1),
+            "executor": executor,
+            "queues": {name: read() for name, read in self._gauges.items()},
+            "dependencies": self._results,
+        }
+        return not reasons, report
+
+
+_health_monitor = None
+
+### Monitor configured from settings, with a probe per enabled dependency, one per worker ###
+def get_health_monitor():
+
+    global _health_monitor
+    if _health_monitor is None:
+        from app.configs.config import basicSettings
+
+        _health_monitor = HealthMonitor(
+            max_loop_lag=basicSettings.HEALTH_MAX_LOOP_LAG_MS / 1000,
+            max_executor_queue=basicSettings.HEALTH_MAX_EXECUTOR_QUEUE,
+            probe_interval=basicSettings.HEALTH_PROBE_INTERVAL_SECONDS,
+            required=[name.strip() for name in basicSettings.HEALTH_REQUIRED_PROBES.split(",") if name.strip()],
+        )
+
+        if basicSettings.ENABLE_AI_INFERENCE:
+            from app.misc.utils.inference_backend import get_inference_backend
+            _health_monitor.add_probe("inference", lambda: get_inference_backend().ready())
+
+        if basicSettings.FHIR_WRITEBACK_ENABLED or basicSettings.FHIR_REMOTE_VALIDATION != "off":
+            async def fhir_probe():
+                from app.misc.utils.fhir_writeback import get_fhir_writeback
+
+                response = await get_fhir_writeback().client.get(f"{basicSettings.FHIR_BASE_URL.rstrip('/')}/metadata", headers={"Accept": "application/fhir+json"})
+                return response.status_code < 500
+            _health_monitor.add_probe("fhir", fhir_probe)
+
+        if basicSettings.FHIR_WRITEBACK_ENABLED:
+            from app.misc.utils.fhir_writeback import get_fhir_writeback
+            _health_monitor.add_gauge("fhir_writeback", get_fhir_writeback().pending)
+
+        if basicSettings.WEBHOOKS_ENABLED:
+            from app.misc.utils.webhooks import get_webhook_dispatcher
+            _health_monitor.add_gauge("webhook_outbox", get_webhook_dispatcher().pending)
+
+        if basicSettings.ECG_INDEX_ENABLED:
+            from fastapi.concurrency import run_in_threadpool
+            from app.database.smart import ping_db
+            _health_monitor.add_probe("database", lambda: run_in_threadpool(ping_db))
+
+    return _health_monitor
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,203 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+
+# per-request context, visible to every log record emitted while serving the request (also from worker threads)
+request_id_var = contextvars.ContextVar("request_id", default="-")
+stage_timings_var = contextvars.ContextVar("stage_timings", default=None)
+
+APP_LOGGERS = ("uvicorn.error", "uvicorn.access", "custom.error", "custom.request", "custom.trace")
+
+# LogRecord attributes that are not user supplied "extra" fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+### Request context ###
+def new_request_id(incoming=None):
+    request_id = incoming if incoming and len(incoming) <= 128 and incoming.isprintable() else uuid.uuid4().hex
+    request_id_var.set(request_id)
+    stage_timings_var.set({})
+    return request_id
+
+@contextmanager
+def stage_timer(stage):
+    """Accumulate the wall time of a pipeline stage (ms) into the current request's timings."""
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = stage_timings_var.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + (time.perf_counter() - start_time) * 1000, 2)
+
+def get_stage_timings():
+    return dict(stage_timings_var.get() or {})
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets the same warning template (e.g. "Lead %s without data") through at most `burst` times per `interval` seconds
+    per logger; the next record that passes reports how many were suppressed. Other levels are never dropped.
+    """
+
+    def __init__(self, interval=60.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING:
+            return True
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.burst:
+                self._windows[key] = (window_start, count, suppressed + 1)
+                return False
+            self._windows[key] = (window_start, count + 1, 0)
+            if len(self._windows) > 10000:  # unbounded templates (f-strings) must not grow this forever
+                self._windows.clear()
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} [{suppressed} similar warnings suppressed]"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, source, request id and any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "source": f"{record.filename}:{record.lineno}",
+            "request_id": getattr(record, "request_id", request_id_var.get()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that captures the request / trace ids (and the logger it was attached to) before the record is queued."""
+
+    def __init__(self, log_queue, route):
+        super().__init__(log_queue)
+        self.route = route
+
+    def prepare(self, record):
+        from app.core.tracing import current_trace_ids
+
+        record.request_id = request_id_var.get()
+        trace_id, span_id = current_trace_ids()
+        if trace_id and record.name != "custom.trace":
+            record.trace_id, record.span_id = trace_id, span_id
+        record = super().prepare(record)
+        record._route = self.route
+        return record
+
+
+class RoutingHandler(logging.Handler):
+    """Runs on the listener thread and hands each record to the handlers of the logger it was queued from."""
+
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+
+    def handle(self, record):
+        for handler in self.routes.get(getattr(record, "_route", None), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+
+### Load a dictConfig YAML (e.g. log_conf.yml), creating the directories of its file handlers ###
+def load_log_config(config_path):
+
+    import yaml
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    for handler in config.get("handlers", {}).values():
+        if handler.get("filename"):
+            os.makedirs(os.path.dirname(os.path.abspath(handler["filename"])), exist_ok=True)
+    logging.config.dictConfig(config)
+
+### Route the app loggers through one queue so that formatting and disk I/O happen on a background thread ###
+def start_logging(config_path=None, rate_limit_interval=60.0, rate_limit_burst=5):
+    """
+    Idempotent. The handlers configured on the app loggers (by uvicorn's log_config or `config_path`) are moved
+    behind a single QueueHandler per logger and served by one QueueListener thread.
+    """
+
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        if config_path:
+            load_log_config(config_path)
+
+        log_queue = queue.SimpleQueue()
+        routes = {}
+        for name in APP_LOGGERS:
+            logger = logging.getLogger(name)
+            targets = [handler for handler in logger.handlers if not isinstance(handler, logging.handlers.QueueHandler)]
+            if not targets:
+                continue
+            for handler in targets:
+                logger.removeHandler(handler)
+            routes[name] = targets
+
+            queue_handler = ContextQueueHandler(log_queue, name)
+            queue_handler.addFilter(RateLimitFilter(interval=rate_limit_interval, burst=rate_limit_burst))
+            logger.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, RoutingHandler(routes))
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+### Flush the queue and join the listener thread ###
+def stop_logging():
+
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,61 @@
+import gc
+import logging
+import numpy as np
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.middleware.exception import exception_message
+
+
+system_logger = logging.getLogger('custom.error')
+
+_prewarmed = False
+
+
+### Import the heavy modules and build their caches once ###
+def prewarm():
+    """
+    Loads matplotlib (font cache + Agg renderer), scipy.signal filters and passlib.
+    Called from the lifespan hook in every worker, or once in the master before fork in preload mode
+    so workers share the pages copy-on-write.
+    """
+
+    global _prewarmed
+    if _prewarmed:
+        return
+
+    start_time = time.perf_counter()
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib import font_manager
+        font_manager.findfont("DejaVu Sans")  # builds / loads the font cache
+
+        from app.misc.utils.parse_ecg_from_fhir import render_ecg_image
+        render_ecg_image(np.zeros((500, 12)), fmt="png", dpi=10)  # first draw initialises the Agg text / path caches
+
+        from app.configs.config import basicSettings
+        from app.misc.utils.preprocess_ecg import design_filters
+        from app.misc.utils.window_ecg import resample_to_rate
+        design_filters(500, basicSettings.POWERLINE_HZ, True, True)
+        resample_to_rate(np.zeros((10, 12)), 1000)
+
+        from app.security.jwtAuth import get_pwd_context
+        get_pwd_context()
+
+    except Exception as e:
+        system_logger.warning("Prewarm incomplete: %s", exception_message(e))
+
+    _prewarmed = True
+    system_logger.info("Prewarm finished in %.0f ms", (time.perf_counter() - start_time) * 1000)
+
+### Before forking workers: move everything allocated so far out of the GC's reach ###
+def freeze_before_fork():
+    gc.collect()
+    gc.freeze()  # avoids GC passes touching (and un-sharing) the preloaded pages in the workers
+
+if __name__ == "__main__":
+    pass
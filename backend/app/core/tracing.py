@@ -0,0 +1,201 @@
+import contextvars
+import importlib.util
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sys
+import time
+
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.core.logger import stage_timer
+
+
+trace_logger = logging.getLogger('custom.trace')
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# span of the built-in tracer that is current in this context (worker threads inherit it via run_in_threadpool)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_tracer = None
+_use_otel = False
+
+
+class Span():
+    """
+    Minimal W3C-compatible span used when the OpenTelemetry SDK is not installed.
+    Finished spans are written as JSON lines to the custom.trace logger (and so through the logging queue).
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, kind="internal", attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self.end_time = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = "error"
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = str(exc)
+
+    def end(self):
+        self.end_time = time.time()
+        if trace_logger.isEnabledFor(logging.INFO):
+            trace_logger.info(json.dumps({
+                "name": self.name,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "kind": self.kind,
+                "start": self.start_time,
+                "duration_ms": round((self.end_time - self.start_time) * 1000, 3),
+                "status": self.status,
+                "attributes": self.attributes,
+            }, default=str))
+
+
+### Configure the tracer once per worker ###
+def setup_tracing(exporter="none", file_path="logs/traces.jsonl", service_name="smart-ecg"):
+    """
+    exporter: none    - ids are generated and propagated (logs and downstream calls stay correlated), spans are not exported
+              console - spans to stderr
+              file    - spans as JSON lines to file_path
+              otel    - use the globally configured OpenTelemetry SDK provider (e.g. OTLP via opentelemetry-instrument)
+    With the OpenTelemetry SDK installed console/file use its exporters, otherwise the built-in tracer is used.
+    """
+
+    global _tracer, _use_otel
+    sdk_available = importlib.util.find_spec("opentelemetry.sdk") is not None
+
+    if exporter == "otel" or (sdk_available and exporter in ("console", "file")):
+        from opentelemetry import trace
+
+        if exporter in ("console", "file"):
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+            if exporter == "file":
+                os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+                out = open(file_path, "a", encoding="utf-8")
+                span_exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+            else:
+                span_exporter = ConsoleSpanExporter()
+            provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+            provider.add_span_processor(BatchSpanProcessor(span_exporter))  # exports on a background thread
+            trace.set_tracer_provider(provider)
+
+        _tracer = trace.get_tracer(service_name)
+        _use_otel = True
+        return
+
+    _use_otel = False
+    _tracer = None
+    trace_logger.propagate = False
+    trace_logger.handlers.clear()
+    if exporter == "none":
+        trace_logger.setLevel(logging.CRITICAL + 1)
+        return
+
+    trace_logger.setLevel(logging.INFO)
+    if exporter == "file":
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(file_path, maxBytes=10485760, backupCount=5, encoding="utf8")
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(handler)
+
+
+### W3C trace context ###
+def parse_traceparent(header):
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None, None
+    return match.group(1), match.group(2)
+
+def current_trace_ids():
+    """(trace_id, span_id) of the active span, or (None, None)."""
+
+    if _use_otel:
+        from opentelemetry import trace
+
+        span_context = trace.get_current_span().get_span_context()
+        if not span_context.is_valid:
+            return None, None
+        return format(span_context.trace_id, "032x"), format(span_context.span_id, "016x")
+
+    span = _current_span.get()
+    return (span.trace_id, span.span_id) if span else (None, None)
+
+def inject_trace_headers(headers=None):
+    """Copy of `headers` with a traceparent for the active span, for outbound HTTP calls."""
+
+    headers = dict(headers or {})
+    if _use_otel:
+        from opentelemetry.propagate import inject
+        inject(headers)
+        return headers
+
+    trace_id, span_id = current_trace_ids()
+    if trace_id:
+        headers["traceparent"] = f"00-{trace_id}-{span_id}-01"
+    return headers
+
+
+### Spans ###
+@contextmanager
+def start_span(name, kind="internal", traceparent=None, **attributes):
+    """
+    Open a span as a child of the current one (or of an incoming `traceparent` header for server spans).
+    Yields an object with set_attribute(); exceptions are recorded and re-raised.
+    """
+
+    if _use_otel:
+        from opentelemetry import trace
+        from opentelemetry.propagate import extract
+
+        context = extract({"traceparent": traceparent}) if traceparent else None
+        span_kind = {"server": trace.SpanKind.SERVER, "client": trace.SpanKind.CLIENT}.get(kind, trace.SpanKind.INTERNAL)
+        with _tracer.start_as_current_span(name, context=context, kind=span_kind, attributes=attributes) as span:
+            yield span
+        return
+
+    parent = _current_span.get()
+    trace_id, parent_id = parse_traceparent(traceparent) if traceparent else (None, None)
+    if trace_id is None:
+        trace_id, parent_id = (parent.trace_id, parent.span_id) if parent else (os.urandom(16).hex(), None)
+
+    span = Span(name, trace_id, parent_id=parent_id, kind=kind, attributes=attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+@contextmanager
+def traced_stage(stage, **attributes):
+    """Pipeline stage: a span plus an entry in the request's stage timings."""
+
+    with start_span(stage, **attributes) as span, stage_timer(stage):
+        yield span
+
+if __name__ == "__main__":
+    pass
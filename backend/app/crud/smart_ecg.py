@@ -0,0 +1,113 @@
+import base64
+import json
+import os
+import sys
+
+from datetime import datetime, timezone
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer, selectinload
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.database.smart import Session
+from app.misc.utils.inference_backend import prediction_scores
+from app.models.smart import SmartECG, SmartECGLabel
+
+
+### Naive UTC, the way times are stored ###
+def to_utc(value):
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def parse_effective_time(value):
+    try:
+        return to_utc(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
+
+### Insert or refresh the indexed row of a record (and its top labels) ###
+def upsert_ecg_result(db, record_id, file_path=None, metadata=None, result=None, measurements=None, top_labels=5):
+
+    metadata = metadata or {}
+    measurements = measurements or {}
+    effective_time = parse_effective_time(metadata.get("effectiveDateTime")) or to_utc(datetime.now(timezone.utc))
+    device = (metadata.get("device") or None) and metadata["device"][:128]
+    scores = sorted(prediction_scores(result).items(), key=lambda item: item[1], reverse=True)[:top_labels]
+
+    ecg = db.query(SmartECG).filter(SmartECG.record_id == record_id).one_or_none()
+    if ecg is None:
+        ecg = SmartECG(record_id=record_id)
+        db.add(ecg)
+
+    ecg.file_path = file_path or ecg.file_path
+    ecg.is_analyzed = result is not None
+    ecg.result = result
+    ecg.subject = (metadata.get("subject") or None) and metadata["subject"][:128]
+    ecg.effective_time = effective_time
+    ecg.device = device
+    ecg.heart_rate = measurements.get("heart_rate_bpm")
+    ecg.qtc = measurements.get("qtc_bazett_ms")
+    ecg.top_label, ecg.top_score = scores[0] if scores else (None, None)
+    ecg.labels = [
+        SmartECGLabel(label=label[:64], score=score, rank=rank, effective_time=effective_time, device=device)
+        for rank, (label, score) in enumerate(scores)
+    ]
+
+    db.commit()
+    return ecg
+
+### Index a processed upload in its own session; a concurrent insert of the same record is retried as an update ###
+def index_ecg_result(record_id, file_path=None, metadata=None, result=None, measurements=None, top_labels=5):
+
+    with Session() as db:
+        try:
+            upsert_ecg_result(db, record_id, file_path, metadata, result, measurements, top_labels)
+        except IntegrityError:
+            db.rollback()
+            upsert_ecg_result(db, record_id, file_path, metadata, result, measurements, top_labels)
+
+### Opaque keyset cursor: (effective_time, uid) of the last row of a page ###
+def encode_cursor(effective_time, uid):
+    return base64.urlsafe_b64encode(json.dumps([effective_time.isoformat(), uid]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        effective_time, uid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(effective_time), int(uid)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+### Filtered search, newest first, keyset-paginated so every page is one index range scan ###
+def search_ecg_results(db, subject=None, device=None, label=None, min_score=None, start=None, end=None, limit=50, cursor=None):
+
+    query = db.query(SmartECG).options(defer(SmartECG.result), selectinload(SmartECG.labels))
+
+    if label:  # label searches walk the label index, which carries time and device
+        query = query.join(SmartECGLabel, SmartECGLabel.uid == SmartECG.uid).filter(SmartECGLabel.label == label)
+        time_column, uid_column, device_column = SmartECGLabel.effective_time, SmartECGLabel.uid, SmartECGLabel.device
+        if min_score is not None:
+            query = query.filter(SmartECGLabel.score >= min_score)
+    else:
+        time_column, uid_column, device_column = SmartECG.effective_time, SmartECG.uid, SmartECG.device
+
+    if subject:
+        query = query.filter(SmartECG.subject == subject)
+    if device:
+        query = query.filter(device_column == device)
+    if start:
+        query = query.filter(time_column >= to_utc(start))
+    if end:
+        query = query.filter(time_column < to_utc(end))
+    if cursor:
+        cursor_time, cursor_uid = decode_cursor(cursor)
+        query = query.filter(or_(time_column < cursor_time, and_(time_column == cursor_time, uid_column < cursor_uid)))
+
+    rows = query.order_by(time_column.desc(), uid_column.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].effective_time, rows[limit - 1].uid) if len(rows) > limit else None
+
+    return rows[:limit], next_cursor
+
+if __name__ == "__main__":
+    pass
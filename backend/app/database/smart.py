@@ -1,39 +1,90 @@
-# from sqlalchemy import create_engine, URL
-# from sqlalchemy.orm import sessionmaker
-
-# from app.configs.config import dbSettings
-
-
-# SQLALCHEMY_DATABASE_URL = URL.create(
-#   f"postgresql",
-#     username=dbSettings.DB_USER,
-#     password=dbSettings.DB_PASSWORD,
-#     host=dbSettings.DB_HOSTNAME,
-#     port=dbSettings.DB_PORT,
-#     database=dbSettings.DB_NAME
-# )
-
-# Engine = create_engine(
-#     SQLALCHEMY_DATABASE_URL,
-#     # connect_args={"client_encoding": "utf8"} # Set the database encoding to UTF-8
-# )
-
-# Session = sessionmaker(
-#     autocommit=False, # Disable autocommit so that transaction commits can be managed manually
-#     autoflush=False,  # Disable auto-refresh to avoid automatically refreshing the session before executing the query
-#     bind=Engine       # Bind the session to the database engine created earlier
-# )
-
-# def get_conn():
-
-#     db = Session()
-    
-#     try:
-#         yield db
-    
-#     except Exception:
-#         db.rollback()
-#         raise
-    
-#     finally:
-#         db.close()
\ No newline at end of file
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.configs.config import basicSettings, dbSettings
+
+
+_engine = None
+_session_factory = None
+
+
+### DATABASE_URL when set, otherwise the PostgreSQL database from the DB_* settings ###
+def database_url():
+    from sqlalchemy import URL
+
+    if basicSettings.DATABASE_URL:
+        return basicSettings.DATABASE_URL
+
+    return URL.create(
+        "postgresql",
+        username=dbSettings.DB_USER,
+        password=dbSettings.DB_PASSWORD,
+        host=dbSettings.DB_HOSTNAME,
+        port=dbSettings.DB_PORT,
+        database=dbSettings.DB_NAME
+    )
+
+### Engine created on first use (sqlalchemy imported then too), so the app starts without a database, its driver or the import cost when the index is off ###
+def get_engine():
+
+    global _engine, _session_factory
+    if _engine is None:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        url = database_url()
+        if str(url).startswith("sqlite"):
+            engine = create_engine(url, connect_args={"check_same_thread": False})
+        else:
+            engine = create_engine(
+                url,
+                pool_size=basicSettings.DB_POOL_SIZE,
+                max_overflow=basicSettings.DB_MAX_OVERFLOW,
+                pool_pre_ping=True,  # drop connections the server closed while idle
+                # connect_args={"client_encoding": "utf8"} # Set the database encoding to UTF-8
+            )
+
+        _session_factory = sessionmaker(
+            autoflush=False,  # Disable auto-refresh to avoid automatically refreshing the session before executing the query
+            bind=engine       # Bind the session to the database engine created earlier
+        )
+        _engine = engine
+
+    return _engine
+
+def Session():
+    get_engine()
+    return _session_factory()
+
+def get_conn():
+
+    db = Session()
+
+    try:
+        yield db
+
+    except Exception:
+        db.rollback()
+        raise
+
+    finally:
+        db.close()
+
+### Create the tables and indexes that do not exist yet ###
+def init_db():
+    from app.models.smart import Base
+
+    Base.metadata.create_all(bind=get_engine())
+
+### Round trip to the database, for the readiness probe ###
+def ping_db():
+    from sqlalchemy import text
+
+    with get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
+    return True
+
+if __name__ == "__main__":
+    pass
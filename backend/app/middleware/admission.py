@@ -0,0 +1,124 @@
+import json
+import logging
+import math
+import os
+import sys
+
+from fastapi.concurrency import run_in_threadpool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.middleware.exception import exception_message
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+class AdmissionMiddleware():
+    """
+    Admission control for the expensive routes, decided from the request line and headers only, i.e. before
+    the (possibly large) body is read:
+      - a token bucket per authenticated user (JWT `sub`) and one per client IP -> 429 + Retry-After
+      - a concurrency limit shared by all workers using the same store          -> 503 + Retry-After
+    The limiter state lives in `store` (app.misc.utils.rate_limit), in-process or SQLite-backed.
+    """
+
+    def __init__(
+        self,
+        app,
+        store,
+        routes,
+        user_rate=0.5,
+        user_burst=10,
+        ip_rate=1.0,
+        ip_burst=20,
+        max_concurrency=None,
+        lease_seconds=300,
+        trust_forwarded=False,
+        token_subject=None,
+    ):
+        self.app = app
+        self.store = store
+        self.routes = set(routes)  # {(method, path)}
+        self.user_rate, self.user_burst = user_rate, user_burst
+        self.ip_rate, self.ip_burst = ip_rate, ip_burst
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.lease_seconds = lease_seconds
+        self.trust_forwarded = trust_forwarded
+        self.token_subject = token_subject
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"].rstrip("/")) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+
+        try:
+            rejection = await run_in_threadpool(self._check_rates, self._client_ip(scope, headers), self._subject(headers))
+            slot_id = None
+            if rejection is None:
+                slot_id = await run_in_threadpool(self.store.acquire_slot, self.max_concurrency, self.lease_seconds)
+                if slot_id is None:
+                    rejection = (503, 1.0, "Server is busy, retry later.")
+        except Exception as e:
+            # the limiter must never take the API down with it
+            system_logger.error("Admission control failed open: %s", exception_message(e))
+            await self.app(scope, receive, send)
+            return
+
+        if rejection is not None:
+            await self._reject(send, *rejection)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            try:
+                await run_in_threadpool(self.store.release_slot, slot_id)
+            except Exception as e:
+                system_logger.error("Failed to release admission slot: %s", exception_message(e))
+
+    ### Both buckets must have a token; returns (status, retry_after, detail) or None ###
+    def _check_rates(self, client_ip, subject):
+
+        if subject:
+            allowed, retry_after = self.store.take(f"user:{subject}", self.user_rate, self.user_burst)
+            if not allowed:
+                return 429, retry_after, "Too many requests for this user."
+
+        allowed, retry_after = self.store.take(f"ip:{client_ip}", self.ip_rate, self.ip_burst)
+        if not allowed:
+            return 429, retry_after, "Too many requests from this client."
+
+        return None
+
+    def _client_ip(self, scope, headers):
+        if self.trust_forwarded and headers.get("x-forwarded-for"):
+            return headers["x-forwarded-for"].split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    ### Verified JWT subject; unauthenticated requests are only limited per IP (the route itself rejects them) ###
+    def _subject(self, headers):
+        authorization = headers.get("authorization", "")
+        if not self.token_subject or not authorization.lower().startswith("bearer "):
+            return None
+        return self.token_subject(authorization[7:].strip())
+
+    async def _reject(self, send, status_code, retry_after, detail):
+        body = json.dumps({"message": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+                (b"connection", b"close"),  # the unread request body is not drained
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,181 @@
+import os
+import sys
+
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.misc.utils.compression import compressobj, decompressobj, zstd_available
+
+
+# already-compressed payloads gain nothing from a second pass
+SKIP_CONTENT_TYPES = ("image/png", "image/webp", "image/jpeg", "application/gzip", "application/zstd", "application/zip")
+
+
+### Pick the response encoding from Accept-Encoding (zstd preferred over gzip, q=0 honoured) ###
+def negotiate_encoding(accept_encoding, allow_zstd=True):
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+
+    if allow_zstd and accepted.get("zstd", 0) > 0:
+        return "zstd"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware():
+    """
+    ASGI middleware for compressed transfer in both directions.
+    Request bodies sent with Content-Encoding gzip / zstd are inflated incrementally as the app reads them;
+    responses of at least minimum_size bytes are zstd or gzip encoded according to Accept-Encoding,
+    chunk by chunk for streaming responses.
+    """
+
+    def __init__(self, app, minimum_size=1024, max_request_bytes=1 << 28):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.max_request_bytes = max_request_bytes
+        self.allow_zstd = zstd_available()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+
+        request_encoding = headers.get("content-encoding", "").strip().lower()
+        if request_encoding in ("gzip", "zstd"):
+            if request_encoding == "zstd" and not self.allow_zstd:
+                await self._reject(send, 415, b"zstd request bodies are not supported")
+                return
+            scope = dict(scope)
+            scope["headers"] = [(key, value) for key, value in scope["headers"] if key.lower() not in (b"content-encoding", b"content-length")]
+            failure = {}
+            receive = self._inflating_receive(receive, request_encoding, failure)
+            send = self._failure_send(send, failure)
+
+        response_encoding = negotiate_encoding(headers.get("accept-encoding", ""), self.allow_zstd)
+        if response_encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await self.app(scope, receive, self._compressing_send(send, response_encoding))
+
+    ### receive() wrapper inflating the body one message at a time; a corrupt body is a 400, an oversized one a 413 ###
+    def _inflating_receive(self, receive, encoding, failure):
+
+        decoder = decompressobj(encoding)
+        state = {"total": 0}
+
+        def fail(status_code, detail):
+            failure.update(status=status_code, detail=detail)
+            return HTTPException(status_code=status_code, detail=detail)
+
+        async def inflating_receive():
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            try:
+                body = decoder.decompress(message.get("body", b""))
+                if not message.get("more_body", False):
+                    if encoding == "gzip":
+                        body += decoder.flush()
+                    if not decoder.eof:
+                        raise ValueError(f"Truncated {encoding} stream")
+            except Exception as e:  # zlib.error / zstandard.ZstdError
+                raise fail(400, f"Corrupt {encoding} request body") from e
+            state["total"] += len(body)
+            if state["total"] > self.max_request_bytes:
+                raise fail(413, f"Decompressed request body exceeds {self.max_request_bytes} bytes")
+            return {**message, "body": body}
+
+        return inflating_receive
+
+    ### send() wrapper answering the inflating failure itself, whatever the app made of the exception (e.g. a 500) ###
+    def _failure_send(self, send, failure):
+
+        state = {"started": False, "rejected": False}
+
+        async def failure_send(message):
+            if not failure or state["started"]:
+                state["started"] = state["started"] or message["type"] == "http.response.start"
+                await send(message)
+            elif not state["rejected"]:
+                state["rejected"] = True
+                await self._reject(send, failure["status"], failure["detail"].encode("utf-8"))
+
+        return failure_send
+
+    ### send() wrapper deciding on compression at the first body chunk ###
+    def _compressing_send(self, send, encoding):
+
+        state = {"start": None, "encoder": None, "passthrough": False}
+
+        async def compressing_send(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+                state["passthrough"] = b"content-encoding" in response_headers or content_type in SKIP_CONTENT_TYPES
+                return
+
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                if state["start"] is not None:
+                    start, state["start"] = state["start"], None
+                    await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state["start"] is not None:
+                start, state["start"] = state["start"], None
+                if not more_body and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                state["encoder"] = compressobj(encoding)
+                headers = [(key, value) for key, value in start.get("headers", []) if key.lower() not in (b"content-length", b"content-encoding")]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                vary = [value for key, value in headers if key.lower() == b"vary"]
+                if not vary:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                elif b"accept-encoding" not in vary[0].lower():
+                    headers = [(key, value + b", Accept-Encoding" if key.lower() == b"vary" else value) for key, value in headers]
+
+                if not more_body:
+                    compressed = state["encoder"].compress(body) + state["encoder"].flush()
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start, "headers": headers})
+
+            encoder = state["encoder"]
+            chunk = encoder.compress(body)
+            if not more_body:
+                chunk += encoder.flush()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        return compressing_send
+
+    async def _reject(self, send, status_code, detail):
+        await send({"type": "http.response.start", "status": status_code, "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(detail)).encode("latin-1"))]})
+        await send({"type": "http.response.body", "body": detail})
+
+if __name__ == "__main__":
+    pass
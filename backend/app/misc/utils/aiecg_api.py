@@ -1,16 +1,26 @@
 import json
+import os
+import sys
 
-from requests import post
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.core.tracing import inject_trace_headers, start_span
 
-def ecg_ai_model(matrix_data):
-    
-    url = "http://192.192.91.111:18392"
 
-    ecg_data = {"data" : json.dumps(matrix_data.tolist())}  
+AI_URL = "http://192.192.91.111:18392"
+INFERENCE_PATH = "/api/v1/standard/inference"
 
-    response = post(url+ "/api/v1/standard/inference", json=ecg_data)
 
-    return response.json()
+### One traced inference call; the traceparent header lets the model server join the request's trace ###
+def ecg_ai_model(matrix_data):
+    from requests import post
+
+    url = AI_URL + INFERENCE_PATH
+    with start_span("POST ai.inference", kind="client", **{"http.method": "POST", "http.url": url}) as span:
+        ecg_data = {"data" : json.dumps(matrix_data.tolist())}
+        response = post(url, json=ecg_data, headers=inject_trace_headers())
+        span.set_attribute("http.status_code", response.status_code)
+        return response.json()
 
 if __name__ == "__main__":
 
@@ -0,0 +1,312 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+from datetime import datetime, timezone
+from fastapi.concurrency import run_in_threadpool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.middleware.exception import exception_message
+from app.misc.utils.compression import compressobj, decompressobj, READ_CHUNK_SIZE
+from app.misc.utils.fast_json import dumps, loads
+from app.misc.utils.lead_normalize import CANONICAL_LEADS
+from app.misc.utils.record_store import iter_records, load_matrix, load_meta
+
+
+system_logger = logging.getLogger('custom.error')
+
+EXPORT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'export'))
+
+EXPORT_TYPES = ("Observation", "ECGRecord")
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+FILE_NAME_PATTERN = re.compile(r"^[A-Za-z]+-\d+\.ndjson\.gz$")
+
+PROGRESS_INTERVAL = 2.0  # s between job.json updates of a running export
+STALE_SECONDS = 300      # a running job silent for this long died with its worker
+
+
+### UTC ISO time of a timestamp, the way FHIR instants are written ###
+def fhir_instant(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+### `_since` as a timestamp; times without an offset are UTC ###
+def since_timestamp(since):
+    if since is None:
+        return None
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since.timestamp()
+
+### One ECGRecord line: the normalized matrix (base64 float32 little-endian, samples x leads), measurements and AI result ###
+def ecg_record_line(record_id, meta, ecg_matrix, modified):
+    metadata = meta.get("metadata") or {}
+    return {
+        "resourceType": "ECGRecord",
+        "id": record_id,
+        "meta": {"lastUpdated": fhir_instant(modified)},
+        "observation": {"reference": f"Observation/{metadata['id']}"} if metadata.get("id") else None,
+        "subject": metadata.get("subject"),
+        "effectiveDateTime": metadata.get("effectiveDateTime"),
+        "sampleRate": meta.get("sample_rate", 500),
+        "leads": CANONICAL_LEADS[:ecg_matrix.shape[1]],
+        "shape": list(ecg_matrix.shape),
+        "dtype": "<f4",
+        "data": base64.b64encode(ecg_matrix.astype("<f4", copy=False).tobytes()).decode("ascii"),
+        "measurements": meta.get("measurements"),
+        "result": meta.get("result"),
+    }
+
+def operation_outcome(record_id, message):
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": "processing", "diagnostics": f"{record_id}: {message}"}],
+    }
+
+
+class NdjsonChunks():
+    """gzip NDJSON files of one resource type (`<type>-<n>.ndjson.gz`), a new file every `max_lines` lines."""
+
+    def __init__(self, directory, resource_type, max_lines=1000):
+        self.directory = directory
+        self.resource_type = resource_type
+        self.max_lines = max_lines
+        self.outputs = []
+        self._file = None
+        self._compressor = None
+
+    def write(self, resource):
+        if self._file is None or self.outputs[-1]["count"] >= self.max_lines:
+            self._roll()
+        line = dumps(resource) + b"\n"
+        self._file.write(self._compressor.compress(line))
+        self.outputs[-1]["count"] += 1
+
+    def _roll(self):
+        self.close()
+        file_name = f"{self.resource_type}-{len(self.outputs) + 1}.ndjson.gz"
+        self._file = open(os.path.join(self.directory, file_name), "wb")
+        self._compressor = compressobj("gzip")
+        self.outputs.append({"type": self.resource_type, "file": file_name, "count": 0})
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self._compressor.flush())
+            self._file.close()
+            self._file = None
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class BulkExport():
+    """
+    FHIR Bulk Data style `$export` jobs over the record store.
+      - kick-off: `start` scans the records changed since `_since` in a worker thread, one record in memory at a time,
+                  writing source Observations and ECGRecords (matrix, measurements, AI result) to gzip NDJSON chunks
+      - status:   every job lives in `<directory>/<job id>/job.json`, so any worker can answer status and downloads
+      - deltas:   the manifest's transactionTime (taken before the scan) is the `_since` of the next export
+    A job whose worker dies is reported as failed; finished jobs are deleted after `retention_seconds`.
+    """
+
+    def __init__(self, directory=EXPORT_DIR, chunk_records=1000, max_jobs=2, retention_seconds=86400, blob_store=None):
+        self.directory = directory
+        self.chunk_records = chunk_records
+        self.max_jobs = max_jobs
+        self.retention_seconds = retention_seconds
+        self._blob_store = blob_store
+        self._tasks = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def blob_store(self):
+        if self._blob_store is None:
+            from app.misc.utils.storage import get_blob_store
+            self._blob_store = get_blob_store()
+        return self._blob_store
+
+    def _job_path(self, job_id):
+        return os.path.join(self.directory, job_id, "job.json")
+
+    def _write_job(self, job):
+        job["updated"] = time.time()
+        path = self._job_path(job["id"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    ### Kick-off: returns the job id, or None when this worker already runs max_jobs exports ###
+    async def start(self, request_url, since=None, types=EXPORT_TYPES, owner=None):
+
+        if len(self._tasks) >= self.max_jobs:
+            return None
+        await run_in_threadpool(self.sweep)
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.directory, job_id))
+        job = {
+            "id": job_id,
+            "state": "running",
+            "owner": owner,
+            "request": request_url,
+            "since": since_timestamp(since),
+            "types": list(types),
+            "transactionTime": fhir_instant(time.time()),
+            "processed": 0,
+            "output": [],
+            "error": [],
+            "message": None,
+        }
+        await run_in_threadpool(self._write_job, job)
+
+        task = asyncio.create_task(run_in_threadpool(self._run, job))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job_id
+
+    ### Export loop (worker thread) ###
+    def _run(self, job):
+
+        job_dir = os.path.join(self.directory, job["id"])
+        writers = {resource_type: NdjsonChunks(job_dir, resource_type, self.chunk_records) for resource_type in job["types"]}
+        errors = NdjsonChunks(job_dir, "OperationOutcome", self.chunk_records)
+        last_progress = time.monotonic()
+
+        try:
+            for record_id, modified in iter_records(job["since"]):
+                try:
+                    self._export_record(record_id, modified, writers, errors)
+                except Exception as e:
+                    errors.write(operation_outcome(record_id, exception_message(e)))
+                job["processed"] += 1
+
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    if not os.path.exists(self._job_path(job["id"])):  # deleted by a cancel request
+                        raise ExportCancelled()
+                    self._write_job(job)
+                    last_progress = time.monotonic()
+
+            for writer in (*writers.values(), errors):
+                writer.close()
+            job["output"] = [output for writer in writers.values() for output in writer.outputs]
+            job["error"] = errors.outputs
+            job["state"] = "complete"
+            self._write_job(job)
+
+        except ExportCancelled:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+        except Exception as e:
+            system_logger.error("Export %s failed: %s", job["id"], exception_message(e))
+            job["state"], job["message"] = "error", exception_message(e)
+            try:
+                self._write_job(job)
+            except OSError:
+                pass
+
+        finally:
+            for writer in (*writers.values(), errors):
+                writer.close()
+
+    def _export_record(self, record_id, modified, writers, errors):
+
+        meta = load_meta(record_id)
+        if meta is None:  # removed since the scan
+            return
+
+        if "Observation" in writers:
+            data = self.blob_store.get(meta["source_key"]) if meta.get("source_key") else None
+            if data is not None:
+                writers["Observation"].write(loads(data))
+            elif meta.get("source_key"):  # removed by storage retention; the ECGRecord is still exported
+                errors.write(operation_outcome(record_id, "source blob evicted"))
+
+        if "ECGRecord" in writers:
+            ecg_matrix = load_matrix(record_id)
+            if ecg_matrix is None:
+                raise ValueError("matrix file missing")
+            writers["ECGRecord"].write(ecg_record_line(record_id, meta, ecg_matrix, modified))
+
+    ### Job of `job_id`, None when unknown; a running job nobody has updated for STALE_SECONDS is reported failed ###
+    def status(self, job_id):
+
+        try:
+            with open(self._job_path(job_id), "r", encoding="utf-8") as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if job["state"] == "running" and job_id not in self._tasks and time.time() - job["updated"] > STALE_SECONDS:
+            job["state"], job["message"] = "error", "Export interrupted, start a new one."
+        return job
+
+    ### Delete a job and its files; a running export notices at its next progress update ###
+    def delete(self, job_id):
+        if not os.path.exists(self._job_path(job_id)):
+            return False
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+        return True
+
+    def file_path(self, job_id, file_name):
+        return os.path.join(self.directory, job_id, file_name)
+
+    ### Retention: remove finished (or dead) jobs older than retention_seconds ###
+    def sweep(self):
+
+        cutoff = time.time() - self.retention_seconds
+        for job_id in os.listdir(self.directory):
+            if job_id in self._tasks:
+                continue
+            job = self.status(job_id)
+            updated = job["updated"] if job else os.path.getmtime(os.path.join(self.directory, job_id))
+            if updated < cutoff and (job is None or job["state"] != "running"):
+                shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+
+### Completion manifest of the Bulk Data spec; file_url(job_id, file_name) gives the download URL ###
+def export_manifest(job, file_url):
+    return {
+        "transactionTime": job["transactionTime"],
+        "request": job["request"],
+        "requiresAccessToken": True,
+        "output": [{"type": output["type"], "url": file_url(job["id"], output["file"]), "count": output["count"]} for output in job["output"]],
+        "error": [{"type": output["type"], "url": file_url(job["id"], output["file"]), "count": output["count"]} for output in job["error"]],
+    }
+
+### Plain NDJSON of a stored chunk, for clients that do not accept gzip ###
+def iter_ndjson(path):
+    decompressor = decompressobj("gzip")
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_SIZE):
+            yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+
+
+_bulk_export = None
+
+### Export jobs configured from settings, one per worker ###
+def get_bulk_export():
+
+    global _bulk_export
+    if _bulk_export is None:
+        from app.configs.config import basicSettings
+
+        _bulk_export = BulkExport(
+            chunk_records=basicSettings.EXPORT_CHUNK_RECORDS,
+            max_jobs=basicSettings.EXPORT_MAX_JOBS,
+            retention_seconds=basicSettings.EXPORT_RETENTION_HOURS * 3600,
+        )
+    return _bulk_export
+
+if __name__ == "__main__":
+    pass
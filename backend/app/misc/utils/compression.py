@@ -0,0 +1,111 @@
+import gzip
+import importlib.util
+import os
+import sys
+import zlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPRESSED_CONTENT_TYPES = {"application/gzip": "gzip", "application/x-gzip": "gzip", "application/zstd": "zstd"}
+
+READ_CHUNK_SIZE = 1 << 16
+
+
+def zstd_available():
+    return importlib.util.find_spec("zstandard") is not None
+
+### Identify the encoding of a payload from its first bytes ###
+def detect_encoding(head):
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return "identity"
+
+### One-shot helpers ###
+def compress(data, method, level=None):
+    if method == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=level or 3).compress(data)
+    if method == "gzip":
+        return gzip.compress(data, compresslevel=level or 6)
+    return data
+
+def decompress(data, method):
+    if method == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 31)
+    if method == "gzip":
+        return gzip.decompress(data)
+    return data
+
+### Incremental (de)compressors for streaming bodies ###
+def compressobj(method):
+    if method == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if method == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    raise ValueError(f"Unsupported encoding: {method}")
+
+def decompressobj(method):
+    if method == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj()
+    if method == "gzip":
+        return zlib.decompressobj(47)  # wbits=47: auto-detect gzip / zlib header
+    raise ValueError(f"Unsupported encoding: {method}")
+
+### Stream-decompress a file object chunk by chunk, refusing to inflate past max_bytes ###
+def read_decompressed(fileobj, method, max_bytes):
+
+    if method == "identity":
+        data = fileobj.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            raise ValueError(f"Payload exceeds {max_bytes} bytes")
+        return data
+
+    decoder = decompressobj(method)
+    chunks, total = [], 0
+    while True:
+        chunk = fileobj.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        try:
+            out = decoder.decompress(chunk)
+        except Exception as e:  # zlib.error / zstandard.ZstdError
+            raise ValueError(f"Corrupt {method} stream: {e}") from e
+        total += len(out)
+        if total > max_bytes:  # protects against decompression bombs
+            raise ValueError(f"Decompressed payload exceeds {max_bytes} bytes")
+        chunks.append(out)
+
+    if method == "gzip":
+        chunks.append(decoder.flush())
+        if not decoder.eof:
+            raise ValueError("Truncated gzip stream")
+    return b"".join(chunks)
+
+### Decode an uploaded body: magic bytes win over the declared Content-Encoding ###
+def read_upload_body(fileobj, content_encoding=None, max_bytes=1 << 28):
+    """
+    Returns (decompressed_bytes, encoding). The file object is read from its current position
+    and never held compressed and decompressed in full at the same time.
+    """
+
+    head = fileobj.read(4)
+    fileobj.seek(-len(head), 1)
+    method = detect_encoding(head)
+    if method == "identity" and content_encoding in ("gzip", "zstd"):
+        raise ValueError(f"Body is declared {content_encoding} but is not {content_encoding}-compressed")
+    if method == "zstd" and not zstd_available():
+        raise ValueError("zstd-compressed uploads are not supported by this server")
+
+    return read_decompressed(fileobj, method, max_bytes), method
+
+if __name__ == "__main__":
+    pass
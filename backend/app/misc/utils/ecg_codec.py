@@ -0,0 +1,173 @@
+import numpy as np
+import os
+import struct
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+
+MAGIC = b"ECGC"
+VERSION = 1
+BLOCK_SIZE = 256     # residuals sharing one Rice parameter
+MAX_RICE_K = 24
+ZERO_BLOCK = 255     # Rice parameter marking a block of zero residuals (silent / missing leads), stored without bits
+MAX_REFINE = 4       # a lead off the source grid is tried at resolution / 2 ... / 2**MAX_REFINE (derived limb leads sit on half steps)
+GRID_TOLERANCE = 1e-6  # fraction of a step: float rounding of count * factor (and lead sums), not a quantization error
+
+HEADER = struct.Struct("<4sBIHII")   # magic, version, samples, leads, unary / remainder stream bytes
+LEAD_HEADER = struct.Struct("<dBqq")  # resolution, prediction order, first two samples
+
+
+### Samples as integer multiples of `resolution` ###
+def quantize(ecg_matrix, resolution):
+    return np.rint(np.asarray(ecg_matrix, dtype=np.float64) / resolution).astype(np.int64)
+
+def dequantize(counts, resolution):
+    return counts.astype(np.float64) * resolution
+
+### Whether samples sit on the grid of `resolution` up to float rounding, i.e. encoding them loses nothing ###
+def is_on_grid(values, resolution):
+    values = np.asarray(values, dtype=np.float64)
+    return np.allclose(dequantize(quantize(values, resolution), resolution), values, rtol=0, atol=resolution * GRID_TOLERANCE)
+
+### Coarsest step (resolution / 2**n, n <= MAX_REFINE) that keeps a lead exact; the source step when none does ###
+def lead_resolution(values, resolution):
+    for refine in range(MAX_REFINE + 1):
+        if is_on_grid(values, resolution / 2 ** refine):
+            return resolution / 2 ** refine
+    return resolution
+
+### Whether encode_matrix gives every lead back exactly (False e.g. for matrices resampled off the source grid) ###
+def is_lossless(ecg_matrix, resolution):
+    ecg_matrix = np.asarray(ecg_matrix, dtype=np.float64)
+    return all(is_on_grid(ecg_matrix[:, lead], lead_resolution(ecg_matrix[:, lead], resolution)) for lead in range(ecg_matrix.shape[1]))
+
+def _zigzag(values):
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+def _unzigzag(values):
+    values = values.astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+### Block layout of the concatenated residuals: every lead starts a new block ###
+def _blocks(lengths):
+    block_lengths = np.concatenate([np.diff(np.append(np.arange(0, length, BLOCK_SIZE), length)) for length in lengths if length] or [np.zeros(0, dtype=np.int64)])
+    return block_lengths.astype(np.int64)
+
+### Rice parameter per block: the cheapest k around log2 of the block mean; ZERO_BLOCK for blocks of zeros (no bits) ###
+def _rice_parameters(values, block_lengths):
+    if values.size == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    block_starts = np.cumsum(block_lengths) - block_lengths
+    means = np.add.reduceat(values.astype(np.float64), block_starts) / block_lengths
+    estimate = np.floor(np.log2(np.maximum(means, 1.0))).astype(np.int64)
+
+    candidates = np.clip(estimate[:, None] + np.arange(-1, 2)[None, :], 0, MAX_RICE_K)  # (blocks, 3)
+    costs = np.stack([
+        np.add.reduceat(values >> np.repeat(candidates[:, i], block_lengths).astype(np.uint64), block_starts) + candidates[:, i].astype(np.uint64) * block_lengths.astype(np.uint64)
+        for i in range(candidates.shape[1])
+    ], axis=1)
+    ks = candidates[np.arange(len(candidates)), costs.argmin(axis=1)].astype(np.uint8)
+
+    ks[np.maximum.reduceat(values, block_starts) == 0] = ZERO_BLOCK
+    return ks
+
+### Rice code split into two streams: unary quotients (each ended by a 1 bit) and k-bit remainders ###
+def _rice_encode(values, k):
+
+    quotients = (values >> k).astype(np.int64)
+
+    # unary: quotient zeros then a one, so the ones alone give every quotient back
+    unary = np.zeros(int(quotients.sum()) + values.size, dtype=np.uint8)
+    unary[np.cumsum(quotients + 1) - 1] = 1
+
+    widths = k.astype(np.int64)
+    starts = np.cumsum(widths) - widths
+    remainder = np.zeros(int(widths.sum()), dtype=np.uint8)
+    for bit in range(int(widths.max(initial=0))):  # one vectorized pass per bit position, MSB first
+        active = widths > bit
+        remainder[starts[active] + bit] = (values[active] >> (k[active] - np.uint64(bit + 1))) & np.uint64(1)
+
+    return np.packbits(unary).tobytes(), np.packbits(remainder).tobytes()
+
+def _rice_decode(unary_bytes, remainder_bytes, k):
+
+    count = k.size
+    ones = np.flatnonzero(np.unpackbits(np.frombuffer(unary_bytes, dtype=np.uint8)))[:count]
+    quotients = np.diff(ones, prepend=-1) - 1
+
+    widths = k.astype(np.int64)
+    starts = np.cumsum(widths) - widths
+    bits = np.unpackbits(np.frombuffer(remainder_bytes, dtype=np.uint8))
+    remainders = np.zeros(count, dtype=np.uint64)
+    for bit in range(int(widths.max(initial=0))):
+        active = widths > bit
+        remainders[active] = (remainders[active] << np.uint64(1)) | bits[starts[active] + bit]
+
+    return (quotients.astype(np.uint64) << k) | remainders
+
+### Matrix (samples, leads) -> bytes; exact for leads on the (refined) `resolution` grid, else within half a step ###
+def encode_matrix(ecg_matrix, resolution):
+    """
+    Per lead: quantize to the source resolution, keep the better of the order-1 / order-2 delta predictors
+    (smallest residual sum) and zigzag the residuals; all residuals are then Rice-coded in one pass with a
+    parameter per BLOCK_SIZE residuals. Source resolution: FHIR `factor` for integer SampledData, one count for GE
+    (its matrices are in LeadAmplitudeUnitsPerBit counts). Leads off the grid are requantized; check is_lossless first.
+    """
+
+    ecg_matrix = np.asarray(ecg_matrix, dtype=np.float64)
+    n_samples, n_leads = ecg_matrix.shape
+    resolutions = [lead_resolution(ecg_matrix[:, lead], resolution) for lead in range(n_leads)]
+    counts = np.rint(ecg_matrix / np.asarray(resolutions)).astype(np.int64)
+
+    first_order, second_order = np.diff(counts, n=1, axis=0), np.diff(counts, n=2, axis=0)
+    orders = np.where(np.abs(second_order).sum(axis=0) < np.abs(first_order[1:]).sum(axis=0), 2, 1) if n_samples > 2 else np.ones(n_leads, dtype=np.int64)
+    residuals = [(second_order if orders[lead] == 2 else first_order)[:, lead] for lead in range(n_leads)]
+
+    values = _zigzag(np.concatenate(residuals)) if n_leads else np.zeros(0, dtype=np.uint64)
+    block_lengths = _blocks([residual.size for residual in residuals])
+    ks = _rice_parameters(values, block_lengths)
+    k = np.repeat(ks, block_lengths)
+    coded = k != ZERO_BLOCK
+    unary, remainder = _rice_encode(values[coded], k[coded].astype(np.uint64))
+
+    first = np.zeros((2, n_leads), dtype=np.int64)
+    first[:min(2, n_samples)] = counts[:2]
+    lead_headers = [LEAD_HEADER.pack(resolutions[lead], int(orders[lead]), int(first[0, lead]), int(first[1, lead])) for lead in range(n_leads)]
+
+    return b"".join([HEADER.pack(MAGIC, VERSION, n_samples, n_leads, len(unary), len(remainder)), *lead_headers, ks.tobytes(), unary, remainder])
+
+### bytes -> matrix (samples, leads) float64 ###
+def decode_matrix(data):
+
+    magic, version, n_samples, n_leads, unary_size, remainder_size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an ECG codec payload")
+
+    offset = HEADER.size
+    leads = [LEAD_HEADER.unpack_from(data, offset + lead * LEAD_HEADER.size) for lead in range(n_leads)]
+    offset += n_leads * LEAD_HEADER.size
+
+    lengths = [max(0, n_samples - order) for _, order, _, _ in leads]
+    block_lengths = _blocks(lengths)
+    ks = np.frombuffer(data, dtype=np.uint8, count=block_lengths.size, offset=offset)
+    offset += block_lengths.size
+    k = np.repeat(ks, block_lengths)
+    coded = k != ZERO_BLOCK
+    values = np.zeros(k.size, dtype=np.int64)
+    values[coded] = _unzigzag(_rice_decode(data[offset:offset + unary_size], data[offset + unary_size:offset + unary_size + remainder_size], k[coded].astype(np.uint64)))
+
+    # undo the prediction: running sums seeded with the stored first samples
+    ecg_matrix = np.empty((n_samples, n_leads), dtype=np.float64)
+    ends = np.cumsum(lengths)
+    for lead, (resolution, order, first, second) in enumerate(leads):
+        residuals = values[ends[lead] - lengths[lead]:ends[lead]]
+        if order == 2:
+            residuals = np.cumsum(np.concatenate(([second - first], residuals)))
+        ecg_matrix[:, lead] = dequantize(np.cumsum(np.concatenate(([first], residuals)))[:n_samples], resolution)
+
+    return ecg_matrix
+
+if __name__ == "__main__":
+    pass
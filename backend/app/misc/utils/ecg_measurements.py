@@ -0,0 +1,237 @@
+import logging
+import numpy as np
+import os
+import sys
+
+from functools import lru_cache
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.misc.utils.lead_normalize import LEAD_INDEX
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+QRS_BAND_HZ = (5.0, 15.0)    # most of the QRS energy, little of the P / T waves and baseline
+INTEGRATION_SECONDS = 0.15   # moving-window integration, about one QRS wide
+REFRACTORY_SECONDS = 0.25    # no two beats closer than this (240 bpm)
+PEAK_THRESHOLD = 0.3         # share of the (99th percentile) integrated energy a beat must reach
+
+BEAT_BEFORE_SECONDS = 0.4    # median beat window around each R peak
+BEAT_AFTER_SECONDS = 0.6
+QRS_VELOCITY_FRACTION = 0.05 # QRS limits: spatial velocity back under this share of its peak
+P_MIN_FRACTION = 0.05        # P wave RMS (above its window floor) relative to the QRS RMS to count as present
+
+MEASUREMENT_FIELDS = [
+    "heart_rate_bpm", "rr_ms", "pr_ms", "qrs_ms", "qt_ms", "qtc_bazett_ms", "qtc_fridericia_ms",
+    "p_axis_deg", "qrs_axis_deg", "t_axis_deg",
+]
+
+
+### Band-pass for QRS detection, designed once per sample rate ###
+@lru_cache(maxsize=8)
+def _qrs_filter(sample_rate):
+    from scipy import signal
+
+    return signal.butter(2, QRS_BAND_HZ, btype="bandpass", fs=sample_rate, output="sos")
+
+### R peaks (sample indices) from all leads at once: band-pass -> slope energy summed over leads -> integration ###
+def detect_r_peaks(ecg_matrix, sample_rate=500):
+
+    from scipy import signal
+
+    raw = np.nan_to_num(np.asarray(ecg_matrix, dtype=np.float64))
+    if raw.shape[0] < sample_rate:
+        return np.array([], dtype=np.int64)
+
+    band = signal.sosfiltfilt(_qrs_filter(sample_rate), raw, axis=0)
+    energy = (np.diff(band, axis=0, prepend=band[:1]) ** 2).sum(axis=1)
+    width = max(1, int(INTEGRATION_SECONDS * sample_rate))
+    integrated = np.convolve(energy, np.ones(width) / width, mode="same")
+
+    threshold = PEAK_THRESHOLD * np.percentile(integrated, 99)
+    if threshold <= 0:
+        return np.array([], dtype=np.int64)
+    candidates, _ = signal.find_peaks(integrated, height=threshold, distance=int(REFRACTORY_SECONDS * sample_rate))
+    if candidates.size == 0:
+        return candidates.astype(np.int64)
+
+    # the R peak is the largest deflection across leads near each energy peak
+    envelope = np.abs(band).sum(axis=1)
+    index = np.clip(candidates[:, None] + np.arange(-(width // 2), width // 2 + 1)[None, :], 0, raw.shape[0] - 1)
+    r_peaks = np.unique(index[np.arange(len(index)), envelope[index].argmax(axis=1)])
+
+    keep = np.concatenate(([True], np.diff(r_peaks) >= REFRACTORY_SECONDS * sample_rate))
+    return r_peaks[keep].astype(np.int64)
+
+### Beat windows [r - before, r + after) of every complete beat, (beats, leads, window); R peaks too close to an edge are dropped ###
+def beat_windows(ecg_matrix, r_peaks, before, after):
+
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    ecg_matrix = np.asarray(ecg_matrix, dtype=np.float64)
+    r_peaks = np.asarray(r_peaks, dtype=np.int64)
+    r_peaks = r_peaks[(r_peaks >= before) & (r_peaks + after <= ecg_matrix.shape[0])]
+
+    # every window start is a zero-copy view of the matrix; only the selected beats are gathered
+    windows = sliding_window_view(ecg_matrix, before + after, axis=0)  # (samples - window + 1, leads, window)
+    return windows[r_peaks - before], r_peaks
+
+### Index of the R peak in a median beat ###
+def beat_r_index(sample_rate=500):
+    return int(BEAT_BEFORE_SECONDS * sample_rate)
+
+### Median beat over every complete beat window, (window samples, leads); R sits at index `before` ###
+def median_beat(ecg_matrix, r_peaks, sample_rate=500):
+
+    before = beat_r_index(sample_rate)
+    after = int(BEAT_AFTER_SECONDS * sample_rate)
+    if np.asarray(ecg_matrix).shape[0] < before + after:
+        return None, before
+
+    beats, _ = beat_windows(ecg_matrix, r_peaks, before, after)
+    if beats.shape[0] == 0:
+        return None, before
+
+    # a sort over the (few) beats is several times faster than np.median's partition for a 10 s strip
+    ordered = np.sort(beats, axis=0)
+    middle = ordered.shape[0] // 2
+    template = ordered[middle] if ordered.shape[0] % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+    return template.T, before
+
+### Frontal-plane axis (degrees) from the net area of leads I and aVF over [start, stop) ###
+def _frontal_axis(template, start, stop):
+    if start is None or stop is None or stop <= start:
+        return None
+    lead_i = template[start:stop, LEAD_INDEX['I']].sum()
+    lead_avf = template[start:stop, LEAD_INDEX['aVF']].sum()
+    if lead_i == 0 and lead_avf == 0:
+        return None
+    # aVF sees the frontal vector scaled by sqrt(3) / 2 relative to lead I
+    return float(np.degrees(np.arctan2(lead_avf * 2 / np.sqrt(3), lead_i)))
+
+### Fiducial points (sample indices in the template) from the spatial velocity and RMS curves of the median beat ###
+def beat_fiducials(template, r_index, sample_rate=500, rr_seconds=None):
+
+    from numpy.lib.stride_tricks import sliding_window_view
+    from scipy.ndimage import uniform_filter1d
+
+    samples = lambda seconds: max(1, int(round(seconds * sample_rate)))
+    n = template.shape[0]
+
+    smoothed = uniform_filter1d(template, samples(0.016), axis=0)
+    slope = np.zeros_like(smoothed)
+    slope[2:-2] = smoothed[4:] - smoothed[:-4]
+    velocity = np.sqrt((slope ** 2).sum(axis=1))
+
+    # QRS: the spatial velocity stays under 5 % of its peak (above the beat's floor) for 10 ms on either side;
+    # the sustained-quiet rule keeps the velocity dips at the Q and S extrema inside the complex
+    floor = np.median(velocity)
+    threshold = floor + QRS_VELOCITY_FRACTION * (velocity.max() - floor)
+    quiet_width = samples(0.01)
+    quiet = np.zeros(n, dtype=bool)
+    quiet[quiet_width - 1:] = sliding_window_view(velocity, quiet_width).max(axis=1) < threshold  # quiet[i]: v[i-w+1..i]
+
+    qrs_start = max(0, r_index - samples(0.15))
+    qrs_stop = min(n, r_index + samples(0.2))
+    before = np.flatnonzero(quiet[qrs_start:r_index])
+    qrs_on = qrs_start + int(before[-1]) + 1 if before.size else qrs_start
+    after = np.flatnonzero(quiet[r_index + quiet_width - 1:qrs_stop])
+    qrs_off = r_index + int(after[0]) if after.size else qrs_stop - 1
+
+    # amplitudes relative to the PR segment just before the QRS
+    isoelectric = smoothed[max(0, qrs_on - samples(0.02)):max(1, qrs_on)].mean(axis=0)
+    centered = smoothed - isoelectric
+    rms = np.sqrt((centered ** 2).mean(axis=1))
+    qrs_amplitude = rms[qrs_on:qrs_off + 1].max()
+
+    # T: RMS peak after the ST segment, end where the tangent of its steepest descent meets the baseline
+    t_stop = n if rr_seconds is None else min(n, r_index + samples(0.7 * rr_seconds))
+    t_start = qrs_off + samples(0.08)
+    t_end = None
+    if t_stop - t_start > samples(0.06):
+        t_peak = t_start + int(rms[t_start:t_stop].argmax())
+        descent = np.diff(rms[t_peak:t_stop])
+        if descent.size and descent.min() < 0:
+            steepest = t_peak + int(descent.argmin())
+            baseline = rms[t_peak:t_stop].min()
+            t_end = int(round(steepest + (baseline - rms[steepest]) / descent.min()))
+            t_end = min(max(t_end, t_peak), t_stop - 1)
+
+    # P: RMS peak before the QRS, present only if it stands out of its window (median beats cancel AF f-waves)
+    p_on = None
+    p_start = max(0, qrs_on - samples(0.3))
+    if rr_seconds is not None:  # at high rates the previous T wave reaches into the window
+        p_start = max(p_start, r_index - samples(0.5 * rr_seconds))
+    p_stop = qrs_on - samples(0.03)
+    if p_stop - p_start > samples(0.04):
+        window = rms[p_start:p_stop]
+        p_peak = int(window.argmax())
+        p_amplitude = window[p_peak] - window.min()
+        if p_amplitude >= P_MIN_FRACTION * qrs_amplitude:
+            rising = np.flatnonzero(window[:p_peak] < window.min() + 0.1 * p_amplitude)
+            p_on = p_start + (int(rising[-1]) + 1 if rising.size else 0)
+
+    return {"p_on": p_on, "qrs_on": qrs_on, "qrs_off": qrs_off, "t_end": t_end}, centered
+
+### Heart rate, PR / QRS / QT(c) and frontal axes from the (time, 12) matrix; vendor values take precedence ###
+def measure_ecg(ecg_matrix, sample_rate=500, vendor=None, with_template=False):
+    """
+    vendor: optional {field: value} with any of MEASUREMENT_FIELDS read from the device (Philips repbeat
+    fiducials, GE RestingECGMeasurements). Those replace the computed values; QTc follows the final QT and RR
+    unless the device reported it too.
+    with_template: also return the median beat, (measurements, template) with template None when no complete
+    beat was found.
+    """
+
+    ms = lambda n_samples: n_samples * 1000.0 / sample_rate
+    measurements = dict.fromkeys(MEASUREMENT_FIELDS)
+
+    ecg_matrix = np.nan_to_num(np.asarray(ecg_matrix, dtype=np.float64))
+    r_peaks = detect_r_peaks(ecg_matrix, sample_rate)
+    measurements["beats"] = int(r_peaks.size)
+    measurements["r_peaks"] = r_peaks.tolist()
+
+    rr_seconds = None
+    if r_peaks.size >= 2:
+        rr_seconds = float(np.median(np.diff(r_peaks))) / sample_rate
+        measurements["rr_ms"] = rr_seconds * 1000
+        measurements["heart_rate_bpm"] = 60.0 / rr_seconds
+
+    template, r_index = median_beat(ecg_matrix, r_peaks, sample_rate)
+    if template is not None:
+        fiducials, centered = beat_fiducials(template, r_index, sample_rate, rr_seconds)
+        p_on, qrs_on, qrs_off, t_end = fiducials["p_on"], fiducials["qrs_on"], fiducials["qrs_off"], fiducials["t_end"]
+        measurements["qrs_ms"] = ms(qrs_off - qrs_on)
+        measurements["pr_ms"] = ms(qrs_on - p_on) if p_on is not None else None
+        measurements["qt_ms"] = ms(t_end - qrs_on) if t_end is not None else None
+        measurements["p_axis_deg"] = _frontal_axis(centered, p_on, qrs_on) if p_on is not None else None
+        measurements["qrs_axis_deg"] = _frontal_axis(centered, qrs_on, qrs_off)
+        measurements["t_axis_deg"] = _frontal_axis(centered, qrs_off, t_end)
+
+    vendor_fields = [field for field in MEASUREMENT_FIELDS if vendor and vendor.get(field) is not None]
+    for field in vendor_fields:
+        measurements[field] = float(vendor[field])
+    if "heart_rate_bpm" in vendor_fields and "rr_ms" not in vendor_fields:
+        measurements["rr_ms"] = 60000.0 / measurements["heart_rate_bpm"] if measurements["heart_rate_bpm"] else None
+
+    qt, rr = measurements["qt_ms"], measurements["rr_ms"]
+    if qt is not None and rr:
+        if "qtc_bazett_ms" not in vendor_fields:
+            measurements["qtc_bazett_ms"] = qt / np.sqrt(rr / 1000)
+        if "qtc_fridericia_ms" not in vendor_fields:
+            measurements["qtc_fridericia_ms"] = qt / np.cbrt(rr / 1000)
+
+    for field in MEASUREMENT_FIELDS:
+        if measurements[field] is not None:
+            measurements[field] = round(float(measurements[field]), 1)
+    measurements["vendor_fields"] = vendor_fields
+    measurements["sample_rate"] = sample_rate
+
+    if with_template:
+        return measurements, template
+    return measurements
+
+if __name__ == "__main__":
+    pass
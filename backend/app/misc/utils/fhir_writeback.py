@@ -0,0 +1,294 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+
+from collections import deque
+from datetime import datetime, timezone
+from fastapi.concurrency import run_in_threadpool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.core.tracing import inject_trace_headers, start_span
+from app.middleware.exception import exception_message
+from app.misc.utils.inference_backend import prediction_scores
+
+
+system_logger = logging.getLogger('custom.error')
+
+IDENTIFIER_SYSTEM = "urn:smart-ecg:record"
+LABEL_CODE_SYSTEM = "urn:smart-ecg:ai-label"
+ECG_REPORT_CODE = {"system": "http://loinc.org", "code": "11524-6", "display": "EKG study"}
+ECG_CATEGORY = {"system": "http://terminology.hl7.org/CodeSystem/v2-0074", "code": "EC", "display": "Electrocardiac"}
+
+
+### Transaction entries of one analyzed record: an Observation per predicted label and the DiagnosticReport over them ###
+def report_entries(record_id, metadata, result, identifier_system=IDENTIFIER_SYSTEM):
+    """
+    Every resource is a conditional create on its identifier (`ifNoneExist`), so replaying a batch is a no-op.
+    Observations point at the source ECG Observation with `derivedFrom`; the report references them by urn:uuid.
+    """
+
+    scores = sorted(prediction_scores(result).items(), key=lambda item: item[1], reverse=True)
+    if not scores:
+        return []
+
+    metadata = metadata or {}
+    common = {"status": "final"}
+    if metadata.get("subject"):
+        common["subject"] = {"reference": metadata["subject"]}
+    if metadata.get("effectiveDateTime"):
+        common["effectiveDateTime"] = metadata["effectiveDateTime"]
+    source = [{"reference": f"Observation/{metadata['id']}"}] if metadata.get("id") else None
+
+    def entry(resource_type, identifier, resource):
+        resource = {"resourceType": resource_type, "identifier": [{"system": identifier_system, "value": identifier}], **common, **resource}
+        return {
+            "fullUrl": f"urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, f'{identifier_system}|{identifier}')}",
+            "resource": resource,
+            "request": {"method": "POST", "url": resource_type, "ifNoneExist": f"identifier={identifier_system}|{identifier}"},
+        }
+
+    observations = []
+    for label, score in scores:
+        observation = {
+            "category": [{"coding": [ECG_CATEGORY]}],
+            "code": {"coding": [{"system": LABEL_CODE_SYSTEM, "code": label, "display": label}], "text": f"AI-ECG {label}"},
+            "valueQuantity": {"value": round(score, 6), "unit": "1", "system": "http://unitsofmeasure.org", "code": "1"},
+        }
+        if source:
+            observation["derivedFrom"] = source
+        observations.append(entry("Observation", f"{record_id}-{label}", observation))
+
+    top_label, top_score = scores[0]
+    report = entry("DiagnosticReport", record_id, {
+        "category": [{"coding": [ECG_CATEGORY]}],
+        "code": {"coding": [ECG_REPORT_CODE], "text": "AI-ECG analysis"},
+        "issued": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "result": [{"reference": observation["fullUrl"]} for observation in observations],
+        "conclusion": f"Highest AI-ECG score: {top_label} {top_score:.3f}",
+    })
+
+    return observations + [report]
+
+
+class FhirWriteback():
+    """
+    Queues AI results as FHIR resources and writes them to the server in `transaction` Bundles.
+      - batching: a Bundle goes out when `batch_size` reports are queued or `flush_interval` s after the first one
+      - pooled:   one keep-alive HTTP client per worker
+      - retries:  transport errors, 408 / 429 and 5xx are retried with exponential backoff (Retry-After honored);
+                  when the server stays down the batch is put back for the next flush
+      - rejects:  a Bundle refused with another 4xx is split in halves, so one bad report does not drop the others
+    Pass `transport` (e.g. httpx.MockTransport) to run against stubs.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        batch_size=50,
+        flush_interval=2.0,
+        max_retries=3,
+        backoff=0.5,
+        timeout=30.0,
+        max_pending=10000,
+        token_provider=None,
+        token_ttl=240.0,
+        identifier_system=IDENTIFIER_SYSTEM,
+        transport=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.token_provider = token_provider
+        self.token_ttl = token_ttl
+        self.identifier_system = identifier_system
+        self._transport = transport
+        self._client = None
+        self._token = None
+        self._pending = deque()
+        self._queued = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.stats = {"queued": 0, "sent": 0, "rejected": 0, "dropped": 0, "bundles": 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+            )
+        return self._client
+
+    ### Queue one analyzed record (no I/O, safe to call from request handlers) ###
+    def submit(self, record_id, metadata, result):
+
+        entries = report_entries(record_id, metadata, result, self.identifier_system)
+        if not entries:
+            return False
+
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.stats["dropped"] += 1
+            system_logger.warning("FHIR write-back queue full (%d), dropped the oldest report", self.max_pending)
+
+        self._pending.append(entries)
+        self.stats["queued"] += 1
+        self._queued.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return True
+
+    def pending(self):
+        return len(self._pending)
+
+    ### Background loop: flush when a batch is full or flush_interval after the first queued report ###
+    async def run(self):
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._queued.wait()
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.batch_size and deadline > loop.time():
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+
+            if not await self.flush():  # server unavailable: back off before the next attempt
+                await asyncio.sleep(self.backoff * 2 ** self.max_retries)
+            if not self._pending:
+                self._queued.clear()
+
+    ### Send everything queued, one Bundle per batch; False when the server could not be reached ###
+    async def flush(self):
+
+        async with self._flush_lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                try:
+                    sent = await self._send(batch)
+                except asyncio.CancelledError:  # shutdown mid-send: keep the batch for the final flush (creates are idempotent)
+                    self._pending.extendleft(reversed(batch))
+                    raise
+                if not sent:
+                    self._pending.extendleft(reversed(batch))
+                    while len(self._pending) > self.max_pending:
+                        self._pending.pop()
+                        self.stats["dropped"] += 1
+                    return False
+        return True
+
+    async def _send(self, batch):
+
+        outcome = await self._post_bundle(batch)
+        if outcome == "ok":
+            self.stats["sent"] += len(batch)
+            return True
+        if outcome == "unavailable":
+            return False
+
+        if len(batch) == 1:
+            self.stats["rejected"] += 1
+            return True
+        middle = len(batch) // 2
+        return await self._send(batch[:middle]) and await self._send(batch[middle:])
+
+    async def _authorization(self):
+        if self.token_provider is None:
+            return {}
+        if self._token is None or time.monotonic() - self._token[1] > self.token_ttl:
+            self._token = (await run_in_threadpool(self.token_provider), time.monotonic())
+        return {"Authorization": f"Bearer {self._token[0]}"}
+
+    ### One transaction Bundle, retried on transient failures: "ok" | "rejected" | "unavailable" ###
+    async def _post_bundle(self, batch):
+        import httpx
+
+        entries = [entry for report in batch for entry in report]
+        payload = json.dumps({"resourceType": "Bundle", "type": "transaction", "entry": entries}).encode("utf-8")
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                headers = {"Content-Type": "application/fhir+json", "Accept": "application/fhir+json", **await self._authorization()}
+                with start_span("POST fhir.transaction", kind="client", **{"http.method": "POST", "http.url": self.base_url, "fhir.reports": len(batch), "fhir.entries": len(entries)}) as span:
+                    response = await self.client.post(self.base_url, content=payload, headers=inject_trace_headers(headers))
+                    span.set_attribute("http.status_code", response.status_code)
+                self.stats["bundles"] += 1
+
+                if response.status_code < 300:
+                    return "ok"
+                if response.status_code == 401:
+                    self._token = None
+                elif response.status_code not in (408, 429) and response.status_code < 500:
+                    system_logger.error("FHIR server rejected a bundle of %d reports (%s): %s", len(batch), response.status_code, response.text[:500])
+                    return "rejected"
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+
+            except (httpx.TransportError, RuntimeError) as e:  # RuntimeError: token request failed
+                error = exception_message(e)
+
+            if attempt < self.max_retries:
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                system_logger.warning("FHIR write-back failed (%s), retry %d/%d in %.1f s", error, attempt + 1, self.max_retries, delay)
+                await asyncio.sleep(delay)
+
+        system_logger.error("FHIR server unavailable, %d reports kept for the next flush: %s", len(batch), error)
+        return "unavailable"
+
+    ### Last flush at shutdown, then release the connections ###
+    async def aclose(self, timeout=10.0):
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        if self._pending:
+            system_logger.error("FHIR write-back stopped with %d unsent reports", len(self._pending))
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_fhir_writeback = None
+
+### Write-back configured from settings, one per worker ###
+def get_fhir_writeback():
+
+    global _fhir_writeback
+    if _fhir_writeback is None:
+        from app.configs.config import basicSettings
+
+        token_provider = None
+        if basicSettings.FHIR_WRITEBACK_AUTH:
+            from app.misc.utils.validate_fhir_format import get_validate_token
+            token_provider = get_validate_token
+
+        _fhir_writeback = FhirWriteback(
+            base_url=basicSettings.FHIR_BASE_URL,
+            batch_size=basicSettings.FHIR_WRITEBACK_BATCH_SIZE,
+            flush_interval=basicSettings.FHIR_WRITEBACK_FLUSH_SECONDS,
+            max_retries=basicSettings.FHIR_WRITEBACK_MAX_RETRIES,
+            timeout=basicSettings.FHIR_WRITEBACK_TIMEOUT_SECONDS,
+            token_provider=token_provider,
+        )
+    return _fhir_writeback
+
+if __name__ == "__main__":
+    pass
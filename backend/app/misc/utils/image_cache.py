@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+import sys
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.middleware.exception import exception_message
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'image', 'cache'))
+THUMBNAIL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'image', 'thumbnail'))
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+# Bump when the plot layout changes so previously issued ETags stop matching
+RENDER_VERSION = "1"
+
+
+### Strong ETag derived from the stored matrix digest and the rendition parameters ###
+def rendition_etag(matrix_digest, fmt, dpi, leads=None):
+    key = f"{RENDER_VERSION}:{matrix_digest}:{fmt}:{dpi}:{','.join(leads or [])}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return f'"{etag}"' in [tag.strip() for tag in if_none_match.split(",")]
+
+
+class ImageCache():
+    """On-disk rendition cache keyed by ETag, evicting least recently used files above max_bytes."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def path(self, etag, fmt):
+        return os.path.join(self.cache_dir, f"{etag}.{fmt}")
+
+    def get(self, etag, fmt):
+        path = self.path(etag, fmt)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)  # refresh recency for LRU
+            return content
+        except FileNotFoundError:
+            return None
+
+    def put(self, etag, fmt, content):
+        path = self.path(etag, fmt)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)  # atomic, concurrent workers never see partial files
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(content)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_size(self):
+        total = 0
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def _evict(self):
+        with os.scandir(self.cache_dir) as entries:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries if entry.is_file()]
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)  # leave headroom so eviction does not run on every put
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                system_logger.warning("Failed to evict cached image %s: %s", path, exception_message(e))
+        self._total_bytes = total
+
+
+### Thumbnails are pre-generated at upload and kept outside the LRU cache ###
+def thumbnail_path(record_id):
+    return os.path.join(THUMBNAIL_DIR, f"{record_id}.png")
+
+def load_thumbnail(record_id):
+    try:
+        with open(thumbnail_path(record_id), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def save_thumbnail(record_id, content):
+    path = thumbnail_path(record_id)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+if __name__ == "__main__":
+    pass
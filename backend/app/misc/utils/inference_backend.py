@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from fastapi.concurrency import run_in_threadpool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.core.deadline import DeadlineExceeded, remaining_budget
+from app.core.tracing import start_span
+
+
+system_logger = logging.getLogger('custom.error')
+
+MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'model'))
+
+
+### Label scores of an inference result: {"prediction": {...}}, or the per-window maxima of a long recording ###
+def prediction_scores(result):
+
+    if not isinstance(result, dict):
+        return {}
+    if isinstance(result.get("prediction"), dict):
+        scores = result["prediction"]
+    elif isinstance(result.get("aggregate"), dict):
+        scores = {key.removeprefix("prediction."): value for key, value in result["aggregate"].get("max", {}).items()}
+    else:
+        return {}
+
+    return {str(label): float(score) for label, score in scores.items() if isinstance(score, (int, float)) and not isinstance(score, bool)}
+
+
+class InferenceBackend():
+    """Where predictions come from. Matrices are (12, samples) at 500 Hz, filtered."""
+
+    async def infer(self, matrix_data, deadline=None):
+        return (await self.infer_batch(np.asarray(matrix_data)[None], deadline))[0]
+
+    async def infer_batch(self, batch_data, deadline=None):
+        raise NotImplementedError
+
+    async def health_loop(self):
+        return
+
+    ### Whether predictions can be served right now (readiness probe, must not call the model) ###
+    async def ready(self):
+        return True
+
+    async def aclose(self):
+        return
+
+
+class OnnxInferenceBackend(InferenceBackend):
+    """
+    Runs an exported ONNX model in-process with ONNX Runtime on the CPU.
+    The session is created once per worker (on first use or at prewarm). Intra-op threads are bounded so the
+    workers on a host do not oversubscribe the cores, and one batch runs at a time per worker.
+    """
+
+    def __init__(self, model_path, intra_op_threads=None, input_layout="NCL", labels=None, max_batch_size=32):
+        if input_layout not in ("NCL", "NLC"):
+            raise ValueError(f"Unsupported input layout: {input_layout}")
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads or 1
+        self.input_layout = input_layout
+        self.labels = list(labels or [])
+        self.max_batch_size = max_batch_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._run_lock = asyncio.Lock()
+
+    ### Lazily build the session (onnxruntime is only imported here) ###
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import onnxruntime as ort
+
+                    options = ort.SessionOptions()
+                    options.intra_op_num_threads = self.intra_op_threads
+                    options.inter_op_num_threads = 1
+                    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+                    start_time = time.perf_counter()
+                    self._session = ort.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+                    system_logger.info("Loaded ONNX model %s in %.0f ms (%d intra-op threads)", self.model_path, (time.perf_counter() - start_time) * 1000, self.intra_op_threads)
+        return self._session
+
+    async def ready(self):
+        return self._session is not None
+
+    def _run(self, batch):
+        session = self.session()
+        inputs = np.ascontiguousarray(batch if self.input_layout == "NCL" else batch.transpose(0, 2, 1), dtype=np.float32)
+        input_name = session.get_inputs()[0].name
+        output_names = [output.name for output in session.get_outputs()]
+
+        outputs = [session.run(output_names, {input_name: inputs[i:i + self.max_batch_size]}) for i in range(0, len(inputs), self.max_batch_size)]
+        merged = [np.concatenate([chunk[k] for chunk in outputs]) for k in range(len(output_names))]
+        return [self._to_prediction(output_names, [output[i] for output in merged]) for i in range(len(inputs))]
+
+    ### Shape the outputs like the remote API: {"prediction": {label: score}} for the first output ###
+    def _to_prediction(self, output_names, values):
+        scores = np.asarray(values[0], dtype=np.float64).ravel()
+        if self.labels and len(self.labels) == scores.size:
+            prediction = {label: float(score) for label, score in zip(self.labels, scores)}
+        else:
+            prediction = {f"{output_names[0]}_{i}": float(score) for i, score in enumerate(scores)}
+        result = {"prediction": prediction}
+        for name, value in zip(output_names[1:], values[1:]):
+            result[name] = np.asarray(value).tolist()
+        return result
+
+    async def infer_batch(self, batch_data, deadline=None):
+        budget = remaining_budget(deadline)
+        if budget is not None and budget <= 0:
+            raise DeadlineExceeded("Request deadline exceeded before inference")
+
+        batch = np.asarray(batch_data)
+        with start_span("onnx.inference", **{"batch.size": len(batch), "model": os.path.basename(self.model_path)}):
+            async with self._run_lock:  # one batch at a time, it already uses intra_op_threads cores
+                return await run_in_threadpool(self._run, batch)
+
+
+_inference_backend = None
+
+### Backend selected by INFERENCE_BACKEND (remote | local), one per worker ###
+def get_inference_backend():
+
+    global _inference_backend
+    if _inference_backend is None:
+        from app.configs.config import basicSettings
+
+        if basicSettings.INFERENCE_BACKEND == "local":
+            _inference_backend = OnnxInferenceBackend(
+                model_path=basicSettings.ONNX_MODEL_PATH or os.path.join(MODEL_DIR, "ecg.onnx"),
+                intra_op_threads=basicSettings.ONNX_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // max(1, basicSettings.WORKER_COUNT)),
+                input_layout=basicSettings.ONNX_INPUT_LAYOUT,
+                labels=[label.strip() for label in basicSettings.ONNX_LABELS.split(",") if label.strip()],
+                max_batch_size=basicSettings.INFERENCE_BATCH_SIZE
+            )
+        elif basicSettings.INFERENCE_BACKEND == "remote":
+            from app.misc.utils.inference_client import get_inference_client
+            _inference_backend = get_inference_client()
+        else:
+            raise ValueError(f"Unsupported inference backend: {basicSettings.INFERENCE_BACKEND}")
+
+    return _inference_backend
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import deque
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.core.deadline import DeadlineExceeded, remaining_budget
+from app.core.tracing import inject_trace_headers, start_span
+from app.misc.utils.inference_backend import InferenceBackend
+from app.middleware.exception import exception_message
+
+
+system_logger = logging.getLogger('custom.error')
+
+INFERENCE_PATH = "/api/v1/standard/inference"
+
+
+class InferenceUnavailableError(Exception):
+    """No model endpoint could answer (all failing, unhealthy or with an open circuit)."""
+
+
+class InferenceRequestError(Exception):
+    """The model server rejected the payload (4xx)."""
+
+
+class CircuitBreaker():
+    """closed -> open after `failure_threshold` consecutive failures -> half-open (one probe) after `reset_timeout` s."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    ### The probe ended without saying anything about the endpoint (lost hedge race, deadline already spent) ###
+    def release(self):
+        self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class Endpoint():
+    """One model replica: its breaker, health and a window of recent latencies."""
+
+    def __init__(self, url, breaker, latency_window=200):
+        self.url = url.rstrip("/")
+        self.breaker = breaker
+        self.healthy = True
+        self.in_flight = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def available(self):
+        return self.healthy and self.breaker.state != "open"
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class InferenceClient(InferenceBackend):
+    """
+    Async client for the model servers (the remote inference backend).
+      - load balancing: least in-flight requests among available endpoints, round robin on ties
+      - health checks:  GET `health_path` every `health_interval` s marks endpoints up / down
+      - circuit breaker per endpoint
+      - hedging:        when a request takes longer than the endpoint's p95, a copy goes to another replica
+                        and the first good answer wins
+      - deadlines:      each attempt's timeout is capped by what is left of the incoming request's budget
+    Pass `transport` (e.g. httpx.MockTransport) to run against stubs.
+    """
+
+    def __init__(
+        self,
+        urls,
+        timeout=30.0,
+        connect_timeout=3.0,
+        health_path="",
+        health_interval=10.0,
+        hedging=True,
+        hedge_min_delay=0.05,
+        hedge_min_samples=20,
+        failure_threshold=5,
+        reset_timeout=30.0,
+        max_concurrency=16,
+        transport=None,
+    ):
+        if not urls:
+            raise ValueError("At least one inference endpoint is required")
+        self.endpoints = [Endpoint(url, CircuitBreaker(failure_threshold, reset_timeout)) for url in urls]
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.hedging = hedging
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._transport = transport
+        self._client = None
+        self._next = 0
+
+    @property
+    def client(self):
+        # created lazily so the connection pool belongs to the running event loop
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    ### Endpoint selection ###
+    def _pick(self, exclude=()):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude and endpoint.available()]
+        if not candidates:
+            return None
+        self._next = (self._next + 1) % len(self.endpoints)
+        candidates.sort(key=lambda endpoint: (endpoint.in_flight, (self.endpoints.index(endpoint) - self._next) % len(self.endpoints)))
+        for endpoint in candidates:
+            if endpoint.breaker.allow():
+                return endpoint
+        return None
+
+    def _hedge_delay(self, endpoint):
+        if not self.hedging or len(endpoint.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, endpoint.percentile(0.95))
+
+    ### One attempt against one endpoint ###
+    async def _attempt(self, endpoint, payload, deadline):
+        import httpx
+
+        budget = remaining_budget(deadline)
+        if budget is not None and budget <= 0:
+            endpoint.breaker.release()  # allow() may have made this the half-open probe
+            raise DeadlineExceeded("Request deadline exceeded before inference")
+        timeout = self.timeout if budget is None else min(self.timeout, budget)
+
+        url = endpoint.url + INFERENCE_PATH
+        endpoint.in_flight += 1
+        start_time = time.monotonic()
+        try:
+            with start_span("POST ai.inference", kind="client", **{"http.method": "POST", "http.url": url}) as span:
+                response = await self.client.post(url, content=payload, headers=inject_trace_headers({"Content-Type": "application/json"}), timeout=httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout)))
+                span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                raise httpx.HTTPStatusError(f"Server error {response.status_code}", request=response.request, response=response)
+            result = response.json() if response.status_code < 400 else None
+        except asyncio.CancelledError:
+            endpoint.breaker.release()  # lost a hedge race: neither a success nor a failure of the endpoint
+            raise
+        except Exception:
+            endpoint.breaker.record_failure()
+            raise
+        finally:
+            endpoint.in_flight -= 1
+
+        endpoint.latencies.append(time.monotonic() - start_time)
+        endpoint.breaker.record_success()
+        if response.status_code >= 400:  # the replica is fine, the request is not: no failover
+            raise InferenceRequestError(f"Inference rejected the request ({response.status_code}): {response.text[:200]}")
+        return result
+
+    ### Primary attempt, hedged to a second replica after the p95 delay, one failover on error ###
+    async def _call(self, payload, deadline):
+
+        # before any breaker is asked, so a spent deadline never takes a half-open probe
+        budget = remaining_budget(deadline)
+        if budget is not None and budget <= 0:
+            raise DeadlineExceeded("Request deadline exceeded before inference")
+
+        primary = self._pick()
+        if primary is None:
+            raise InferenceUnavailableError("No inference endpoint available")
+
+        tasks = {asyncio.ensure_future(self._attempt(primary, payload, deadline)): primary}
+        tried = {primary}
+        hedge_delay = self._hedge_delay(primary)
+        last_error = None
+
+        try:
+            while tasks:
+                wait_timeout = hedge_delay if hedge_delay is not None and len(tried) == 1 else None
+                done, _ = await asyncio.wait(tasks, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:  # slow primary: hedge once to another replica
+                    hedge_delay = None
+                    secondary = self._pick(exclude=tried)
+                    if secondary is not None:
+                        tried.add(secondary)
+                        tasks[asyncio.ensure_future(self._attempt(secondary, payload, deadline))] = secondary
+                    continue
+
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    try:
+                        return task.result()
+                    except (DeadlineExceeded, InferenceRequestError):
+                        raise
+                    except Exception as e:
+                        last_error = e
+                        system_logger.warning("Inference call to %s failed: %s", endpoint.url, exception_message(e))
+
+                if not tasks:  # every attempt so far failed: fail over once to an untried replica
+                    secondary = self._pick(exclude=tried)
+                    if secondary is not None and len(tried) < 2:
+                        tried.add(secondary)
+                        tasks[asyncio.ensure_future(self._attempt(secondary, payload, deadline))] = secondary
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        budget = remaining_budget(deadline)
+        if budget is not None and budget <= 0:
+            raise DeadlineExceeded("Request deadline exceeded during inference")
+        raise InferenceUnavailableError(f"Inference failed on {len(tried)} endpoint(s): {exception_message(last_error)}")
+
+    ### Public API ###
+    async def infer(self, matrix_data, deadline=None):
+        """Prediction for one (12, samples) matrix."""
+
+        payload = json.dumps({"data": json.dumps(matrix_data.tolist())}).encode("utf-8")
+        async with self._semaphore:
+            return await self._call(payload, deadline)
+
+    async def infer_batch(self, batch_data, deadline=None):
+        """Predictions for a (batch, 12, samples) stack; the API is single-record so calls run concurrently."""
+
+        with start_span("ai.inference_batch", **{"batch.size": len(batch_data)}):
+            return await asyncio.gather(*(self.infer(matrix_data, deadline) for matrix_data in batch_data))
+
+    ### Health checks ###
+    async def check_health(self):
+        if not self.health_path:
+            return
+        for endpoint in self.endpoints:
+            try:
+                response = await self.client.get(endpoint.url + self.health_path, timeout=self.connect_timeout)
+                healthy = response.status_code < 500
+            except Exception:
+                healthy = False
+            if healthy != endpoint.healthy:
+                system_logger.warning("Inference endpoint %s is now %s", endpoint.url, "healthy" if healthy else "unhealthy")
+            endpoint.healthy = healthy
+
+    async def health_loop(self):
+        if not self.health_path:
+            return
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    async def ready(self):
+        return any(endpoint.available() for endpoint in self.endpoints)
+
+    def stats(self):
+        return [
+            {"url": endpoint.url, "healthy": endpoint.healthy, "circuit": endpoint.breaker.state, "in_flight": endpoint.in_flight, "p95": endpoint.percentile(0.95)}
+            for endpoint in self.endpoints
+        ]
+
+
+_inference_client = None
+
+### Client configured from settings, one per worker ###
+def get_inference_client():
+
+    global _inference_client
+    if _inference_client is None:
+        from app.configs.config import basicSettings
+
+        _inference_client = InferenceClient(
+            urls=[url.strip() for url in basicSettings.AI_URLS.split(",") if url.strip()],
+            timeout=basicSettings.AI_TIMEOUT_SECONDS,
+            connect_timeout=basicSettings.AI_CONNECT_TIMEOUT_SECONDS,
+            health_path=basicSettings.AI_HEALTH_PATH,
+            health_interval=basicSettings.AI_HEALTH_INTERVAL_SECONDS,
+            hedging=basicSettings.AI_HEDGING,
+            failure_threshold=basicSettings.AI_BREAKER_FAILURES,
+            reset_timeout=basicSettings.AI_BREAKER_RESET_SECONDS,
+            max_concurrency=basicSettings.AI_MAX_CONCURRENCY,
+        )
+    return _inference_client
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,115 @@
+import numpy as np
+import os
+import re
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+
+CANONICAL_LEADS = ['I', 'II', 'III', 'aVR', 'aVL', 'aVF', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6']
+LEAD_INDEX = {lead: index for index, lead in enumerate(CANONICAL_LEADS)}
+
+# I, II and the precordial leads are independent, the other four limb leads are linear combinations
+INDEPENDENT_LEADS = ['I', 'II', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6']
+INDEPENDENT_INDEX = [LEAD_INDEX[lead] for lead in INDEPENDENT_LEADS]
+
+# 12x8 projection: canonical 12-lead = PROJECTION @ [I, II, V1..V6]
+PROJECTION = np.zeros((12, 8))
+PROJECTION[LEAD_INDEX['I'], 0] = 1.0
+PROJECTION[LEAD_INDEX['II'], 1] = 1.0
+PROJECTION[LEAD_INDEX['III'], :2] = [-1.0, 1.0]   # III = II - I
+PROJECTION[LEAD_INDEX['aVR'], :2] = [-0.5, -0.5]  # aVR = -(I + II) / 2
+PROJECTION[LEAD_INDEX['aVL'], :2] = [1.0, -0.5]   # aVL = I - II / 2
+PROJECTION[LEAD_INDEX['aVF'], :2] = [-0.5, 1.0]   # aVF = II - I / 2
+for column, lead in enumerate(INDEPENDENT_LEADS[2:], start=2):
+    PROJECTION[LEAD_INDEX[lead], column] = 1.0
+PROJECTION.setflags(write=False)
+
+# FHIR / IEEE 11073 MDC codes of the 12 leads
+MDC_CODE_TO_LEAD = {"131329": 'I', "131330": 'II', "131389": 'III', "131390": 'aVR', "131391": 'aVL', "131392": 'aVF', "131331": 'V1', "131332": 'V2', "131333": 'V3', "131334": 'V4', "131335": 'V5', "131336": 'V6'}
+
+_LEAD_KEY = {lead.lower(): lead for lead in CANONICAL_LEADS}
+_LEAD_PREFIX = re.compile(r"^(mdc_ecg_lead_|lead[\s_-]*)", re.IGNORECASE)
+
+
+### Map a vendor lead code ('Lead I', 'leadaVR', 'MDC_ECG_LEAD_V1', '131329', 'I', ...) to its canonical name ###
+def canonical_lead_name(vendor_name):
+
+    if vendor_name is None:
+        return None
+
+    name = str(vendor_name).strip()
+    if name in MDC_CODE_TO_LEAD:
+        return MDC_CODE_TO_LEAD[name]
+
+    name = _LEAD_PREFIX.sub("", name).replace(" ", "")
+    return _LEAD_KEY.get(name.lower())
+
+### Sampling rate in Hz from a FHIR SampledData interval ###
+def interval_to_sampling_rate(interval, interval_unit="ms"):
+
+    scale = {"s": 1.0, "ms": 1e-3, "us": 1e-6, "ns": 1e-9}.get((interval_unit or "ms").strip().lower())
+    if scale is None:
+        raise ValueError(f"Unsupported interval unit: {interval_unit}")
+    if not interval or interval <= 0:
+        raise ValueError(f"Invalid sampling interval: {interval}")
+
+    return 1.0 / (float(interval) * scale)
+
+### Build the canonical (time, 12) matrix from vendor leads, deriving missing limb leads ###
+def normalize_leads(lead_arrays, sample_rates=None):
+    """
+    lead_arrays: {vendor lead name: 1-D samples}, sample_rates: optional {vendor lead name: Hz}.
+    Returns (ecg_matrix, sample_rate, missing_leads). Leads that can neither be read nor derived stay zero.
+    """
+
+    leads = {}
+    rates = set()
+    for vendor_name, data in lead_arrays.items():
+        lead = canonical_lead_name(vendor_name)
+        if lead is None:
+            continue
+        data = np.asarray(data, dtype=np.float64).ravel()
+        if data.size == 0:
+            continue
+        leads[lead] = data
+        if sample_rates and sample_rates.get(vendor_name):
+            rates.add(round(float(sample_rates[vendor_name]), 6))
+
+    if not leads:
+        raise ValueError("No recognizable ECG leads")
+
+    lengths = {data.size for data in leads.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"All leads must have the same number of data points, got {sorted(lengths)}")
+    if len(rates) > 1:
+        raise ValueError(f"All leads must have the same sampling rate, got {sorted(rates)}")
+
+    # recover a missing I or II from III before projecting (Einthoven: III = II - I)
+    if 'III' in leads:
+        if 'I' not in leads and 'II' in leads:
+            leads['I'] = leads['II'] - leads['III']
+        elif 'II' not in leads and 'I' in leads:
+            leads['II'] = leads['I'] + leads['III']
+
+    time_points = lengths.pop()
+    measured = np.zeros((time_points, 12))
+    present = np.zeros(12, dtype=bool)
+    for lead, data in leads.items():
+        measured[:, LEAD_INDEX[lead]] = data
+        present[LEAD_INDEX[lead]] = True
+
+    # missing limb leads are written into their columns in place, so the (time, 12) matrix is the only full copy
+    if present[LEAD_INDEX['I']] and present[LEAD_INDEX['II']] and not present.all():
+        derivable = ~present & PROJECTION[:, :2].any(axis=1)  # every limb lead is derivable from I and II
+        measured[:, derivable] = measured[:, [LEAD_INDEX['I'], LEAD_INDEX['II']]] @ PROJECTION[derivable, :2].T
+        present |= derivable
+    ecg_matrix = measured
+
+    missing_leads = [lead for lead, is_present in zip(CANONICAL_LEADS, present) if not is_present]
+    sample_rate = rates.pop() if rates else None
+
+    return ecg_matrix, sample_rate, missing_leads
+
+if __name__ == "__main__":
+    pass
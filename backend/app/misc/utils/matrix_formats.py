@@ -0,0 +1,80 @@
+import importlib.util
+import io
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+
+MATRIX_MEDIA_TYPES = {
+    "npy": "application/x-npy",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "json": "application/json",
+}
+MATRIX_DTYPES = {"float32": "<f4", "float64": "<f8"}
+
+
+def arrow_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+### Pick the matrix format from Accept (q values honoured); None when nothing offered is acceptable (406) ###
+def negotiate_matrix_format(accept, allow_arrow=True):
+    """
+    An explicitly listed type beats a wildcard of the same q; among explicit types the most compact wins
+    (npy, Arrow, JSON), while */* and application/* resolve to JSON so browsers and generic clients get text.
+    """
+
+    if not accept or not accept.strip():
+        return "json"
+
+    ranges = {}
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges[media_type.strip().lower()] = quality
+
+    candidates = []
+    for rank, fmt in enumerate(("json", "arrow", "npy")):
+        if fmt == "arrow" and not allow_arrow:
+            continue
+        media_type = MATRIX_MEDIA_TYPES[fmt]
+        if media_type in ranges:
+            quality, exact = ranges[media_type], True
+        else:
+            quality, exact = ranges.get(f"{media_type.split('/')[0]}/*", ranges.get("*/*", 0.0)), False
+        if quality > 0:
+            candidates.append((quality, exact, rank if exact else -rank, fmt))
+
+    return max(candidates)[3] if candidates else None
+
+### .npy file of a matrix: version 1.0 header, then the array buffer as is (np.load / numpy.frombuffer on the client) ###
+def npy_bytes(matrix):
+    matrix = np.ascontiguousarray(matrix)
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(matrix))
+    return b"".join([header.getvalue(), memoryview(matrix).cast("B")])
+
+### Arrow IPC stream: one column per lead, metadata in the schema; columns wrap the rows of the (leads, samples) matrix ###
+def arrow_stream_bytes(lead_matrix, leads, metadata):
+
+    import pyarrow as pa
+
+    lead_matrix = np.ascontiguousarray(lead_matrix)
+    schema = pa.schema([pa.field(lead, pa.from_numpy_dtype(lead_matrix.dtype)) for lead in leads], metadata={key: str(value) for key, value in metadata.items()})
+    batch = pa.record_batch([pa.array(row) for row in lead_matrix], schema=schema)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+if __name__ == "__main__":
+    pass
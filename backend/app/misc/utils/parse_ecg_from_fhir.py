@@ -1,17 +1,77 @@
 import json
-
-import matplotlib.pyplot as plt
+import logging
 import numpy as np
 import os
 import sys
 
-from matplotlib.gridspec import GridSpec
-from scipy import interpolate
+from io import BytesIO
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 
 from app.middleware.exception import exception_message
 from app.misc.utils.aiecg_api import ecg_ai_model
+from app.misc.utils.fast_json import loads, ORJSON
+from app.misc.utils.lead_normalize import CANONICAL_LEADS, interval_to_sampling_rate, LEAD_INDEX, MDC_CODE_TO_LEAD, normalize_leads
+from app.misc.utils.window_ecg import fit_length, resample_to_rate, TARGET_SAMPLE_RATE
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+MDC_SYSTEM = "urn:oid:2.16.840.1.113883.6.24"
+PARSE_CHUNK_CHARS = 1 << 20  # ~150k samples of SampledData.data parsed per step
+
+
+### Numeric SampledData field as float; a missing, boolean or string value raises TypeError ###
+def _number(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"valueSampledData.{field} must be a number")
+    return float(value)
+
+### valueSampledData -> the lead metadata the pipeline keeps, validating the field types in the same pass ###
+def sampled_data_metadata(sampled_data):
+    return {
+        "factor": _number(sampled_data.get("factor", 1), "factor"),
+        "origin": _number((sampled_data.get("origin") or {}).get("value"), "origin.value"),
+        "interval": _number(sampled_data.get("interval"), "interval"),
+        "intervalUnit": str(sampled_data.get("intervalUnit", "ms")),
+        "lowerLimit": _number(sampled_data.get("lowerLimit"), "lowerLimit"),
+        "upperLimit": _number(sampled_data.get("upperLimit"), "upperLimit"),
+    }
+
+### Components coded with an MDC lead code and carrying valueSampledData, in document order ###
+def read_lead_components(fhir_data):
+    for component in fhir_data.get("component") or ():
+        codings = (component.get("code") or {}).get("coding") or ()
+        lead = next((MDC_CODE_TO_LEAD[coding.get("code")] for coding in codings if coding.get("system") == MDC_SYSTEM and coding.get("code") in MDC_CODE_TO_LEAD), None)
+        sampled_data = component.get("valueSampledData")
+        if lead and sampled_data:
+            yield lead, sampled_data
+
+### SampledData.data -> float64 samples without a Python float per sample where possible ###
+def parse_samples(data, chunk_chars=PARSE_CHUNK_CHARS):
+    """
+    With orjson the space separated decimals are read as JSON arrays (~2.5x faster than float() per token);
+    irregular spacing or FHIR's E / L / U markers fall back to numpy's string conversion, which raises ValueError
+    on anything that is not a number. The string is read in chunks cut at a space, so the intermediate Python
+    floats / tokens of one chunk exist at a time instead of one per sample of the lead.
+    """
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = data.find(" ", start + chunk_chars)
+        end = len(data) if end == -1 else end
+        chunks.append(_parse_chunk(data[start:end]))
+        start = end + 1
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+def _parse_chunk(chunk):
+    if ORJSON:
+        try:
+            return np.asarray(loads(f"[{chunk.replace(' ', ',')}]"), dtype=np.float64)
+        except (ValueError, TypeError):
+            pass
+    return np.array(chunk.split(), dtype=np.float64)
 
 ### Extract ECG information from FHIR format ###
 def extract_ecg_data(fhir_data):
@@ -27,56 +87,41 @@ def extract_ecg_data(fhir_data):
             "performer": [p.get("reference", "") for p in fhir_data.get("performer", [])],
             "device": fhir_data.get("device", {}).get("display", "")
         }
-        mdc_code_to_lead = {"131329": 'Lead I', "131330": 'Lead II', "131389": 'Lead III', "131390": 'Lead aVR', "131391": 'Lead aVL', "131392": 'Lead aVF', "131331": 'Lead V1', "131332": 'Lead V2', "131333": 'Lead V3', "131334": 'Lead V4', "131335": 'Lead V5', "131336": 'Lead V6'}
         
         if "component" not in fhir_data:
             raise KeyError("This FHIR data without component")
 
-        for component in fhir_data["component"]:
-            lead_name = None
-            for coding in component.get("code", {}).get("coding", []):
-                if coding.get("system") == "urn:oid:2.16.840.1.113883.6.24":
-                    code = coding.get("code")
-                    if code in mdc_code_to_lead:
-                        lead_name = mdc_code_to_lead[code]
-                        break
-            if not lead_name:
+        for lead, sampled_data in read_lead_components(fhir_data):
+            lead_name = f"Lead {lead}"
+            try:
+                lead_metadata = sampled_data_metadata(sampled_data)
+            except TypeError as e:
+                system_logger.warning("%s: %s", lead_name, str(e))
+                continue
+
+            if not sampled_data.get("data"):
+                system_logger.warning("%s without data", lead_name)
                 continue
-                
-            sampled_data = component.get("valueSampledData", {})
-            if sampled_data:
-                origin = float(int(sampled_data.get("origin", {}).get("value")))
-                factor = float(int(sampled_data.get("factor")))
-                interval = float(int(sampled_data.get("interval")))
-                interval_unit = sampled_data.get("intervalUnit", "ms")
-                lower_limit = float(int(sampled_data.get("lowerLimit")))
-                upper_limit = float(int(sampled_data.get("upperLimit")))
-                ecg_data = sampled_data.get("data", "")
-
-                if not ecg_data:
-                    print(f"Warning: {lead_name} without data")
-                    continue
-
-                try:
-                    raw_values = [float(x) for x in ecg_data.split(' ') if x]
-                    scaled_values = [(x - origin) * factor for x in raw_values]
-                    leads_data[lead_name] = {
-                        "data": scaled_values,
-                        "metadata": {"factor": factor, "origin": origin, "interval": interval, "intervalUnit": interval_unit, "lowerLimit": lower_limit, "upperLimit": upper_limit}
-                    }
-                except ValueError:
-                    print(f"Warning: {lead_name} contain invalid data")
-                    continue
+
+            try:
+                scaled_values = parse_samples(sampled_data["data"])
+                scaled_values -= lead_metadata["origin"]  # in place: no full-length temporaries
+                scaled_values *= lead_metadata["factor"]
+            except ValueError:
+                system_logger.warning("%s contains invalid data", lead_name)
+                continue
+
+            leads_data[lead_name] = {"data": scaled_values, "metadata": lead_metadata}
 
         if not leads_data:
-            missing_leads = set(mdc_code_to_lead.values()) - set(leads_data.keys())
+            missing_leads = {f"Lead {lead}" for lead in CANONICAL_LEADS} - set(leads_data.keys())
             if missing_leads:
-                print(f"Warning: without: {missing_leads}")
+                system_logger.warning("Missing leads: %s", sorted(missing_leads))
         
         return leads_data, metadata
         
     except Exception as e:
-        print(f"An error occurred while processing ECG data: {exception_message(e)}")
+        system_logger.error("An error occurred while processing ECG data: %s", exception_message(e))
         return None, None
 
 ### Convert ECG data to matrix format ###
@@ -85,35 +130,48 @@ def convert_to_matrix(leads_data):
         if not leads_data:
             return None
         
-        lead_order = {'Lead I': 0, 'Lead II': 1, 'Lead III': 2, 'Lead aVR': 3, 'Lead aVL': 4, 'Lead aVF': 5, 'Lead V1': 6, 'Lead V2': 7, 'Lead V3': 8, 'Lead V4': 9, 'Lead V5': 10, 'Lead V6': 11}
-
-        lengths = [len(lead_info['data']) for lead_info in leads_data.values()]
-        if len(set(lengths)) > 1:
-            raise ValueError("All leads must have the same number of data points")
-
-        time_points = lengths[0]
-        ecg_matrix = np.zeros((time_points, 12))
-
-        for lead_name, lead_info in leads_data.items():
-            if lead_name in lead_order:
-                col_index = lead_order[lead_name]
-                ecg_matrix[:, col_index] = lead_info['data']
+        lead_arrays = {lead_name: lead_info['data'] for lead_name, lead_info in leads_data.items()}
+        sample_rates = {lead_name: interval_to_sampling_rate(lead_info['metadata']['interval'], lead_info['metadata']['intervalUnit']) for lead_name, lead_info in leads_data.items()}
+        ecg_matrix, _, missing_leads = normalize_leads(lead_arrays, sample_rates)
+        if missing_leads:
+            system_logger.warning("Missing leads: %s", sorted(missing_leads))
 
         return ecg_matrix
 
     except Exception as e:
-        print(f"An error occurred while converting to matrix: {exception_message(e)}")
+        system_logger.error("An error occurred while converting to matrix: %s", exception_message(e))
         return None
 
+### Step of the uploaded samples (SampledData `factor`) when every lead holds integer counts, None otherwise ###
+def fhir_resolution(leads_data):
+
+    factors = {lead_info["metadata"]["factor"] for lead_info in (leads_data or {}).values()}
+    if len(factors) != 1:
+        return None
+    factor = factors.pop()
+    if not factor or factor <= 0:
+        return None
+
+    for lead_info in leads_data.values():
+        counts = np.asarray(lead_info["data"], dtype=np.float64) / factor
+        if not np.array_equal(np.rint(counts), counts):
+            return None
+    return factor
+
 ### Resample ECG matrix to the format required by the AI model ###
-def resample_ecg_matrix(ecg_matrix, target_length=5000):
+def resample_ecg_matrix(ecg_matrix, target_length=5000, sample_rate=None):
+
+    if sample_rate:  # true rate known: resample to 500 Hz and crop / zero-pad to the model length
+        return fit_length(resample_to_rate(ecg_matrix, sample_rate, TARGET_SAMPLE_RATE), target_length)
 
     original_length = ecg_matrix.shape[0]
     num_leads = ecg_matrix.shape[1]
 
-    if original_length == 5000:
+    if original_length == target_length:
         return ecg_matrix
 
+    from scipy import interpolate
+
     x_original = np.linspace(0, 1, original_length)
     x_target = np.linspace(0, 1, target_length)
 
@@ -126,18 +184,66 @@ def resample_ecg_matrix(ecg_matrix, target_length=5000):
     
     return resampled_matrix
 
-### Plot ECG waveform from the matrix ###
-def plot_ecg_from_matrix(ecg_matrix, uid, sample_rate=500):
+IMAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'image'))
+os.makedirs(IMAGE_DIR, exist_ok=True)
+
+IMAGE_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "svg": "image/svg+xml"}
 
-    if ecg_matrix.shape[1] != 12:
-        raise ValueError(f"Expected 12 leads, got {ecg_matrix.shape[1]}")
 
-    fig = plt.figure(figsize=(15, 10))
-    gs = GridSpec(4, 1, height_ratios=[1, 1, 1, 1.2], hspace=0)
+### Draw the ECG paper grid on one axis ###
+def _style_ecg_axis(ax, xlim=(-1, 10)):
 
     major_grid_color = '#FFB6C1'
     minor_grid_color = '#FFC1C9'
 
+    ax.grid(True, which='major', color=major_grid_color, linestyle='-', alpha=0.8)  
+    ax.grid(True, which='minor', color=minor_grid_color, linestyle='-', alpha=0.5)
+
+    minor_ticks = np.arange(-2, 12, 0.04)  
+    major_ticks = np.arange(-2, 12, 0.2)
+    ax.set_xticks(major_ticks)
+    ax.set_xticks(minor_ticks, minor=True)
+    ax.set_yticks(major_ticks)
+    ax.set_yticks(minor_ticks, minor=True)
+
+    ax.set_xlim(*xlim)  
+    ax.set_ylim(-1.5, 1.5)
+    
+    ax.set_xticklabels([])  
+    ax.set_yticklabels([])
+
+    for spine in ax.spines.values():  
+        spine.set_visible(False)
+
+    ax.tick_params(axis='both', which='both', length=0)  
+
+### Build the ECG figure from the matrix (object API only, safe to call from worker threads) ###
+def render_ecg_figure(ecg_matrix, sample_rate=500, leads=None):
+
+    # matplotlib is imported on first render (or pre-warmed at startup), not when the module is imported
+    from matplotlib.figure import Figure
+    from matplotlib.gridspec import GridSpec
+
+    if ecg_matrix.shape[1] != 12:
+        raise ValueError(f"Expected 12 leads, got {ecg_matrix.shape[1]}")
+
+    duration = len(ecg_matrix) / sample_rate       
+    t = np.linspace(0, duration, len(ecg_matrix))  
+
+    if leads:  # one full-length rhythm strip per requested lead
+        fig = Figure(figsize=(15, 2.5 * len(leads)))
+        gs = GridSpec(len(leads), 1, figure=fig, hspace=0)
+        for row, lead_name in enumerate(leads):
+            ax = fig.add_subplot(gs[row])
+            ax.plot(t, ecg_matrix[:, LEAD_INDEX[lead_name]], 'k-', linewidth=0.8)
+            ax.text(-0.05, 1, lead_name, color='green', fontsize=14, fontweight='normal')
+            _style_ecg_axis(ax)
+        fig.subplots_adjust(right=0.95, left=0.05)
+        return fig
+
+    fig = Figure(figsize=(15, 10))
+    gs = GridSpec(4, 1, figure=fig, height_ratios=[1, 1, 1, 1.2], hspace=0)
+
     leads_layout = [
         [(0, 'I'), (3, 'aVR'), (6, 'V1'), (9, 'V4')],   
         [(1, 'II'), (4, 'aVL'), (7, 'V2'), (10, 'V5')],
@@ -145,49 +251,25 @@ def plot_ecg_from_matrix(ecg_matrix, uid, sample_rate=500):
         [(1, 'II')]
     ]
 
-    duration = len(ecg_matrix) / sample_rate       
-    t = np.linspace(0, duration, len(ecg_matrix))  
     points_per_segment = int(2.5 * sample_rate)    
     
-    for row, leads in enumerate(leads_layout):
+    for row, row_leads in enumerate(leads_layout):
         ax = fig.add_subplot(gs[row])
         if row == 3:  
-            lead_idx = leads[0][0]
+            lead_idx = row_leads[0][0]
             ax.plot(t, ecg_matrix[:, lead_idx], 'k-', linewidth=0.8)
             ax.text(-0.05, 1, 'II', color='green', fontsize=14, fontweight='normal')
         else:
-            for i, (lead_idx, lead_name) in enumerate(leads):                                          
+            for i, (lead_idx, lead_name) in enumerate(row_leads):                                          
                 x_offset = i * 2.5                                                                 
                 data = ecg_matrix[:points_per_segment, lead_idx]                                        
                 t_segment = np.linspace(0, 2.5, len(data))
                 ax.plot(t_segment + x_offset, data, 'k-', linewidth=0.8)                                
                 ax.text(x_offset - 0.05, 1, lead_name, color='green', fontsize=14, fontweight='normal') 
 
-        ax.grid(True, which='major', color=major_grid_color, linestyle='-', alpha=0.8)  
-        ax.grid(True, which='minor', color=minor_grid_color, linestyle='-', alpha=0.5)
-
-        minor_ticks = np.arange(-2, 12, 0.04)  
-        major_ticks = np.arange(-2, 12, 0.2)
-        ax.set_xticks(major_ticks)
-        ax.set_xticks(minor_ticks, minor=True)
-        ax.set_yticks(major_ticks)
-        ax.set_yticks(minor_ticks, minor=True)
-
-        if row == 3: 
-            ax.set_xlim(-1, 10)  
-        else:
-            ax.set_xlim(-1, 10)  
-        ax.set_ylim(-1.5, 1.5)
-        
-        ax.set_xticklabels([])  
-        ax.set_yticklabels([])
-
-        for spine in ax.spines.values():  
-            spine.set_visible(False)
-
-        ax.tick_params(axis='both', which='both', length=0)  
+        _style_ecg_axis(ax)
 
-    cal_ax = plt.axes([0.95, 0.1, 0.02, 0.1])  
+    cal_ax = fig.add_axes([0.95, 0.1, 0.02, 0.1])  
     cal_ax.set_xticks([])
     cal_ax.set_yticks([])
     cal_ax.set_xlim(-0.5, 0.5)
@@ -195,17 +277,37 @@ def plot_ecg_from_matrix(ecg_matrix, uid, sample_rate=500):
     for spine in cal_ax.spines.values():
         spine.set_visible(False)
 
-    plt.subplots_adjust(right=0.95, left=0.05)  
+    fig.subplots_adjust(right=0.95, left=0.05)  
 
-    if uid:  
-        
-        plot_path = f"C:/Users/young/Desktop/DMC/smart-app/backend/file/image/{uid}.png"
-        # plot_path = f"/home/young19990726/Project/smart-app/backend/file/image/{uid}.png"
-        plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-        print('Image already saved')
+    return fig
+
+### Render the ECG figure to image bytes (png / webp / svg) ###
+def render_ecg_image(ecg_matrix, fmt="png", dpi=300, leads=None, sample_rate=500):
+
+    if fmt not in IMAGE_MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = render_ecg_figure(ecg_matrix, sample_rate=sample_rate, leads=leads)
+    FigureCanvasAgg(fig)
+
+    img_buffer = BytesIO()
+    fig.savefig(img_buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+    return img_buffer.getvalue()
+
+### Plot ECG waveform from the matrix ###
+def plot_ecg_from_matrix(ecg_matrix, uid, sample_rate=500, dpi=300):
+
+    if not uid:
+        raise ValueError("uid is required to save the ECG image")
+
+    plot_path = os.path.join(IMAGE_DIR, f"{uid}.png")
+    with open(plot_path, "wb") as f:
+        f.write(render_ecg_image(ecg_matrix, fmt="png", dpi=dpi, sample_rate=sample_rate))
+    system_logger.debug("ECG image saved to %s", plot_path)
     
     return plot_path
-    # return fig
 
 if __name__ == "__main__":
 
@@ -226,5 +328,5 @@ if __name__ == "__main__":
     matrix_data = resampled_matrix.T
     result = ecg_ai_model(matrix_data)
     print(result)
-    fig = plot_ecg_from_matrix(resampled_matrix, sample_rate=500, uid=uid)
-    plt.close()
\ No newline at end of file
+    fig_path = plot_ecg_from_matrix(resampled_matrix, sample_rate=500, uid=uid)
+    print(fig_path)
\ No newline at end of file
@@ -1,10 +1,10 @@
 import array
 import base64 
+import logging
 import numpy as np
 import os
 import SPxml
 import sys
-import traceback
 import xml.etree.ElementTree as ET
 import xmltodict
 
@@ -12,9 +12,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.
 
 from app.middleware.exception import exception_message
 from app.misc.utils.aiecg_api import ecg_ai_model
+from app.misc.utils.ecg_measurements import measure_ecg
+from app.misc.utils.lead_normalize import CANONICAL_LEADS, LEAD_INDEX, normalize_leads
 from app.misc.utils.parse_ecg_from_fhir import resample_ecg_matrix
 
 
+system_logger = logging.getLogger('custom.error')
+
+
 ### Parse ECG xml file ###
 ## ge ##
 def parse_ge_xml(xml_path):
@@ -34,6 +39,9 @@ def parse_ge_xml(xml_path):
     age = patient_data.get("PatientAge", "Unknown")
     gender = patient_data.get("Gender", "Unknown")
 
+    measurements = ecg["RestingECG"].get("RestingECGMeasurements") or {}  # device measurements (intervals, axes, fiducials)
+    median_leads = {}
+
     for waveform in ecg["RestingECG"]["Waveform"]:  # extract waveform information
         if waveform.get("WaveformType") == "Rhythm":
             sample_base = waveform.get("SampleBase", "")
@@ -62,19 +70,23 @@ def parse_ge_xml(xml_path):
                         "LeadDataCRC32": int(lead_index["LeadDataCRC32"])
                     }
                 except KeyError as e:
-                    print(f"Warning: Missing field {exception_message(e)} in lead data from ge for {lead_id}. Skipping this lead.")
+                    system_logger.warning("Missing field %s in ge lead data for %s, skipping this lead", exception_message(e), lead_id)
                 except Exception as e:
-                    print(f"Error processing leads of ge {lead_id}: {exception_message(e)}")
+                    system_logger.error("Error processing ge lead %s: %s", lead_id, exception_message(e))
 
-    if leads["I"]["data"].size == leads["II"]["data"].size == 5000:  # derive additional leads
-        leads["III"]["data"] = np.subtract(leads["II"]["data"], leads["I"]["data"])
-        leads["aVR"]["data"] = np.add(leads["I"]["data"], leads["II"]["data"]) * (-0.5)
-        leads["aVL"]["data"] = np.subtract(leads["I"]["data"], 0.5 * leads["II"]["data"])
-        leads["aVF"]["data"] = np.subtract(leads["II"]["data"], 0.5 * leads["I"]["data"])
+        elif waveform.get("WaveformType") == "Median":  # one representative beat per lead
+            for lead_index in waveform.get("LeadData", []):
+                try:
+                    median_leads[lead_index["LeadID"]] = np.array(array.array("h", base64.b64decode(lead_index["WaveFormData"])))
+                except Exception as e:
+                    system_logger.warning("Error processing ge median lead: %s", exception_message(e))
 
-    for lead_id, lead_data in leads.items():  # validate lead data length
-        if lead_data["data"].size != 5000 and lead_data["data"].size != 0:
-            raise ValueError(f"Lead {lead_id} has incorrect data length: {lead_data['data'].size}")
+    lead_arrays = {lead_id: lead_data["data"] for lead_id, lead_data in leads.items() if lead_data["data"].size}
+    if lead_arrays:  # derive missing limb leads and validate lengths in one place
+        ecg_matrix, _, _ = normalize_leads(lead_arrays)
+        for lead_id in CANONICAL_LEADS:
+            if leads[lead_id]["data"].size == 0 and ecg_matrix[:, LEAD_INDEX[lead_id]].any():
+                leads[lead_id]["data"] = ecg_matrix[:, LEAD_INDEX[lead_id]]
 
     result = {
         "PatientID": patient_id,
@@ -83,7 +95,9 @@ def parse_ge_xml(xml_path):
         "SampleBase": sample_base, 
         "HighPassFilter": high_pass_filter, 
         "LowPassFilter": low_pass_filter,
-        "Leads": leads
+        "Leads": leads,
+        "MedianLeads": median_leads,
+        "Measurements": dict(measurements)
     }
 
     return result
@@ -92,47 +106,61 @@ def ge(xml_path):
     try:
         ecg_data = parse_ge_xml(xml_path)
 
-        print("Basic information:")
-        print(f"PatientID: {ecg_data.get('PatientID', '')}")
-        print(f"Age: {ecg_data.get('Age', 'Unknown')}")
-        print(f"Gender: {ecg_data.get('Gender', '')}")
-        print(f"SampleBase: {ecg_data.get('SampleBase', '')}")
-        print(f"HighPassFilter: {ecg_data.get('HighPassFilter', '')}")
-        print(f"LowPassFilter: {ecg_data.get('LowPassFilter', '')}")
+        system_logger.info("Basic information: PatientID=%s Age=%s Gender=%s SampleBase=%s HighPassFilter=%s LowPassFilter=%s", ecg_data.get('PatientID', ''), ecg_data.get('Age', 'Unknown'), ecg_data.get('Gender', ''), ecg_data.get('SampleBase', ''), ecg_data.get('HighPassFilter', ''), ecg_data.get('LowPassFilter', ''))
 
-        print("\nLead information:")
         for lead_id, lead_data in ecg_data["Leads"].items():
-            print(f"Lead: {lead_id}")
-            print(f"Count of data: {len(lead_data['data'])}")
-            print(f"Data: {lead_data['data']}")
-            for key, value in lead_data["info"].items():
-                print(f"{key}: {value}")
-        
-        print("\nWaveform processing information:")
+            system_logger.debug("Lead %s: %d samples, info=%s", lead_id, len(lead_data['data']), lead_data["info"])
+
         for lead_id in ["I", "II", "III", "aVR", "aVL", "aVF", "V1", "V2", "V3", "V4", "V5", "V6"]:
             if lead_id in ecg_data["Leads"] and len(ecg_data["Leads"][lead_id]["data"]) > 0:
-                print(f"Lead {lead_id} length: {len(ecg_data['Leads'][lead_id]['data'])}")
+                system_logger.info("Lead %s length: %d", lead_id, len(ecg_data['Leads'][lead_id]['data']))
             else:
-                print(f"Lead {lead_id} without valid data or length does not match.")
+                system_logger.warning("Lead %s without valid data or length does not match", lead_id)
 
     except Exception as e:
-        print(f"An error occurred during parsing: {exception_message(e)}")
-        traceback.print_exc()
+        system_logger.exception("An error occurred during parsing: %s", exception_message(e))
 
-def ge_convert_to_matrix(xml_path):
+def ge_convert_to_matrix(xml_path, ecg_data=None):
 
-    ecg_data = parse_ge_xml(xml_path)
-    lead_names = ['I', 'II', 'III', 'aVR', 'aVL', 'aVF', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6']
-    lead_arrays = [np.array(ecg_data['Leads'][lead]['data']) for lead in lead_names if lead in ecg_data['Leads']]
-    lengths = [len(data) for data in lead_arrays]  # make sure the length of all lead data is consistent and choose the shortest length to align the data
-    min_length = min(lengths)
-    lead_arrays = [data[:min_length] for data in lead_arrays]
-    ecg_matrix = np.column_stack(lead_arrays)
-    print(f"Original matrix shape: {ecg_matrix.shape}")
+    ecg_data = ecg_data or parse_ge_xml(xml_path)
+    lead_arrays = {lead_id: lead_data["data"] for lead_id, lead_data in ecg_data["Leads"].items()}
+    sample_rate = float(ecg_data["SampleBase"]) if ecg_data.get("SampleBase") else None
+    ecg_matrix, _, _ = normalize_leads(lead_arrays, {lead_id: sample_rate for lead_id in lead_arrays})
+    system_logger.debug("Original matrix shape: %s", ecg_matrix.shape)
     ecg_matrix = resample_ecg_matrix(ecg_matrix)
-    print(f"Resample matrix shape:{ecg_matrix.shape}")
+    system_logger.debug("Resample matrix shape: %s", ecg_matrix.shape)
     return ecg_matrix
 
+### GE RestingECGMeasurements mapped to measure_ecg fields (QTCorrected is Bazett) ###
+GE_MEASUREMENT_FIELDS = {
+    "VentricularRate": "heart_rate_bpm",
+    "PRInterval": "pr_ms",
+    "QRSDuration": "qrs_ms",
+    "QTInterval": "qt_ms",
+    "QTCorrected": "qtc_bazett_ms",
+    "QTcFrederica": "qtc_fridericia_ms",
+    "PAxis": "p_axis_deg",
+    "RAxis": "qrs_axis_deg",
+    "TAxis": "t_axis_deg",
+}
+
+def ge_vendor_measurements(ecg_data):
+
+    vendor = {}
+    for ge_field, field in GE_MEASUREMENT_FIELDS.items():
+        try:
+            vendor[field] = float(ecg_data["Measurements"][ge_field])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return vendor
+
+### Measurements of a GE file: computed on the resampled matrix, device values where the file has them ###
+def ge_measurements(xml_path):
+
+    ecg_data = parse_ge_xml(xml_path)
+    ecg_matrix = ge_convert_to_matrix(xml_path, ecg_data)
+    return measure_ecg(ecg_matrix, sample_rate=500, vendor=ge_vendor_measurements(ecg_data))
+
 ## philips ##
 def parse_philips_svg(svg_path):
 
@@ -151,8 +179,7 @@ def parse_philips_svg(svg_path):
                             raw_value = raw_ecg[1::2]
                             ecg_wave_data[current_lead_name] = np.array(raw_value, dtype="float64") * -1
 
-    leads_matrix = [np.array(data) for data in ecg_wave_data.values()]
-    ecg_matrix = np.stack(leads_matrix, axis=-1)
+    ecg_matrix, _, _ = normalize_leads(ecg_wave_data)
     ecg_matrix = resample_ecg_matrix(ecg_matrix)
     return ecg_matrix
 
@@ -198,11 +225,13 @@ def parse_philips_xml(xml_path):
     repbeats = waveforms.find('philips:repbeats', namespace)
     rhythm_data = []
     if repbeats is not None:
+        repbeat_sample_rate = repbeats.get('samplespersec') or REPBEAT_SAMPLE_RATE
         for index, repbeat in enumerate(repbeats.findall('philips:repbeat', namespace)):
             rhythm_data.append(
                 {
                     'ecg_data': xml_ecgs[index]["data"],
                     'lead_name': repbeat.get('leadname'),
+                    'sample_rate': repbeat_sample_rate,
                     'duration': repbeat.get('duration'),
                     'ponset': repbeat.get('ponset'),
                     'pend': repbeat.get('pend'),
@@ -217,8 +246,14 @@ def parse_philips_xml(xml_path):
     decode_data = base64.b64decode(waveform_base64)
     waveform_data = np.frombuffer(decode_data, dtype=np.int16)
 
+    global_data = {}  # device measurements over all leads (ms, bpm, degrees)
+    for measurements in root.iterfind('.//philips:globalmeasurements', namespace):
+        for child in measurements:
+            global_data.setdefault(child.tag.split("}")[-1], child.text)
+
     return {
         'document_info': document_data,
+        'global_measurements': global_data,
         'patient_info': patient_data,
         'waveform_params': waveform_params,
         'leads_info': leads_info,
@@ -230,42 +265,94 @@ def philips(xml_path):
     try:
         ecg_data = parse_philips_xml(xml_path)
 
-        print("\nDocument information:")
-        for key, value in ecg_data['document_info'].items():
-            print(f"{key}: {value}")
-        
-        print("\nPatient information:")
-        for key, value in ecg_data['patient_info'].items():
-            print(f"{key}: {value}")
-        
-        print("\nLead information:")
-        for key, value in ecg_data['leads_info'].items():
-            print(f"{key}: {value}")
-        
-        print("\nRhythm information:")
+        system_logger.info("Document information: %s", ecg_data['document_info'])
+        system_logger.info("Patient information: %s", ecg_data['patient_info'])
+        system_logger.info("Lead information: %s", ecg_data['leads_info'])
         for index, rhythm in enumerate(ecg_data['rhythm_data']):
-            print(f"Lead {index + 1}:")
-            for key, value in rhythm.items():
-                print(f"  {key}: {value}")
-        
-        print("\nWaveform information:")
-        print(f"waveform data shape: {ecg_data['raw_waveform_data'].shape}")
-        print(f"waveform data type: {ecg_data['raw_waveform_data'].dtype}")
-    
+            system_logger.debug("Rhythm lead %d: %s", index + 1, rhythm)
+        system_logger.info("Waveform data shape: %s, type: %s", ecg_data['raw_waveform_data'].shape, ecg_data['raw_waveform_data'].dtype)
+
     except Exception as e:
-        print(f"An error occurred during parsing: {exception_message(e)}")
-        traceback.print_exc()
+        system_logger.exception("An error occurred during parsing: %s", exception_message(e))
+
+### SPxml leads carry their label when available, otherwise they follow the standard 12-lead order ###
+def philips_lead_name(ecg, index):
+    for key in ("name", "label", "leadname"):
+        if ecg.get(key):
+            return ecg[key]
+    return CANONICAL_LEADS[index] if index < len(CANONICAL_LEADS) else None
+
+### Philips globalmeasurements mapped to measure_ecg fields (durations in ms) ###
+PHILIPS_GLOBAL_FIELDS = {
+    "heartrate": "heart_rate_bpm",
+    "rrint": "rr_ms",
+    "printerval": "pr_ms",
+    "qrsdur": "qrs_ms",
+    "qtint": "qt_ms",
+    "qtcb": "qtc_bazett_ms",
+    "qtcf": "qtc_fridericia_ms",
+}
+REPBEAT_SAMPLE_RATE = 500  # Hz of the representative beats when the file does not say
+
+### Device interval measurements: the file's global measurements (ms), else the repbeat fiducials ###
+def philips_vendor_measurements(rhythm_data, global_data=None):
+    """
+    Repbeat ponset / qonset / qend / tend are sample indexes into the representative beat (sampled at the repbeats'
+    `samplespersec`, 500 Hz by default), converted to ms here; the median over leads is used.
+    """
+
+    vendor = {}
+    for philips_field, field in PHILIPS_GLOBAL_FIELDS.items():
+        try:
+            value = float((global_data or {}).get(philips_field))
+        except (TypeError, ValueError):
+            continue
+        if value > 0:
+            vendor[field] = value
+
+    def fiducial(name):
+        values = []
+        for repbeat in rhythm_data:
+            try:
+                value = float(repbeat.get(name)) * 1000.0 / float(repbeat.get('sample_rate') or REPBEAT_SAMPLE_RATE)
+            except (TypeError, ValueError, ZeroDivisionError):
+                continue
+            if value >= 0:
+                values.append(value)
+        return float(np.median(values)) if values else None
+
+    p_onset, q_onset, q_end, t_end = fiducial("ponset"), fiducial("qonset"), fiducial("qend"), fiducial("tend")
+    if q_onset is not None:
+        if p_onset is not None and p_onset < q_onset:
+            vendor.setdefault("pr_ms", q_onset - p_onset)
+        if q_end is not None and q_end > q_onset:
+            vendor.setdefault("qrs_ms", q_end - q_onset)
+        if t_end is not None and t_end > q_onset:
+            vendor.setdefault("qt_ms", t_end - q_onset)
+    return vendor
 
 def philips_convert_to_matrix(xml_path):
 
     xml_ecgs = SPxml.getLeads(xml_path)
-    lead_data = [np.asarray(ecg["data"], dtype='float64') for ecg in xml_ecgs]
-    ecg_matrix = np.stack(lead_data, axis=-1)
-    print(f"Original matrix shape: {ecg_matrix.shape}")
+    lead_arrays = {philips_lead_name(ecg, index): np.asarray(ecg["data"], dtype='float64') for index, ecg in enumerate(xml_ecgs)}
+    ecg_matrix, _, _ = normalize_leads(lead_arrays)
+    system_logger.debug("Original matrix shape: %s", ecg_matrix.shape)
     ecg_matrix = resample_ecg_matrix(ecg_matrix)
-    print(f"Resample matrix shape:{ecg_matrix.shape}")
+    system_logger.debug("Resample matrix shape: %s", ecg_matrix.shape)
     return ecg_matrix
 
+### Measurements of a Philips file: computed on the resampled matrix, device values where present ###
+def philips_measurements(xml_path):
+
+    ecg_matrix = philips_convert_to_matrix(xml_path)
+    try:
+        ecg_data = parse_philips_xml(xml_path)
+        vendor = philips_vendor_measurements(ecg_data["rhythm_data"], ecg_data["global_measurements"])
+    except Exception as e:
+        system_logger.warning("Philips device measurements unavailable: %s", exception_message(e))
+        vendor = {}
+    return measure_ecg(ecg_matrix, sample_rate=500, vendor=vendor)
+
 if __name__ == "__main__":
 
     ## ge ##
@@ -274,6 +361,7 @@ if __name__ == "__main__":
     # ge(xml_path)
     # ecg_matrix = ge_convert_to_matrix(xml_path)
     # print(ecg_matrix)
+    # print(ge_measurements(xml_path))
 
     ## philips ##
     # svg: 1*12 #
@@ -287,6 +375,7 @@ if __name__ == "__main__":
     # philips(xml_path)
     # ecg_matrix = philips_convert_to_matrix(xml_path)
     # print(ecg_matrix)
+    # print(philips_measurements(xml_path))
 
     # ai analysis #
     # matrix_data = ecg_matrix.T
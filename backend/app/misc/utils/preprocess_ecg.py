@@ -0,0 +1,150 @@
+import logging
+import numpy as np
+import os
+import sys
+import time
+
+from functools import lru_cache
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.middleware.exception import exception_message
+from app.misc.utils.lead_normalize import CANONICAL_LEADS
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+BASELINE_CUTOFF_HZ = 0.5  # baseline wander lives below ~0.5 Hz
+NOTCH_QUALITY = 30.0
+
+FLATLINE_FRACTION = 0.8    # share of zero first-differences that marks a lead as flat
+SATURATION_FRACTION = 0.02 # share of samples stuck at a limit that marks a lead as saturated
+LEAD_OFF_FRACTION = 0.9    # share of NaN / exact-zero samples that marks a lead as disconnected
+NOISE_RATIO = 0.5          # var(diff) / var(signal) above which a lead is dominated by HF noise
+
+
+### Design the filter cascade once per (sample rate, powerline, enabled stages) ###
+@lru_cache(maxsize=16)
+def design_filters(sample_rate, powerline_hz=60, baseline=True, notch=True):
+    from scipy import signal
+
+    sections = []
+    if baseline:
+        sections.append(signal.butter(2, BASELINE_CUTOFF_HZ, btype="highpass", fs=sample_rate, output="sos"))
+    if notch and powerline_hz and powerline_hz < sample_rate / 2:
+        b, a = signal.iirnotch(powerline_hz, NOTCH_QUALITY, fs=sample_rate)
+        sections.append(signal.tf2sos(b, a))
+
+    if not sections:
+        return None
+
+    return np.vstack(sections)
+
+### Filter settings reported by GE MUSE are in hundredths of Hz for the high-pass ###
+def ge_filter_hz(high_pass_filter, low_pass_filter):
+    try:
+        high_pass_hz = float(high_pass_filter) / 100 if high_pass_filter else None
+    except ValueError:
+        high_pass_hz = None
+    try:
+        low_pass_hz = float(low_pass_filter) if low_pass_filter else None
+    except ValueError:
+        low_pass_hz = None
+    return high_pass_hz, low_pass_hz
+
+### Per-lead lower / upper limits from the FHIR lead metadata, scaled like the waveform ###
+def fhir_lead_limits(leads_data):
+
+    lower_limits = np.full(12, np.nan)
+    upper_limits = np.full(12, np.nan)
+    for index, lead in enumerate(CANONICAL_LEADS):
+        lead_info = leads_data.get(f"Lead {lead}") if leads_data else None
+        if not lead_info:
+            continue
+        meta = lead_info["metadata"]
+        lower_limits[index] = (meta["lowerLimit"] - meta["origin"]) * meta["factor"]
+        upper_limits[index] = (meta["upperLimit"] - meta["origin"]) * meta["factor"]
+
+    return lower_limits, upper_limits
+
+### 0 below start, 1 above stop, linear in between ###
+def _ramp(value, start, stop):
+    return np.clip((value - start) / (stop - start), 0, 1)
+
+### Vectorized quality metrics over all leads; ecg_matrix is (time, 12) ###
+def assess_signal_quality(ecg_matrix, filtered_matrix=None, lower_limits=None, upper_limits=None):
+
+    n_samples = ecg_matrix.shape[0]
+    nan_mask = np.isnan(ecg_matrix)
+    raw = np.where(nan_mask, 0.0, ecg_matrix)
+
+    lead_off = (nan_mask | (raw == 0)).sum(axis=0) / n_samples
+    flat = (np.diff(raw, axis=0) == 0).sum(axis=0) / max(n_samples - 1, 1)
+
+    if lower_limits is not None and upper_limits is not None:
+        span = np.abs(upper_limits - lower_limits)
+        tolerance = np.where(np.isfinite(span), span * 1e-3, 0.0)
+        lower = np.where(np.isfinite(lower_limits), lower_limits + tolerance, -np.inf)
+        upper = np.where(np.isfinite(upper_limits), upper_limits - tolerance, np.inf)
+        saturated = ((raw <= lower) | (raw >= upper)).sum(axis=0) / n_samples
+    else:  # without limits, clipping shows up as plateaus at the lead extremes
+        saturated = ((raw == raw.max(axis=0)) | (raw == raw.min(axis=0))).sum(axis=0) / n_samples
+
+    filtered = raw if filtered_matrix is None else filtered_matrix
+    variance = filtered.var(axis=0)
+    noise = np.divide(np.diff(filtered, axis=0).var(axis=0), variance, out=np.full(variance.shape, np.inf), where=variance > 0)
+
+    score = (1 - _ramp(lead_off, 0.5, LEAD_OFF_FRACTION)) \
+        * (1 - _ramp(flat, 0.5, FLATLINE_FRACTION)) \
+        * (1 - _ramp(saturated, SATURATION_FRACTION / 4, SATURATION_FRACTION)) \
+        * (1 - _ramp(noise, NOISE_RATIO / 5, NOISE_RATIO))
+
+    lead_off_flag = lead_off >= LEAD_OFF_FRACTION
+    flat_flag = flat >= FLATLINE_FRACTION
+    saturated_flag = saturated >= SATURATION_FRACTION
+    noisy_flag = noise >= NOISE_RATIO
+    score = np.where(lead_off_flag | flat_flag, 0.0, score)
+
+    return {
+        lead: {
+            "score": round(float(score[index]), 3),
+            "lead_off": bool(lead_off_flag[index]),
+            "flatline": bool(flat_flag[index]),
+            "saturated": bool(saturated_flag[index]),
+            "noisy": bool(noisy_flag[index]),
+        }
+        for index, lead in enumerate(CANONICAL_LEADS[:ecg_matrix.shape[1]])
+    }
+
+### Decide whether the recording is worth sending to the AI model ###
+def is_recording_usable(quality, min_score=0.5, min_usable_leads=8):
+    usable_leads = sum(1 for lead_quality in quality.values() if lead_quality["score"] >= min_score)
+    return usable_leads >= min_usable_leads
+
+### Baseline wander removal, powerline notch and signal quality in one pass over the 12-lead matrix ###
+def preprocess_ecg_matrix(ecg_matrix, sample_rate=500, lower_limits=None, upper_limits=None, powerline_hz=60, high_pass_hz=None, low_pass_hz=None):
+
+    start_time = time.perf_counter()
+
+    # skip stages the acquisition device already applied
+    baseline = not (high_pass_hz and high_pass_hz >= BASELINE_CUTOFF_HZ)
+    notch = not (low_pass_hz and powerline_hz and low_pass_hz < powerline_hz)
+
+    from scipy import signal
+
+    raw = np.nan_to_num(np.asarray(ecg_matrix, dtype=np.float64))
+    sos = design_filters(sample_rate, powerline_hz, baseline, notch)
+    try:
+        filtered_matrix = signal.sosfiltfilt(sos, raw, axis=0) if sos is not None else raw
+    except ValueError as e:  # recording too short for the filter padding
+        system_logger.warning("Skip filtering: %s", exception_message(e))
+        filtered_matrix = raw
+
+    quality = assess_signal_quality(ecg_matrix, filtered_matrix, lower_limits, upper_limits)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    return filtered_matrix, quality, elapsed_ms
+
+if __name__ == "__main__":
+    pass
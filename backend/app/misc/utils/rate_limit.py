@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.misc.utils.sqlite_store import thread_connection, Transaction
+
+
+ADMISSION_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'admission.sqlite3'))
+PRUNE_EVERY = 1024  # takes between sweeps of refilled buckets
+
+
+class MemoryLimiterStore():
+    """
+    Token buckets and concurrency slots of a single worker process.
+    A bucket that has refilled is the same as no bucket, so those are dropped every PRUNE_EVERY takes.
+    """
+
+    def __init__(self, prune_every=PRUNE_EVERY):
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._slots = set()
+        self._lock = threading.Lock()
+        self._takes = 0
+        self.prune_every = prune_every
+
+    ### Take `cost` tokens from the bucket `key`; returns (allowed, retry_after_seconds) ###
+    def take(self, key, rate, capacity, cost=1.0):
+
+        now = time.monotonic()
+        with self._lock:
+            self._takes += 1
+            if self._takes % self.prune_every == 0:
+                self._buckets = {bucket: state for bucket, state in self._buckets.items() if state[2] > now}
+
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return (True, 0.0) if allowed else (False, (cost - tokens) / rate)
+
+    def acquire_slot(self, limit, lease_seconds):
+        with self._lock:
+            if len(self._slots) >= limit:
+                return None
+            slot_id = uuid.uuid4().hex
+            self._slots.add(slot_id)
+            return slot_id
+
+    def release_slot(self, slot_id):
+        with self._lock:
+            self._slots.discard(slot_id)
+
+
+class SQLiteLimiterStore():
+    """
+    Token buckets and concurrency slots shared by all workers on the host through one SQLite file (WAL mode).
+    Slots are leases, so a crashed worker's slots expire instead of leaking; buckets record when they are full
+    again (`full_at`) and refilled ones are deleted every PRUNE_EVERY takes of a worker.
+    """
+
+    def __init__(self, path=ADMISSION_DB_PATH, prune_every=PRUNE_EVERY):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        self.prune_every = prune_every
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("DROP TABLE IF EXISTS buckets")  # pre-`full_at` layout; bucket state is disposable
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS slots (id TEXT PRIMARY KEY, expires REAL NOT NULL)")
+
+    def _connect(self):
+        return Transaction(thread_connection(self._local, self.path))
+
+    def take(self, key, rate, capacity, cost=1.0):
+
+        now = time.time()  # wall clock: shared between processes
+        self._takes += 1
+        with self._connect() as conn:
+            if self._takes % self.prune_every == 0:
+                conn.execute("DELETE FROM token_buckets WHERE full_at <= ?", (now,))
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (capacity - tokens) / rate)
+            )
+        return (True, 0.0) if allowed else (False, (cost - tokens) / rate)
+
+    def acquire_slot(self, limit, lease_seconds):
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM slots WHERE expires < ?", (now,))
+            (in_use,) = conn.execute("SELECT COUNT(*) FROM slots").fetchone()
+            if in_use >= limit:
+                return None
+            slot_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO slots (id, expires) VALUES (?, ?)", (slot_id, now + lease_seconds))
+        return slot_id
+
+    def release_slot(self, slot_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+
+
+### Limiter state configured from settings ###
+def create_limiter_store(backend="memory", path=None):
+    if backend == "sqlite":
+        return SQLiteLimiterStore(path or ADMISSION_DB_PATH)
+    if backend == "memory":
+        return MemoryLimiterStore()
+    raise ValueError(f"Unsupported admission backend: {backend}")
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import numpy as np
+import os
+import re
+import sys
+import threading
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: metadata updates are serialized within one worker process
+    fcntl = None
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.misc.utils.ecg_codec import decode_matrix, encode_matrix, is_lossless
+
+
+RECORD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'record'))
+os.makedirs(RECORD_DIR, exist_ok=True)
+
+RECORD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+_meta_lock = threading.Lock()
+
+
+### Record id is used as a file name, so reject anything that could escape the directory ###
+def is_valid_record_id(record_id):
+    return bool(RECORD_ID_PATTERN.match(record_id)) and record_id not in (".", "..")
+
+### Paths of the files belonging to one record ###
+def matrix_path(record_id):
+    return os.path.join(RECORD_DIR, f"{record_id}.npy")
+
+def encoded_matrix_path(record_id):
+    return os.path.join(RECORD_DIR, f"{record_id}.ecg")
+
+def meta_path(record_id):
+    return os.path.join(RECORD_DIR, f"{record_id}.meta.json")
+
+def beat_path(record_id):
+    return os.path.join(RECORD_DIR, f"{record_id}.beat.npy")
+
+def record_exists(record_id):
+    return os.path.exists(meta_path(record_id))
+
+### Save the resampled matrix and its metadata so the record can be re-rendered later ###
+def save_record(record_id, ecg_matrix, metadata=None, sample_rate=500, measurements=None, beat_template=None, beat_r_index=None, codec="npy", resolution=0.001):
+    """
+    codec: "ecg" stores the matrix with app.misc.utils.ecg_codec at `resolution` (the source step, in the matrix
+    units), "npy" as raw float64. A matrix the codec would not give back exactly (e.g. resampled from another
+    rate) is stored as npy. The digest covers the stored bytes, so renditions are keyed on what is read back.
+    """
+
+    ecg_matrix = np.ascontiguousarray(ecg_matrix)
+    if codec == "ecg" and not is_lossless(ecg_matrix, resolution):
+        codec = "npy"
+    if codec == "ecg":
+        payload = encode_matrix(ecg_matrix, resolution)
+        with open(encoded_matrix_path(record_id), "wb") as f:
+            f.write(payload)
+        matrix_digest = hashlib.sha256(payload).hexdigest()
+    else:
+        np.save(matrix_path(record_id), ecg_matrix, allow_pickle=False)
+        matrix_digest = hashlib.sha256(ecg_matrix.tobytes()).hexdigest()
+    if beat_template is not None:
+        save_beat(record_id, beat_template)
+
+    meta = {
+        "record_id": record_id,
+        "shape": list(ecg_matrix.shape),
+        "sample_rate": sample_rate,
+        "codec": codec,
+        "matrix_digest": matrix_digest,
+        "metadata": metadata or {},
+        "measurements": measurements,
+        "beat": {"samples": int(beat_template.shape[0]), "r_index": beat_r_index} if beat_template is not None else None
+    }
+    with meta_lock(record_id):
+        write_meta(record_id, meta)
+
+    return meta
+
+### Replace the metadata file atomically so readers never see a partial write ###
+def write_meta(record_id, meta):
+    path = meta_path(record_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+### Serializes writers of a record's metadata: a lock between threads, an flock on `<record_id>.meta.lock` between workers ###
+@contextmanager
+def meta_lock(record_id):
+    with _meta_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(RECORD_DIR, f"{record_id}.meta.lock"), "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+### Add fields to the metadata of a stored record (e.g. the upload's storage key and AI result) ###
+def update_meta(record_id, **fields):
+    with meta_lock(record_id):
+        meta = load_meta(record_id)
+        if meta is None:
+            return None
+
+        meta.update(fields)
+        write_meta(record_id, meta)
+    return meta
+
+### Attach measurements to a record stored before they were computed at ingestion ###
+def save_measurements(record_id, measurements):
+    return update_meta(record_id, measurements=measurements)
+
+### (record_id, last modified timestamp) of every stored record changed at or after `since`, in directory order ###
+def iter_records(since=None):
+    with os.scandir(RECORD_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".meta.json"):
+                continue
+            try:
+                modified = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if since is None or modified >= since:
+                yield entry.name[:-len(".meta.json")], modified
+
+### Load record metadata (cheap, no waveform) ###
+def load_meta(record_id):
+    path = meta_path(record_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+### Median beat template, (window samples, leads) float32 (~10 % of the 10 s matrix) ###
+def save_beat(record_id, beat_template):
+    np.save(beat_path(record_id), np.ascontiguousarray(beat_template, dtype=np.float32), allow_pickle=False)
+
+def load_beat(record_id):
+    path = beat_path(record_id)
+    if not os.path.exists(path):
+        return None
+
+    return np.load(path, allow_pickle=False)
+
+### Load the stored resampled matrix (codec-encoded, or .npy for records stored without the codec) ###
+def load_matrix(record_id):
+    try:
+        with open(encoded_matrix_path(record_id), "rb") as f:
+            return decode_matrix(f.read())
+    except FileNotFoundError:
+        pass
+
+    path = matrix_path(record_id)
+    if not os.path.exists(path):
+        return None
+
+    return np.load(path, allow_pickle=False)
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import fcntl
+except ImportError:  # Windows: deduplication stays within one worker process
+    fcntl = None
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.middleware.exception import exception_message
+
+
+system_logger = logging.getLogger('custom.error')
+
+SINGLE_FLIGHT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'singleflight'))
+
+
+class SingleFlight():
+    """
+    Runs one computation per key at a time and hands its outcome to every concurrent caller.
+
+    Within a worker, callers of the same key await one shared task. Across workers, the computing worker holds
+    an flock on `<key>.lock` (released by the OS if it dies) and leaves its outcome in `<key>.result` for
+    `result_ttl` seconds; other workers wait for the lock and then read that result instead of recomputing.
+    Exceptions of the `cacheable` types are shared like results; any other failure is not, so a waiting worker
+    retries the computation itself.
+    """
+
+    def __init__(self, directory=SINGLE_FLIGHT_DIR, result_ttl=300, lock_timeout=120, poll_interval=0.05, cacheable=()):
+        self.directory = directory
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.cacheable = tuple(cacheable)
+        self._flights = {}
+        self._writes = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    ### Await `func(*args)` (a coroutine function) once per key ###
+    async def do(self, key, func, *args):
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._lead(key, func, *args))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            system_logger.info("Joined in-flight computation for %s", key)
+
+        # a caller that disconnects must not cancel the computation the others are waiting for
+        return await asyncio.shield(flight)
+
+    async def _lead(self, key, func, *args):
+
+        cached = await run_in_threadpool(self._load_result, key)
+        if cached is not None:
+            return self._unwrap(cached)
+
+        if fcntl is None:
+            return await func(*args)
+
+        lock_file = await self._acquire_lock(key)
+        try:
+            if lock_file is not None:
+                # another worker may have finished while this one was waiting for the lock
+                cached = await run_in_threadpool(self._load_result, key)
+                if cached is not None:
+                    return self._unwrap(cached)
+
+            try:
+                value = await func(*args)
+            except self.cacheable as e:
+                await run_in_threadpool(self._store_result, key, (False, e))
+                raise
+            await run_in_threadpool(self._store_result, key, (True, value))
+            return value
+
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    ### Non-blocking flock polled from the event loop; None after lock_timeout (then the work is done unlocked) ###
+    async def _acquire_lock(self, key):
+
+        lock_file = open(self._path(key, ".lock"), "a+b")
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    system_logger.warning("Single-flight lock for %s timed out, computing without it", key)
+                    lock_file.close()
+                    return None
+                await asyncio.sleep(self.poll_interval)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _load_result(self, key):
+        path = self._path(key, ".result")
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            system_logger.warning("Unreadable single-flight result %s: %s", path, exception_message(e))
+            return None
+
+    def _store_result(self, key, outcome):
+        path = self._path(key, ".result")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(outcome, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    ### Drop results past their TTL and locks nobody holds any more ###
+    def _prune(self):
+        now = time.time()
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            try:
+                if now - os.path.getmtime(path) > max(self.result_ttl, self.lock_timeout) * 2:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _unwrap(outcome):
+        ok, value = outcome
+        if ok:
+            return value
+        raise value
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+
+### Connection of the calling thread to a SQLite file in WAL mode, shared by the worker processes of the host ###
+def thread_connection(local, path):
+    """`local` is the store's threading.local(); sqlite3 connections must not cross threads."""
+
+    conn = getattr(local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        local.conn = conn
+    return conn
+
+
+class Transaction():
+    """BEGIN IMMEDIATE ... COMMIT, so a read-modify-write is atomic across processes."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.configs.config import basicSettings
+from app.middleware.exception import exception_message
+from app.misc.utils.compression import compress, decompress, zstd_available
+
+
+system_logger = logging.getLogger('custom.error')
+
+UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'json'))
+
+COMPRESSION_SUFFIX = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+
+### Stored objects carry their compression in the key suffix, so reads stay transparent when the setting changes ###
+def decompress_object(data, key):
+    if key.endswith(".zst"):
+        return decompress(data, "zstd")
+    if key.endswith(".gz"):
+        return decompress(data, "gzip")
+    return data
+
+### Content-addressed, sharded key: ab/cd/<sha256>.json[.zst] ###
+def content_key(digest, suffix=".json", compression="none"):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}{COMPRESSION_SUFFIX[compression]}"
+
+
+class StorageBackend():
+    """Raw blob storage. Keys are '/' separated relative paths."""
+
+    def put(self, key, data):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def touch(self, key):
+        """Set the modified time of `key` to now; False when it does not exist."""
+        raise NotImplementedError
+
+    def iter_objects(self):
+        """Yield (key, size, modified_timestamp)."""
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # atomic: readers never see a partial file
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, key):
+        try:
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_objects(self):
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if file_name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, "/"), stat.st_size, stat.st_mtime
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible object storage; point endpoint_url at MinIO / a local stand-in for testing."""
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, access_key=None, secret_key=None, region=None):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region)
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def get(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    ### S3 has no utime: an in-place copy with replaced metadata sets LastModified ###
+    def touch(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=self.prefix + key,
+                CopySource={"Bucket": self.bucket, "Key": self.prefix + key},
+                MetadataDirective="REPLACE"
+            )
+            return True
+        except ClientError:
+            return False
+
+    def iter_objects(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):], item["Size"], item["LastModified"].timestamp()
+
+
+class BlobStore():
+    """Content-hash named, optionally compressed uploads on top of a StorageBackend."""
+
+    def __init__(self, backend, compression="none", suffix=".json"):
+        if compression not in COMPRESSION_SUFFIX:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.backend = backend
+        self.compression = compression
+        self.suffix = suffix
+
+    def put(self, data, digest=None):
+        digest = digest or hashlib.sha256(data).hexdigest()
+        key = content_key(digest, self.suffix, self.compression)
+        # identical content is stored once; a re-upload refreshes its age so retention does not evict it as old
+        if not self.backend.touch(key):
+            self.backend.put(key, compress(data, self.compression))
+        return key
+
+    def get(self, key):
+        data = self.backend.get(key)
+        return None if data is None else decompress_object(data, key)
+
+    async def put_async(self, data, digest=None):
+        return await run_in_threadpool(self.put, data, digest)
+
+    async def get_async(self, key):
+        return await run_in_threadpool(self.get, key)
+
+    ### Retention: drop objects older than max_age_seconds, then the oldest until under max_bytes ###
+    def evict(self, max_age_seconds=None, max_bytes=None):
+
+        now = time.time()
+        kept, removed = [], 0
+        for key, size, modified in self.backend.iter_objects():
+            if max_age_seconds and now - modified > max_age_seconds:
+                self.backend.delete(key)
+                removed += 1
+            else:
+                kept.append((modified, size, key))
+
+        if max_bytes:
+            kept.sort()
+            total = sum(size for _, size, _ in kept)
+            for _, size, key in kept:
+                if total <= max_bytes:
+                    break
+                self.backend.delete(key)
+                total -= size
+                removed += 1
+
+        return removed
+
+
+_blob_store = None
+
+### Storage configured from settings, one per worker ###
+def get_blob_store():
+
+    global _blob_store
+    if _blob_store is None:
+        if basicSettings.STORAGE_BACKEND == "s3":
+            backend = S3Storage(
+                bucket=basicSettings.S3_BUCKET,
+                prefix=basicSettings.S3_PREFIX,
+                endpoint_url=basicSettings.S3_ENDPOINT_URL,
+                access_key=basicSettings.S3_ACCESS_KEY,
+                secret_key=basicSettings.S3_SECRET_KEY,
+                region=basicSettings.S3_REGION
+            )
+        else:
+            backend = LocalStorage(basicSettings.STORAGE_LOCAL_DIR or UPLOAD_DIR)
+        compression = basicSettings.STORAGE_COMPRESSION
+        if compression == "zstd" and not zstd_available():
+            system_logger.warning("zstandard is not installed, storing uploads gzip-compressed instead")
+            compression = "gzip"
+        _blob_store = BlobStore(backend, compression=compression)
+
+    return _blob_store
+
+### Periodic retention sweep, run off the event loop ###
+async def retention_loop(interval_seconds=3600):
+
+    max_age_seconds = basicSettings.STORAGE_RETENTION_DAYS * 86400 if basicSettings.STORAGE_RETENTION_DAYS else None
+    max_bytes = basicSettings.STORAGE_MAX_BYTES or None
+    if not max_age_seconds and not max_bytes:
+        return
+
+    while True:
+        try:
+            removed = await run_in_threadpool(get_blob_store().evict, max_age_seconds, max_bytes)
+            if removed:
+                system_logger.info("Storage retention removed %d objects", removed)
+        except Exception as e:
+            system_logger.error("Storage retention failed: %s", exception_message(e))
+        await asyncio.sleep(interval_seconds)
+
+if __name__ == "__main__":
+    pass
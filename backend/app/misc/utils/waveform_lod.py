@@ -0,0 +1,93 @@
+import numpy as np
+import os
+import sys
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.misc.utils.record_store import RECORD_DIR
+
+
+SCALE_UV = 1.0       # µV per count of the int16 samples served to viewers (±32.7 mV)
+MIN_BUCKETS = 64     # the coarsest pyramid level still has this many buckets
+
+
+### Paths of the precomputed pyramid (int16, all levels stacked: (buckets, 2 [min, max], leads)) ###
+def pyramid_path(record_id):
+    return os.path.join(RECORD_DIR, f"{record_id}.lod.npy")
+
+### mV -> int16 counts of SCALE_UV ###
+def quantize(ecg_matrix):
+    return np.clip(np.rint(np.asarray(ecg_matrix, dtype=np.float64) * (1000.0 / SCALE_UV)), -32768, 32767).astype(np.int16)
+
+### Buckets per level: level k (k >= 1) has one bucket per 2**k samples ###
+def level_lengths(n_samples):
+    lengths = []
+    length = n_samples
+    while length > MIN_BUCKETS:
+        length = (length + 1) // 2
+        lengths.append(length)
+    return lengths
+
+### Min / max decimation pyramid of a (samples, leads) matrix, each level reduced pairwise from the previous one ###
+def build_pyramid(ecg_matrix):
+
+    samples = quantize(ecg_matrix)
+    lows, highs = samples, samples
+    levels = []
+    for _ in level_lengths(samples.shape[0]):
+        if lows.shape[0] % 2:  # odd length: repeat the last bucket so it pairs with itself
+            lows, highs = np.concatenate([lows, lows[-1:]]), np.concatenate([highs, highs[-1:]])
+        lows = lows.reshape(-1, 2, lows.shape[1]).min(axis=1)
+        highs = highs.reshape(-1, 2, highs.shape[1]).max(axis=1)
+        levels.append(np.stack([lows, highs], axis=1))
+
+    if not levels:
+        return np.empty((0, 2, samples.shape[1]), dtype=np.int16)
+    return np.concatenate(levels)
+
+def save_pyramid(record_id, pyramid):
+    path = pyramid_path(record_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+    np.save(tmp_path, pyramid, allow_pickle=False)
+    os.replace(tmp_path, path)
+
+### Memory-mapped, so a view reads only the buckets it returns ###
+def load_pyramid(record_id):
+    try:
+        return np.load(pyramid_path(record_id), mmap_mode="r", allow_pickle=False)
+    except FileNotFoundError:
+        return None
+
+### Points of samples [start, end) for a viewer `width` pixels wide: raw samples when they fit, else min/max buckets ###
+def waveform_view(ecg_matrix, pyramid, start, end, width, lead_indexes=None):
+    """
+    Returns (data, bucket, first_sample): data is int16 (leads, points). With bucket == 1 the points are the samples
+    from first_sample on; otherwise bucket j covers samples first_sample + j * bucket ... + bucket and contributes
+    points 2j (min) and 2j + 1 (max). The coarsest level with at least `width` buckets over the range is used.
+    """
+
+    n_samples = ecg_matrix.shape[0]
+    start, end = max(0, start), min(n_samples, end)
+    if end <= start:
+        raise ValueError("Empty time range")
+    lead_indexes = list(range(ecg_matrix.shape[1])) if lead_indexes is None else lead_indexes
+
+    lengths = level_lengths(n_samples)
+    level = min(int(np.log2((end - start) / width)), len(lengths)) if end - start > 2 * width else 0
+    if level == 0:
+        return np.ascontiguousarray(quantize(ecg_matrix[start:end, lead_indexes]).T), 1, start
+
+    offset = sum(lengths[:level - 1])
+    bucket = 1 << level
+    first, last = start >> level, -(-end // bucket)
+    buckets = pyramid[offset + first:offset + last][:, :, lead_indexes]  # (buckets, 2, leads)
+    return np.ascontiguousarray(buckets.reshape(-1, len(lead_indexes)).T), bucket, first * bucket
+
+### Delta encoding for JSON: first value, then differences (small integers, short to write and compress well) ###
+def delta_encode(data):
+    deltas = np.diff(data.astype(np.int32), axis=1, prepend=0)
+    return deltas.tolist()
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import os
+import random
+import secrets
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from datetime import datetime, timezone
+from fastapi.concurrency import run_in_threadpool
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.core.tracing import inject_trace_headers, start_span
+from app.middleware.exception import exception_message
+from app.misc.utils.fast_json import dumps, loads
+from app.misc.utils.sqlite_store import thread_connection, Transaction
+
+
+system_logger = logging.getLogger('custom.error')
+
+WEBHOOK_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'file', 'webhooks.sqlite3'))
+
+WEBHOOK_EVENTS = ("ecg.analyzed",)
+SIGNATURE_HEADER = "X-Webhook-Signature"   # "v1=<hex HMAC-SHA256 of '<timestamp>.<body>' with the subscription secret>"
+TIMESTAMP_HEADER = "X-Webhook-Timestamp"
+DELIVERY_HEADER = "X-Webhook-Delivery"
+
+
+### Envelope of one event; `id` lets receivers drop redeliveries (delivery is at least once) ###
+def webhook_event(event_type, data):
+    return {
+        "id": uuid.uuid4().hex,
+        "type": event_type,
+        "created": datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        "data": data,
+    }
+
+### Signature header value of a request body; receivers recompute it to authenticate the sender and reject replays by timestamp ###
+def sign_payload(secret, timestamp, body):
+    return "v1=" + hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("ascii") + body, hashlib.sha256).hexdigest()
+
+### Callback URLs only reach public hosts: events carry PHI, and the POST must not be pointed at internal services ###
+async def check_callback_url(url, allow_http=False):
+    """
+    Raises ValueError unless the URL is absolute https (or http with allow_http) and every address its host resolves
+    to is public; returns the first of them. Checked at registration and again before each delivery, which connects
+    to the returned address (see pinned_request), so the host cannot be re-pointed between check and connect;
+    redirects are not followed.
+    """
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise ValueError("The callback URL is not a valid URL.")
+    schemes = ("https", "http") if allow_http else ("https",)
+    if parts.scheme not in schemes or not parts.hostname:
+        raise ValueError(f"The callback URL must be an absolute {' or '.join(schemes)} URL.")
+
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except OSError:
+        raise ValueError(f"The callback host {parts.hostname} cannot be resolved.")
+    for *_, sockaddr in addresses:
+        if not is_public_address(sockaddr[0]):
+            raise ValueError(f"The callback host {parts.hostname} resolves to a non-public address ({sockaddr[0]}).")
+    return addresses[0][4][0]
+
+### (url, headers, extensions) of a request sent to the checked `address` instead of resolving the host again ###
+def pinned_request(url, address, headers):
+    """The Host header keeps virtual hosting working and `sni_hostname` keeps TLS SNI and certificate checks on the name."""
+
+    import httpx
+
+    url = httpx.URL(url)
+    host = url.netloc.decode("ascii")
+    extensions = {"sni_hostname": url.host} if url.scheme == "https" else {}
+    return url.copy_with(host=address.split("%")[0]), {**headers, "Host": host}, extensions
+
+def is_public_address(address):
+    ip = ipaddress.ip_address(address.split("%")[0])  # IPv6 scope id
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (ip.is_loopback or ip.is_link_local or ip.is_private or ip.is_reserved or ip.is_multicast or ip.is_unspecified)
+
+### Delay before retry `attempt` (1-based): exponential with jitter, capped, never shorter than Retry-After ###
+def retry_delay(attempt, backoff, max_backoff, retry_after=None):
+    delay = min(max_backoff, backoff * 2 ** (attempt - 1)) * (0.5 + random.random())
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+class WebhookStore():
+    """
+    Subscriptions and the outbox of undelivered events in one SQLite file (WAL mode), shared by the workers of the
+    host and kept across restarts. A dispatcher claims a batch by leasing its rows, so a worker that dies mid-delivery
+    only delays the batch until the lease expires. Leased batches per subscription are counted across all workers.
+    """
+
+    def __init__(self, path=WEBHOOK_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS subscriptions (id TEXT PRIMARY KEY, owner TEXT NOT NULL, url TEXT NOT NULL, secret TEXT NOT NULL, events TEXT NOT NULL, created REAL NOT NULL, active INTEGER NOT NULL DEFAULT 1, delivered INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, last_error TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS subscriptions_owner ON subscriptions (owner)")
+            conn.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, subscription_id TEXT NOT NULL, payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, lease_until REAL NOT NULL DEFAULT 0, batch TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt)")
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_batch ON outbox (batch)")
+
+    def _connect(self):
+        return Transaction(thread_connection(self._local, self.path))
+
+    ### Subscriptions ###
+    def add_subscription(self, owner, url, events=WEBHOOK_EVENTS, secret=None):
+        subscription = {"id": uuid.uuid4().hex, "owner": owner, "url": url, "secret": secret or secrets.token_urlsafe(32), "events": list(events), "created": time.time()}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO subscriptions (id, owner, url, secret, events, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (subscription["id"], owner, url, subscription["secret"], ",".join(subscription["events"]), subscription["created"])
+            )
+        return subscription
+
+    ### Subscriptions of `owner` with their delivery state (secrets are only returned at creation) ###
+    def list_subscriptions(self, owner):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, url, events, created, active, delivered, failed, last_error FROM subscriptions WHERE owner = ? ORDER BY created", (owner,)).fetchall()
+            pending = dict(conn.execute("SELECT subscription_id, COUNT(*) FROM outbox WHERE subscription_id IN (SELECT id FROM subscriptions WHERE owner = ?) GROUP BY subscription_id", (owner,)).fetchall())
+        return [
+            {"id": id_, "url": url, "events": events.split(","), "created": created, "active": bool(active), "delivered": delivered, "failed": failed, "pending": pending.get(id_, 0), "last_error": last_error}
+            for id_, url, events, created, active, delivered, failed, last_error in rows
+        ]
+
+    def delete_subscription(self, owner, subscription_id):
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM subscriptions WHERE id = ? AND owner = ?", (subscription_id, owner)).rowcount
+            if deleted:
+                conn.execute("DELETE FROM outbox WHERE subscription_id = ?", (subscription_id,))
+        return bool(deleted)
+
+    ### Outbox: one row per active subscription of `owner` to the event's type; returns the number queued ###
+    def enqueue(self, owner, event):
+        payload = dumps(event).decode("utf-8")
+        now = time.time()
+        with self._connect() as conn:
+            subscription_ids = [id_ for id_, events in conn.execute("SELECT id, events FROM subscriptions WHERE owner = ? AND active = 1", (owner,)).fetchall() if event["type"] in events.split(",")]
+            conn.executemany("INSERT INTO outbox (subscription_id, payload, next_attempt) VALUES (?, ?, ?)", [(id_, payload, now) for id_ in subscription_ids])
+        return len(subscription_ids)
+
+    ### Lease due events as batches of up to batch_size per subscription, at most max_in_flight leased batches each ###
+    def claim(self, batch_size, max_in_flight, lease_seconds, limit=1000):
+
+        now = time.time()
+        batches = []
+        with self._connect() as conn:
+            in_flight = dict(conn.execute("SELECT subscription_id, COUNT(DISTINCT batch) FROM outbox WHERE lease_until > ? GROUP BY subscription_id", (now,)).fetchall())
+            due = conn.execute("SELECT id, subscription_id, payload FROM outbox WHERE next_attempt <= ? AND lease_until <= ? ORDER BY id LIMIT ?", (now, now, limit)).fetchall()
+
+            rows_by_subscription = {}
+            for id_, subscription_id, payload in due:
+                rows_by_subscription.setdefault(subscription_id, []).append((id_, payload))
+
+            for subscription_id, rows in rows_by_subscription.items():
+                subscription = conn.execute("SELECT url, secret FROM subscriptions WHERE id = ?", (subscription_id,)).fetchone()
+                if subscription is None:
+                    continue
+                free = max(0, max_in_flight - in_flight.get(subscription_id, 0))
+                for start in range(0, min(len(rows), free * batch_size), batch_size):
+                    batch, rows_of_batch = uuid.uuid4().hex, rows[start:start + batch_size]
+                    conn.executemany("UPDATE outbox SET batch = ?, lease_until = ? WHERE id = ?", [(batch, now + lease_seconds, id_) for id_, _ in rows_of_batch])
+                    batches.append({"batch": batch, "subscription_id": subscription_id, "url": subscription[0], "secret": subscription[1], "events": [loads(payload) for _, payload in rows_of_batch]})
+        return batches
+
+    def complete(self, batch, subscription_id):
+        with self._connect() as conn:
+            delivered = conn.execute("DELETE FROM outbox WHERE batch = ?", (batch,)).rowcount
+            conn.execute("UPDATE subscriptions SET delivered = delivered + ?, last_error = NULL WHERE id = ?", (delivered, subscription_id))
+
+    ### Release a failed batch for its next attempt; events out of attempts are dropped. Returns the number dropped ###
+    def fail(self, batch, subscription_id, error, max_attempts, delay):
+        """`delay(attempt)` gives the seconds until the next attempt of an event that has failed `attempt` times."""
+
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, attempts FROM outbox WHERE batch = ?", (batch,)).fetchall()
+            dropped = {id_ for id_, attempts in rows if attempts + 1 >= max_attempts}
+            conn.executemany("UPDATE outbox SET attempts = ?, next_attempt = ?, lease_until = 0, batch = NULL WHERE id = ?", [(attempts + 1, now + delay(attempts + 1), id_) for id_, attempts in rows if id_ not in dropped])
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(id_,) for id_ in dropped])
+            conn.execute("UPDATE subscriptions SET failed = failed + ?, last_error = ? WHERE id = ?", (len(dropped), error, subscription_id))
+        return len(dropped)
+
+    ### Receiver answered 410 Gone: stop delivering to it ###
+    def deactivate(self, subscription_id, error):
+        with self._connect() as conn:
+            conn.execute("UPDATE subscriptions SET active = 0, last_error = ? WHERE id = ?", (error, subscription_id))
+            conn.execute("DELETE FROM outbox WHERE subscription_id = ?", (subscription_id,))
+
+    def pending(self):
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM outbox").fetchone()
+        return count
+
+
+class WebhookDispatcher():
+    """
+    Pushes events to the callback URLs of the subscriptions in a WebhookStore.
+      - coalescing: events queued within `flush_interval` s go to a destination as one POST of up to `batch_size`
+      - signed:     each POST carries an HMAC-SHA256 of timestamp and body under the subscription's secret
+      - pooled:     one keep-alive HTTP client per worker
+      - limits:     at most `max_in_flight` concurrent POSTs per destination (host-wide, through the leases)
+      - retries:    any failure is retried with exponential backoff (Retry-After honoured) from the outbox, so retries
+                    survive restarts; events are dropped after `max_attempts`, a 410 Gone deactivates the subscription
+    Pass `transport` (e.g. httpx.MockTransport) to run against stubs.
+    """
+
+    def __init__(
+        self,
+        store,
+        batch_size=50,
+        flush_interval=1.0,
+        poll_interval=5.0,
+        max_in_flight=2,
+        max_attempts=10,
+        backoff=5.0,
+        max_backoff=3600.0,
+        timeout=10.0,
+        allow_http=False,
+        transport=None,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.allow_http = allow_http
+        self.lease_seconds = timeout + 30.0
+        self._transport = transport
+        self._client = None
+        self._queued = asyncio.Event()
+        self._deliveries = set()
+        self._pending = 0
+        self.stats = {"queued": 0, "delivered": 0, "failed": 0, "dropped": 0, "requests": 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+        return self._client
+
+    ### Queue an event for the subscriptions of `owner` (one SQLite write, off the event loop) ###
+    async def notify(self, owner, event_type, data):
+        queued = await run_in_threadpool(self.store.enqueue, owner, webhook_event(event_type, data))
+        if queued:
+            self.stats["queued"] += queued
+            self._queued.set()
+        return queued
+
+    ### Outbox length at the last dispatch (for readiness reports, no I/O) ###
+    def pending(self):
+        return self._pending
+
+    ### Background loop: dispatch flush_interval after new events, and every poll_interval for due retries ###
+    async def run(self):
+
+        while True:
+            try:
+                await asyncio.wait_for(self._queued.wait(), self.poll_interval)
+                await asyncio.sleep(self.flush_interval)  # events of a burst share the POST to each destination
+            except asyncio.TimeoutError:
+                pass
+            self._queued.clear()
+
+            try:
+                await self.dispatch()
+            except Exception as e:
+                system_logger.error("Webhook dispatch failed: %s", exception_message(e))
+
+    ### Lease the due batches and start their deliveries ###
+    async def dispatch(self):
+
+        batches = await run_in_threadpool(self.store.claim, self.batch_size, self.max_in_flight, self.lease_seconds)
+        for batch in batches:
+            task = asyncio.create_task(self._deliver(batch))
+            self._deliveries.add(task)
+            task.add_done_callback(self._delivered)
+        self._pending = await run_in_threadpool(self.store.pending)
+
+    def _delivered(self, task):
+        self._deliveries.discard(task)
+        if not task.cancelled():
+            self._queued.set()  # the destination has a free slot for its next batch
+
+    ### One signed POST of a batch; the outcome is written back to the outbox ###
+    async def _deliver(self, batch):
+
+        body = dumps({"delivery": batch["batch"], "events": batch["events"]})
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "smart-ecg-webhooks",
+            DELIVERY_HEADER: batch["batch"],
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign_payload(batch["secret"], timestamp, body),
+        }
+
+        retry_after = None
+        try:
+            address = await check_callback_url(batch["url"], self.allow_http)
+            url, headers, extensions = pinned_request(batch["url"], address, headers)
+            with start_span("POST webhook", kind="client", **{"http.method": "POST", "http.url": batch["url"], "webhook.events": len(batch["events"])}) as span:
+                response = await self.client.post(url, content=body, headers=inject_trace_headers(headers), extensions=extensions)
+                span.set_attribute("http.status_code", response.status_code)
+            self.stats["requests"] += 1
+
+            if response.status_code < 300:
+                await run_in_threadpool(self.store.complete, batch["batch"], batch["subscription_id"])
+                self.stats["delivered"] += len(batch["events"])
+                return
+            if response.status_code == 410:
+                system_logger.warning("Webhook %s answered 410 Gone, subscription %s deactivated", batch["url"], batch["subscription_id"])
+                await run_in_threadpool(self.store.deactivate, batch["subscription_id"], "HTTP 410")
+                return
+            error = f"HTTP {response.status_code}"
+            retry_after = response.headers.get("Retry-After")
+
+        except Exception as e:  # any failure (refused host, transport, outbox write) counts as an attempt
+            error = exception_message(e)
+
+        delay = lambda attempt: retry_delay(attempt, self.backoff, self.max_backoff, retry_after)
+        dropped = await run_in_threadpool(self.store.fail, batch["batch"], batch["subscription_id"], error, self.max_attempts, delay)
+        self.stats["failed"] += len(batch["events"])
+        self.stats["dropped"] += dropped
+        if dropped:
+            system_logger.error("Webhook %s: %d events dropped after %d attempts (%s)", batch["url"], dropped, self.max_attempts, error)
+        else:
+            system_logger.warning("Webhook %s failed (%s), %d events kept for retry", batch["url"], error, len(batch["events"]))
+
+    ### Stop: deliveries in progress are cancelled (their leases expire and they are resent), connections released ###
+    async def aclose(self):
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_webhook_dispatcher = None
+
+### Dispatcher configured from settings, one per worker over the host's outbox ###
+def get_webhook_dispatcher():
+
+    global _webhook_dispatcher
+    if _webhook_dispatcher is None:
+        from app.configs.config import basicSettings
+
+        _webhook_dispatcher = WebhookDispatcher(
+            WebhookStore(basicSettings.WEBHOOK_DB_PATH or WEBHOOK_DB_PATH),
+            batch_size=basicSettings.WEBHOOK_BATCH_SIZE,
+            flush_interval=basicSettings.WEBHOOK_FLUSH_SECONDS,
+            max_in_flight=basicSettings.WEBHOOK_MAX_IN_FLIGHT,
+            max_attempts=basicSettings.WEBHOOK_MAX_ATTEMPTS,
+            backoff=basicSettings.WEBHOOK_BACKOFF_SECONDS,
+            max_backoff=basicSettings.WEBHOOK_MAX_BACKOFF_SECONDS,
+            timeout=basicSettings.WEBHOOK_TIMEOUT_SECONDS,
+            allow_http=basicSettings.WEBHOOK_ALLOW_HTTP,
+        )
+    return _webhook_dispatcher
+
+if __name__ == "__main__":
+    pass
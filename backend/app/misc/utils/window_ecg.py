@@ -0,0 +1,142 @@
+import numpy as np
+import os
+import sys
+
+from fractions import Fraction
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from app.misc.utils.lead_normalize import interval_to_sampling_rate
+
+
+TARGET_SAMPLE_RATE = 500
+WINDOW_SECONDS = 10
+WINDOW_PAD_SECONDS = 0.5  # extra input on each side so resampling edge effects fall outside the window
+
+
+### True sampling rate of a FHIR recording (all leads were validated to share it) ###
+def fhir_sampling_rate(leads_data):
+    lead_info = next(iter(leads_data.values()))
+    return interval_to_sampling_rate(lead_info["metadata"]["interval"], lead_info["metadata"]["intervalUnit"])
+
+def is_long_recording(n_samples, sample_rate, window_seconds=WINDOW_SECONDS):
+    return n_samples / sample_rate > window_seconds + 0.5
+
+### Polyphase resampling along the time axis to the target rate ###
+def resample_to_rate(ecg_matrix, sample_rate, target_rate=TARGET_SAMPLE_RATE):
+
+    if abs(sample_rate - target_rate) < 1e-6:
+        return ecg_matrix
+
+    from scipy import signal
+
+    ratio = Fraction(target_rate / sample_rate).limit_denominator(1000)
+    return signal.resample_poly(ecg_matrix, ratio.numerator, ratio.denominator, axis=0)
+
+### Crop or zero-pad to exactly target_length samples ###
+def fit_length(ecg_matrix, target_length):
+    if ecg_matrix.shape[0] >= target_length:
+        return ecg_matrix[:target_length]
+    return np.pad(ecg_matrix, ((0, target_length - ecg_matrix.shape[0]), (0, 0)))
+
+### Fixed windows (start seconds, (window_samples, 12) at target rate), each resampled from its own slice of the in-memory recording ###
+def iter_windows(ecg_matrix, sample_rate, window_seconds=WINDOW_SECONDS, overlap_seconds=2, target_rate=TARGET_SAMPLE_RATE):
+
+    if overlap_seconds >= window_seconds:
+        raise ValueError("Window overlap must be shorter than the window")
+
+    n_samples = ecg_matrix.shape[0]
+    window_in = int(round(window_seconds * sample_rate))
+    step_in = max(1, int(round((window_seconds - overlap_seconds) * sample_rate)))
+    pad_in = int(round(WINDOW_PAD_SECONDS * sample_rate))
+    window_out = int(round(window_seconds * target_rate))
+
+    last_start = max(0, n_samples - window_in)
+    start = 0
+    while True:
+        low = max(0, start - pad_in)
+        high = min(n_samples, start + window_in + pad_in)
+        chunk = resample_to_rate(ecg_matrix[low:high], sample_rate, target_rate)
+        offset = int(round((start - low) * target_rate / sample_rate))
+        yield start / sample_rate, fit_length(chunk[offset:offset + window_out], window_out)
+
+        if start >= last_start:
+            break
+        start = min(start + step_in, last_start)  # the final window is aligned to the end of the recording
+
+
+class PredictionAggregator():
+    """Running mean / max of numeric fields over per-window predictions, constant memory."""
+
+    def __init__(self):
+        self.count = 0
+        self._sum = {}
+        self._max = {}
+
+    def update(self, prediction):
+        self.count += 1
+        for key, value in _numeric_items(prediction):
+            self._sum[key] = self._sum.get(key, 0.0) + value
+            self._max[key] = max(self._max.get(key, value), value)
+
+    def result(self):
+        return {
+            "windows": self.count,
+            "mean": {key: total / self.count for key, total in self._sum.items()},
+            "max": dict(self._max),
+        }
+
+def _numeric_items(prediction, prefix=""):
+    if isinstance(prediction, dict):
+        for key, value in prediction.items():
+            yield from _numeric_items(value, f"{prefix}{key}" if not prefix else f"{prefix}.{key}")
+    elif isinstance(prediction, (int, float)) and not isinstance(prediction, bool):
+        yield prefix, float(prediction)
+
+### Windowed analysis: windows -> optional per-window quality gate -> batched inference -> aggregated prediction ###
+def analyze_windows(ecg_matrix, sample_rate, infer_batch, preprocess=None, window_seconds=WINDOW_SECONDS, overlap_seconds=2, batch_size=16, keep_windows=False):
+    """
+    infer_batch: callable taking a (batch, 12, samples) array and returning one prediction per window.
+    preprocess: optional callable taking a (samples, 12) window and returning (window, usable); unusable windows
+    are left out of the aggregate and listed by start time in skipped_windows.
+    """
+
+    aggregator = PredictionAggregator()
+    window_results = []
+    skipped_windows = []
+    batch, batch_starts = [], []
+
+    def flush():
+        predictions = infer_batch(np.stack(batch))
+        for window_start, prediction in zip(batch_starts, predictions):
+            aggregator.update(prediction)
+            if keep_windows:
+                window_results.append({"start": window_start, "prediction": prediction})
+        batch.clear()
+        batch_starts.clear()
+
+    for window_start, window in iter_windows(ecg_matrix, sample_rate, window_seconds, overlap_seconds):
+        if preprocess is not None:
+            window, usable = preprocess(window)
+            if not usable:
+                skipped_windows.append(window_start)
+                continue
+        batch.append(window.T)
+        batch_starts.append(window_start)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    return {
+        "duration": ecg_matrix.shape[0] / sample_rate,
+        "window_seconds": window_seconds,
+        "overlap_seconds": overlap_seconds,
+        "aggregate": aggregator.result(),
+        "skipped_windows": skipped_windows,
+        "windows": window_results if keep_windows else None,
+    }
+
+if __name__ == "__main__":
+    pass
@@ -1,20 +1,54 @@
-# from sqlalchemy import Boolean, Column, DateTime, func, Integer, JSON, String
-# from sqlalchemy.orm import declarative_base
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, func, Index, Integer, JSON, String
+from sqlalchemy.orm import declarative_base, relationship
 
-# from app.database.smart import Engine
 
+Base = declarative_base()
 
-# Base = declarative_base()
 
+class SmartECG(Base):
+    __tablename__ = "smart_ecg"
 
-# class SmartECG(Base):
-#     __tablename__ = "smart_ecg"
+    uid = Column(Integer, primary_key=True, autoincrement=True)
+    record_id = Column(String(64), unique=True, nullable=False)
+    file_path = Column(String(200), index=True)
+    create_time = Column(DateTime, default=func.now())
+    is_analyzed = Column(Boolean, default=False)
+    result = Column(JSON, nullable=True)
 
-#     uid = Column(Integer, primary_key=True, autoincrement=True)
-#     file_path = Column(String(100), index=True)
-#     create_time = Column(DateTime, default=func.now())
-#     is_analyzed = Column(Boolean, default=False)
-#     result = Column(JSON, nullable=True)
+    # typed copies of the FHIR metadata / measurements / prediction, so searches never read `result`
+    subject = Column(String(128))
+    effective_time = Column(DateTime, nullable=False)  # effectiveDateTime (UTC), upload time when missing
+    device = Column(String(128))
+    heart_rate = Column(Float)
+    qtc = Column(Float)
+    top_label = Column(String(64))
+    top_score = Column(Float)
 
-# # Create all defined tables in the DB
-# Base.metadata.create_all(bind=Engine)
\ No newline at end of file
+    labels = relationship("SmartECGLabel", back_populates="ecg", order_by="SmartECGLabel.rank", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_smart_ecg_time", "effective_time", "uid"),
+        Index("ix_smart_ecg_subject_time", "subject", "effective_time", "uid"),
+        Index("ix_smart_ecg_device_time", "device", "effective_time", "uid"),
+    )
+
+
+class SmartECGLabel(Base):
+    """Top predicted labels of a record, one row each; time and device are copied so label searches stay on one index."""
+
+    __tablename__ = "smart_ecg_label"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    uid = Column(Integer, ForeignKey("smart_ecg.uid", ondelete="CASCADE"), nullable=False, index=True)
+    label = Column(String(64), nullable=False)
+    score = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False)
+    effective_time = Column(DateTime, nullable=False)
+    device = Column(String(128))
+
+    ecg = relationship("SmartECG", back_populates="labels")
+
+    __table_args__ = (
+        Index("ix_smart_ecg_label_time", "label", "effective_time", "uid"),
+        Index("ix_smart_ecg_label_device_time", "label", "device", "effective_time", "uid"),
+    )
@@ -1,4 +1,7 @@
 from fastapi import APIRouter, Depends
+from starlette.responses import JSONResponse
+
+from app.core.health import get_health_monitor
 
 from app.routers.v1.endpoints import (
     smart_ecg
@@ -13,4 +16,15 @@ router_v1 = APIRouter()
 async def test():
     return JSONResponse(status_code=200, content="Here goes the apis")
 
+## [GET] : Liveness, the event loop answers (no dependency is checked)
+@router_v1.get("/health/live", tags=["Health"])
+async def health_live():
+    return {"status": "alive"}
+
+## [GET] : Readiness, 503 while this worker is overloaded or a required dependency is down
+@router_v1.get("/health/ready", tags=["Health"])
+async def health_ready():
+    ready, report = get_health_monitor().readiness()
+    return JSONResponse(status_code=200 if ready else 503, content=report, headers={"Cache-Control": "no-store"})
+
 router_v1.include_router(smart_ecg.router, prefix="/SMART-ECG", tags=["SMART-ECG"])
@@ -1,32 +1,47 @@
+import asyncio
+import hashlib
 import json
 import logging
+import numpy as np
 import os
 import sys
+import zlib
 
-from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, File, HTTPException, Query, status, UploadFile
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from io import BytesIO
-from jose import jwt
-from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
-from pydantic import BaseModel
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, status, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordRequestForm
 from starlette.requests import Request
-from starlette.responses import Response
-from typing import Annotated, List, Optional , Union
+from starlette.responses import FileResponse, Response, StreamingResponse
+from typing import Annotated, List, Optional
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
 
+from app.configs.config import basicSettings
+from app.core.deadline import DeadlineExceeded
+from app.core.tracing import start_span, traced_stage
 # from app.database.smart import get_conn
 from app.middleware.exception import exception_message
-from app.misc.utils.aiecg_api import ecg_ai_model
-from app.misc.utils.parse_ecg_from_fhir import convert_to_matrix, extract_ecg_data, plot_ecg_from_matrix, resample_ecg_matrix 
-from app.misc.utils.validate_fhir_format import validate_fhir_format
+from app.misc.utils.bulk_export import EXPORT_TYPES, export_manifest, FILE_NAME_PATTERN, get_bulk_export, iter_ndjson, JOB_ID_PATTERN
+from app.misc.utils.compression import COMPRESSED_CONTENT_TYPES, read_upload_body
+from app.misc.utils.fast_json import FastJSONResponse, loads
+from app.misc.utils.fhir_writeback import get_fhir_writeback
+from app.misc.utils.image_cache import etag_matches, ImageCache, load_thumbnail, rendition_etag, save_thumbnail
+from app.misc.utils.inference_client import InferenceRequestError, InferenceUnavailableError
+from app.misc.utils.lead_normalize import CANONICAL_LEADS
+from app.misc.utils.matrix_formats import arrow_available, arrow_stream_bytes, MATRIX_DTYPES, MATRIX_MEDIA_TYPES, negotiate_matrix_format, npy_bytes
+from app.misc.utils.parse_ecg_from_fhir import IMAGE_MEDIA_TYPES, render_ecg_image
+from app.misc.utils.ecg_measurements import beat_r_index
+from app.misc.utils.record_store import is_valid_record_id, load_beat, load_matrix, load_meta, save_beat, save_measurements, update_meta
+from app.misc.utils.single_flight import SingleFlight, SINGLE_FLIGHT_DIR
+from app.misc.utils.storage import get_blob_store
+from app.misc.utils.waveform_lod import build_pyramid, delta_encode, load_pyramid, save_pyramid, SCALE_UV, waveform_view
+from app.misc.utils.validate_fhir_format import validate_ecg_observation, validate_fhir_format_async
+from app.misc.utils.webhooks import check_callback_url, get_webhook_dispatcher, WEBHOOK_EVENTS
 # from app.models.smart import SmartECG
-# from app.schemas.v1.smart_ecg import SmartECGBase
+from app.schemas.v1.smart_ecg import SmartECGSearchResult, WebhookSubscriptionCreate
+from app.security.jwtAuth import ACCESS_TOKEN_EXPIRE_MINUTES, authenticate_user, create_access_token, get_current_active_user, Token, User, USER_DB
+from app.services.ecg_pipeline import ECGDataError, ECGQualityError, measure_stored_matrix, process_fhir_data
 
 
 router = APIRouter()
@@ -36,89 +51,16 @@ uvicorn_logger = logging.getLogger('uvicorn.error')
 system_logger = logging.getLogger('custom.error')
 
 
-UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../..', 'file', 'json'))
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+REMOTE_VALIDATIONS = set()
+IMAGE_CACHE = ImageCache(max_bytes=basicSettings.IMAGE_CACHE_MAX_BYTES)
+UPLOAD_FLIGHTS = SingleFlight(
+    directory=basicSettings.SINGLE_FLIGHT_DIR or SINGLE_FLIGHT_DIR,
+    result_ttl=basicSettings.SINGLE_FLIGHT_RESULT_TTL,
+    lock_timeout=basicSettings.SINGLE_FLIGHT_LOCK_TIMEOUT,
+    cacheable=(ECGDataError, ECGQualityError)
+)
 
 
-env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'configs', '.env'))
-load_dotenv(dotenv_path=env_path)
-
-SECRET_KEY = os.getenv("SECRET_KEY")                           
-ALGORITHM = os.getenv("ALGORITHM")  
-ACCESS_TOKEN_EXPIRE_MINUTES = 30  
-USERNAME = os.getenv("USERNAME")      
-HASHED_PASSWORD = os.getenv("HASHED_PASSWORD")  
-USER_DB = {USERNAME: {"username": USERNAME, "hashed_password": HASHED_PASSWORD, "disabled": False}}
-
-
-class Token(BaseModel):
-    access_token: str                 
-    token_type: str                   
-
-class TokenData(BaseModel):
-    username: Union[str, None] = None 
-
-class User(BaseModel):
-    username: str                     
-    disabled: Union[bool, None] = None
-
-class UserInDB(User):
-    hashed_password: str       
-
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto") 
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="http://127.0.0.1:8000/api/v1/SMART-ECG/token")
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
-
-def authenticate_user(db, username: str, password: str):
-    user = get_user(db, username)
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
-
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire}) 
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM) 
-
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except InvalidTokenError:
-        raise credentials_exception
-    
-    user = get_user(USER_DB, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
-
-async def get_current_active_user(current_user: Annotated[User, Depends(get_current_user)]):
-    if current_user.disabled:
-        raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
-
 @router.post("/token")
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
     
@@ -147,47 +89,120 @@ async def upload_fhir_file_get_value(
     # db: Session = Depends(get_conn)
 ):
     try:
-        if not file.content_type == "application/json":
-            raise HTTPException(status_code=400, detail="Invalid file type. Only JSON files are supported.")
-
-        file_name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, file_name)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-
-        with open(file_path, "r", encoding="utf-8") as f:
+        if file.content_type not in ("application/json", "application/octet-stream", *COMPRESSED_CONTENT_TYPES):
+            raise HTTPException(status_code=400, detail="Invalid file type. Only JSON files (optionally gzip / zstd compressed) are supported.")
+
+        # gzip / zstd bodies are inflated chunk by chunk off the event loop; the digest is taken on the JSON itself
+        # so the same record sent compressed and uncompressed is stored once
+        try:
+            with traced_stage("read_upload"):
+                raw_data, encoding = await run_in_threadpool(read_upload_body, file.file, file.headers.get("content-encoding"), basicSettings.MAX_UPLOAD_BYTES)
+        except (ValueError, OSError, zlib.error) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid compressed upload: {str(e)}")
+        if encoding == "identity" and file.content_type != "application/json":
+            raise HTTPException(status_code=400, detail="Invalid file type. Only JSON files (optionally gzip / zstd compressed) are supported.")
+
+        digest = hashlib.sha256(raw_data).hexdigest()
+        record_id = digest[:32]
+
+        # the upload is persisted in a worker thread while it is parsed and processed
+        store_task = asyncio.create_task(get_blob_store().put_async(raw_data, digest))
+
+        try:
             try:
-                file_data = json.load(f)
+                with traced_stage("json_decode"):
+                    file_data = loads(raw_data)
 
-                # validate FHIR format using FHIR server (maybe)
-                # if not validate_fhir_format(file_data):
-                #     raise HTTPException(status_code=400, detail="Invalid FHIR format.")
-                
-            except json.JSONDecodeError as e:
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
                 raise HTTPException(status_code=400, detail="Invalid JSON file format.")
 
-        leads_data, metadata = extract_ecg_data(file_data)
-        uid = metadata.get('subject')[9:16]
-        ecg_matrix = convert_to_matrix(leads_data)
-        resampled_matrix = resample_ecg_matrix(ecg_matrix)
-        # fig = plot_ecg_from_matrix(resampled_matrix, sample_rate=500, uid=file_name.split(".json")[0])
-        fig_path = plot_ecg_from_matrix(resampled_matrix, sample_rate=500, uid=file_name.split(".json")[0])
+            # offline profile check of the fields the parser relies on, then optionally the FHIR server
+            if basicSettings.FHIR_LOCAL_VALIDATION:
+                with traced_stage("validate"):
+                    issues = validate_ecg_observation(file_data)
+                if issues:
+                    raise HTTPException(status_code=400, detail={"message": "Invalid FHIR format.", "issues": issues})
+
+            if basicSettings.FHIR_REMOTE_VALIDATION == "strict":
+                with traced_stage("validate_remote"):
+                    if not await validate_fhir_format_async(file_data):
+                        raise HTTPException(status_code=400, detail="Invalid FHIR format.")
+            elif basicSettings.FHIR_REMOTE_VALIDATION == "background":
+                task = asyncio.create_task(validate_fhir_format_async(file_data))
+                REMOTE_VALIDATIONS.add(task)  # keep a reference until done
+                task.add_done_callback(REMOTE_VALIDATIONS.discard)
+
+            # double submits and sender retries of the same ECG share one processing run
+            try:
+                with start_span("process_fhir_data", **{"ecg.record_id": record_id}):
+                    processed = await UPLOAD_FLIGHTS.do(digest, process_fhir_data, file_data, record_id)
+            except ECGDataError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except ECGQualityError as e:
+                raise HTTPException(status_code=422, detail={"message": str(e), "signal_quality": e.quality})
+            except InferenceRequestError as e:
+                raise HTTPException(status_code=502, detail=str(e))
+            except InferenceUnavailableError as e:
+                system_logger.error("Inference unavailable for %s: %s", record_id, exception_message(e))
+                raise HTTPException(status_code=503, detail="AI inference service is unavailable, retry later.", headers={"Retry-After": "5"})
+            except DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=str(e))
+
+            with traced_stage("store_wait"):
+                storage_key = await store_task
+        finally:
+            # a rejected or cancelled upload must not leave the write running unobserved
+            if not store_task.done():
+                store_task.cancel()
+            await asyncio.gather(store_task, return_exceptions=True)
+
+        # the record points at its source Observation and keeps the AI result, so $export can read both back
+        with traced_stage("persist_result"):
+            await run_in_threadpool(update_meta, record_id, source_key=storage_key, result=processed["result"])
+
+        # typed, indexed copy of the metadata and prediction for the search endpoint; the upload succeeds without it
+        if basicSettings.ECG_INDEX_ENABLED:
+            try:
+                from app.crud.smart_ecg import index_ecg_result
 
-        matrix_data = resampled_matrix.T
-        # processed_result = ecg_ai_model(matrix_data)
+                with traced_stage("index"):
+                    await run_in_threadpool(index_ecg_result, record_id, storage_key, processed["metadata"], processed["result"], processed["measurements"], basicSettings.ECG_INDEX_TOP_LABELS)
+            except Exception as e:
+                system_logger.warning("Indexing of %s failed: %s", record_id, exception_message(e))
 
-        # new_record = SmartECG(file_path=file_name, is_analyzed=True, result=processed_result)
-        # db.add(new_record)
-        # db.commit()
+        # AI results go back to the FHIR server with the next transaction Bundle
+        if basicSettings.FHIR_WRITEBACK_ENABLED and processed["result"] is not None:
+            get_fhir_writeback().submit(record_id, processed["metadata"], processed["result"])
 
-        uvicorn_logger.info(f"Uploaded and processed file: {file_name}")
+        # subscribers are notified from the persistent outbox by the background dispatcher
+        if basicSettings.WEBHOOKS_ENABLED:
+            try:
+                with traced_stage("webhook_enqueue"):
+                    await get_webhook_dispatcher().notify(current_user.username, "ecg.analyzed", {
+                        "record_id": record_id,
+                        "file_path": storage_key,
+                        "observation": processed["metadata"].get("id") or None,
+                        "subject": processed["metadata"].get("subject") or None,
+                        "effectiveDateTime": processed["metadata"].get("effectiveDateTime") or None,
+                        "measurements": processed["measurements"],
+                        "result": processed["result"],
+                        "image_url": f"{basicSettings.BASE_PREFIX}/SMART-ECG/{record_id}/image",
+                    })
+            except Exception as e:
+                system_logger.warning("Webhook event of %s not queued: %s", record_id, exception_message(e))
+
+        uvicorn_logger.info("Uploaded and processed file: %s (%s, %s)", file.filename, encoding, storage_key)
 
         return {
             "message": "File uploaded and processed successfully",
-            "file_name": file_name,
-            "file_path": file_path,
-            "fig_path": fig_path,
-            # "result": processed_result,
+            "file_name": file.filename,
+            "file_path": storage_key,
+            "record_id": record_id,
+            "image_url": f"{basicSettings.BASE_PREFIX}/SMART-ECG/{record_id}/image",
+            "thumbnail_url": f"{basicSettings.BASE_PREFIX}/SMART-ECG/{record_id}/thumbnail",
+            "signal_quality": processed["signal_quality"],
+            "measurements": processed["measurements"],
+            "result": processed["result"],
         }
 
     # except SQLAlchemyError as e:
@@ -195,10 +210,432 @@ async def upload_fhir_file_get_value(
     #     system_logger.error(f"Database error: {str(e)}")
     #     raise HTTPException(status_code=500, detail="Failed to save file information to the database.")
 
+    except HTTPException:
+        raise
+
     except Exception as e:
-        system_logger.error(f"Error processing file: {exception_message(e)}")
+        system_logger.error("Error processing file: %s", exception_message(e))
         raise HTTPException(status_code=500, detail="An error occurred while processing the file.")
 
+## [GET] : Search analyzed results (e.g. label=afib&min_score=0.5&device=X&start=...), newest first
+@router.get("/results", response_model=SmartECGSearchResult, name="Search ECG results", description="Search analyzed ECG results by subject, device, predicted label and time, paginated with a cursor", include_in_schema=True)
+def get_ecg_results(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    subject: Optional[str] = Query(None, description="FHIR subject reference, e.g. Patient/123"),
+    device: Optional[str] = Query(None, description="Acquisition device"),
+    label: Optional[str] = Query(None, description="Predicted label among the record's top labels"),
+    min_score: Optional[float] = Query(None, description="Minimum score of `label`"),
+    start: Optional[datetime] = Query(None, description="effectiveDateTime from (inclusive)"),
+    end: Optional[datetime] = Query(None, description="effectiveDateTime until (exclusive)"),
+    limit: int = Query(50, ge=1, le=500, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+):
+    if not basicSettings.ECG_INDEX_ENABLED:
+        raise HTTPException(status_code=503, detail="ECG result index is disabled.")
+
+    from app.crud.smart_ecg import search_ecg_results
+    from app.database.smart import Session
+
+    try:
+        with Session() as db, traced_stage("index_search"):
+            rows, next_cursor = search_ecg_results(db, subject, device, label, min_score, start, end, limit, cursor)
+            return SmartECGSearchResult(items=rows, next_cursor=next_cursor)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        system_logger.error("Error searching ECG results: %s", exception_message(e))
+        raise HTTPException(status_code=500, detail="An error occurred while searching the results.")
+
+## [GET] : Bulk $export kick-off (FHIR Bulk Data style); `_since` = transactionTime of the previous export
+@router.get("/$export", status_code=202, name="Start bulk export", description="Export source Observations and ECG records (matrix, measurements, AI result) changed since `_since` as gzip NDJSON files", include_in_schema=True)
+async def start_bulk_export(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    since: Optional[datetime] = Query(None, alias="_since", description="Only records changed at or after this instant"),
+    types: Optional[str] = Query(None, alias="_type", description="Comma separated output types: Observation, ECGRecord"),
+    output_format: Optional[str] = Query(None, alias="_outputFormat", description="application/fhir+ndjson (default)"),
+):
+    if output_format not in (None, "application/fhir+ndjson", "application/ndjson", "ndjson"):
+        raise HTTPException(status_code=400, detail=f"Unsupported _outputFormat: {output_format}")
+
+    type_list = [item.strip() for item in types.split(",") if item.strip()] if types else list(EXPORT_TYPES)
+    unknown_types = [item for item in type_list if item not in EXPORT_TYPES]
+    if unknown_types or not type_list:
+        raise HTTPException(status_code=400, detail=f"Unknown _type: {', '.join(unknown_types)}")
+
+    job_id = await get_bulk_export().start(str(request.url), since, type_list, current_user.username)
+    if job_id is None:
+        raise HTTPException(status_code=429, detail="Too many exports in progress, retry later.", headers={"Retry-After": "60"})
+
+    status_url = str(request.url_for("Get bulk export status", job_id=job_id))
+    uvicorn_logger.info("Started export %s (since %s, %s)", job_id, since, ",".join(type_list))
+
+    return FastJSONResponse(status_code=202, content={"message": "Export started", "status_url": status_url}, headers={"Content-Location": status_url})
+
+## [GET] : Export status: 202 while running, then the manifest of the NDJSON files
+@router.get("/$export-status/{job_id}", name="Get bulk export status", description="Progress of a bulk export, or its manifest when complete", include_in_schema=True)
+async def get_bulk_export_status(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    job_id: str,
+):
+    job = await run_in_threadpool(get_bulk_export().status, job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None or job["owner"] != current_user.username:
+        raise HTTPException(status_code=404, detail="Export not found.")
+
+    if job["state"] == "running":
+        return Response(status_code=202, headers={"X-Progress": f"{job['processed']} records", "Retry-After": "5"})
+    if job["state"] == "error":
+        return FastJSONResponse(status_code=500, content={"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "exception", "diagnostics": job["message"]}]})
+
+    file_url = lambda job_id, file_name: str(request.url_for("Get bulk export file", job_id=job_id, file_name=file_name))
+    return export_manifest(job, file_url)
+
+## [DELETE] : Cancel a running export or delete a finished one
+@router.delete("/$export-status/{job_id}", status_code=202, name="Delete bulk export", description="Cancel a bulk export and delete its files", include_in_schema=True)
+async def delete_bulk_export(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    job_id: str,
+):
+    job = await run_in_threadpool(get_bulk_export().status, job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None or job["owner"] != current_user.username:
+        raise HTTPException(status_code=404, detail="Export not found.")
+
+    await run_in_threadpool(get_bulk_export().delete, job_id)
+    return Response(status_code=202)
+
+## [GET] : One NDJSON file of a finished export (sent gzip-encoded when the client accepts it)
+@router.get("/$export-files/{job_id}/{file_name}", name="Get bulk export file", description="Download an NDJSON file of a bulk export", include_in_schema=True)
+async def get_bulk_export_file(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    job_id: str,
+    file_name: str,
+    accept_encoding: Optional[str] = Header(None),
+):
+    job = await run_in_threadpool(get_bulk_export().status, job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None or job["owner"] != current_user.username or not FILE_NAME_PATTERN.match(file_name):
+        raise HTTPException(status_code=404, detail="Export file not found.")
+    if file_name not in {output["file"] for output in job["output"] + job["error"]}:
+        raise HTTPException(status_code=404, detail="Export file not found.")
+
+    path = get_bulk_export().file_path(job_id, file_name)
+    if "gzip" in (accept_encoding or "").lower():
+        return FileResponse(path, media_type="application/fhir+ndjson", headers={"Content-Encoding": "gzip"})
+    return StreamingResponse(iter_ndjson(path), media_type="application/fhir+ndjson")
+
+## [POST] : Register a callback URL for push notifications of analyzed uploads (the secret is only returned here)
+@router.post("/webhooks", status_code=201, name="Create webhook", description="Register a callback URL; batches of events are POSTed to it, signed with HMAC-SHA256 (X-Webhook-Signature)", include_in_schema=True)
+async def create_webhook(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    subscription: WebhookSubscriptionCreate,
+):
+    if not basicSettings.WEBHOOKS_ENABLED:
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled.")
+    try:
+        await check_callback_url(subscription.url, allow_http=basicSettings.WEBHOOK_ALLOW_HTTP)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    unknown_events = [event for event in subscription.events if event not in WEBHOOK_EVENTS]
+    if unknown_events or not subscription.events:
+        raise HTTPException(status_code=400, detail=f"Unknown events: {', '.join(unknown_events)}")
+
+    created = await run_in_threadpool(get_webhook_dispatcher().store.add_subscription, current_user.username, subscription.url, subscription.events, subscription.secret)
+    uvicorn_logger.info("Webhook %s registered by %s: %s", created["id"], current_user.username, subscription.url)
+    return {key: value for key, value in created.items() if key != "owner"}
+
+## [GET] : Own webhooks with their delivery state
+@router.get("/webhooks", name="List webhooks", description="List the caller's webhooks with delivered / failed / pending event counts", include_in_schema=True)
+async def list_webhooks(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    if not basicSettings.WEBHOOKS_ENABLED:
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled.")
+    return {"items": await run_in_threadpool(get_webhook_dispatcher().store.list_subscriptions, current_user.username)}
+
+## [DELETE] : Remove a webhook and its undelivered events
+@router.delete("/webhooks/{subscription_id}", status_code=204, name="Delete webhook", description="Delete a webhook and its undelivered events", include_in_schema=True)
+async def delete_webhook(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    subscription_id: str,
+):
+    if not basicSettings.WEBHOOKS_ENABLED or not await run_in_threadpool(get_webhook_dispatcher().store.delete_subscription, current_user.username, subscription_id):
+        raise HTTPException(status_code=404, detail="Webhook not found.")
+    return Response(status_code=204)
+
+## [GET] : ECG image rendered on demand from the stored matrix
+@router.get("/{record_id}/image", name="Get ECG image", description="Get ECG image (png / webp / svg), rendered on first request and cached", include_in_schema=True)
+async def get_ecg_image(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    record_id: str,
+    format: str = Query("png", pattern="^(png|webp|svg)$", description="Image format"),
+    dpi: int = Query(basicSettings.IMAGE_DEFAULT_DPI, ge=30, le=600, description="Resolution (ignored for svg)"),
+    leads: Optional[str] = Query(None, description="Comma separated lead names, e.g. I,II,V1"),
+    if_none_match: Optional[str] = Header(None),
+):
+    if not is_valid_record_id(record_id):
+        raise HTTPException(status_code=400, detail="Invalid record id.")
+
+    lead_list = [lead.strip() for lead in leads.split(",") if lead.strip()] if leads else None
+    if lead_list:
+        unknown_leads = [lead for lead in lead_list if lead not in CANONICAL_LEADS]
+        if unknown_leads:
+            raise HTTPException(status_code=400, detail=f"Unknown leads: {', '.join(unknown_leads)}")
+
+    if format == "svg":
+        dpi = 72
+
+    meta = await run_in_threadpool(load_meta, record_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+
+    etag = rendition_etag(meta["matrix_digest"], format, dpi, lead_list)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, max-age=86400"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        with traced_stage("image_cache_get"):
+            content = await run_in_threadpool(IMAGE_CACHE.get, etag, format)
+        if content is None:
+            ecg_matrix = await run_in_threadpool(load_matrix, record_id)
+            if ecg_matrix is None:
+                raise HTTPException(status_code=404, detail="ECG record not found.")
+            with traced_stage("render", **{"image.format": format, "image.dpi": dpi}):
+                content = await run_in_threadpool(render_ecg_image, ecg_matrix, format, dpi, lead_list, meta.get("sample_rate", 500))
+            await run_in_threadpool(IMAGE_CACHE.put, etag, format, content)
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        system_logger.error("Error rendering image of %s: %s", record_id, exception_message(e))
+        raise HTTPException(status_code=500, detail="An error occurred while rendering the image.")
+
+    return Response(content, media_type=IMAGE_MEDIA_TYPES[format], headers=headers)
+
+## [GET] : Pre-generated thumbnail for list views
+@router.get("/{record_id}/thumbnail", name="Get ECG thumbnail", description="Get pre-generated ECG thumbnail", include_in_schema=True)
+async def get_ecg_thumbnail(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    record_id: str,
+    if_none_match: Optional[str] = Header(None),
+):
+    if not is_valid_record_id(record_id):
+        raise HTTPException(status_code=400, detail="Invalid record id.")
+
+    meta = await run_in_threadpool(load_meta, record_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+
+    etag = rendition_etag(meta["matrix_digest"], "thumbnail", basicSettings.THUMBNAIL_DPI)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, max-age=86400"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    content = await run_in_threadpool(load_thumbnail, record_id)
+    if content is None:  # records uploaded before thumbnails existed
+        ecg_matrix = await run_in_threadpool(load_matrix, record_id)
+        if ecg_matrix is None:
+            raise HTTPException(status_code=404, detail="ECG record not found.")
+        with traced_stage("render", **{"image.format": "png", "image.dpi": basicSettings.THUMBNAIL_DPI}):
+            content = await run_in_threadpool(render_ecg_image, ecg_matrix, "png", basicSettings.THUMBNAIL_DPI)
+        await run_in_threadpool(save_thumbnail, record_id, content)
+
+    return Response(content, media_type="image/png", headers=headers)
+
+## [GET] : Waveform points for interactive viewers: raw samples or min/max buckets, at most ~4 points per pixel
+@router.get("/{record_id}/waveform", name="Get ECG waveform", description="Get the waveform of a time range at the level of detail of a `width` pixel wide view (int16 µV, delta-encoded JSON or binary)", include_in_schema=True)
+async def get_ecg_waveform(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    record_id: str,
+    start: float = Query(0.0, ge=0, description="Range start (s)"),
+    end: Optional[float] = Query(None, gt=0, description="Range end (s), default: end of the record"),
+    width: int = Query(1000, ge=16, le=20000, description="Viewer width in pixels"),
+    leads: Optional[str] = Query(None, description="Comma separated lead names, e.g. I,II,V1"),
+    format: str = Query("json", pattern="^(json|binary)$", description="json: delta-encoded lists | binary: int16 little-endian (leads x points)"),
+    if_none_match: Optional[str] = Header(None),
+):
+    if not is_valid_record_id(record_id):
+        raise HTTPException(status_code=400, detail="Invalid record id.")
+
+    lead_list = [lead.strip() for lead in leads.split(",") if lead.strip()] if leads else list(CANONICAL_LEADS)
+    unknown_leads = [lead for lead in lead_list if lead not in CANONICAL_LEADS]
+    if unknown_leads:
+        raise HTTPException(status_code=400, detail=f"Unknown leads: {', '.join(unknown_leads)}")
+
+    meta = await run_in_threadpool(load_meta, record_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+
+    sample_rate = meta.get("sample_rate", 500)
+    start_sample = int(start * sample_rate)
+    end_sample = int(round(end * sample_rate)) if end is not None else meta["shape"][0]
+    etag = rendition_etag(meta["matrix_digest"], f"waveform-{format}-{start_sample}-{end_sample}", width, lead_list)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, max-age=86400"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    ecg_matrix = await run_in_threadpool(load_matrix, record_id)
+    if ecg_matrix is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+    pyramid = await run_in_threadpool(load_pyramid, record_id)
+    if pyramid is None:  # records stored before pyramids were built at ingestion
+        pyramid = await run_in_threadpool(build_pyramid, ecg_matrix)
+        await run_in_threadpool(save_pyramid, record_id, pyramid)
+
+    try:
+        with traced_stage("waveform"):
+            data, bucket, first_sample = waveform_view(ecg_matrix, pyramid, start_sample, end_sample, width, [CANONICAL_LEADS.index(lead) for lead in lead_list])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "binary":
+        headers.update({
+            "X-ECG-Leads": ",".join(lead_list),
+            "X-ECG-Points": str(data.shape[1]),
+            "X-ECG-First-Sample": str(first_sample),
+            "X-ECG-Bucket": str(bucket),
+            "X-ECG-Sample-Rate": str(sample_rate),
+            "X-ECG-Scale-UV": str(SCALE_UV),
+        })
+        return Response(data.astype("<i2", copy=False).tobytes(), media_type="application/octet-stream", headers=headers)
+
+    return FastJSONResponse(headers=headers, content={
+        "record_id": record_id,
+        "sample_rate": sample_rate,
+        "scale_uv": SCALE_UV,
+        "first_sample": first_sample,
+        "bucket": bucket,
+        "points": data.shape[1],
+        "leads": lead_list,
+        "data": delta_encode(data),
+    })
+
+## [GET] : Median beat stored at ingestion (R peak at `r_index`), for quick-look views and beat-level models
+@router.get("/{record_id}/beat", name="Get ECG median beat", description="Get the per-lead median beat template of a record (mV, filtered)", include_in_schema=True)
+async def get_ecg_beat(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    record_id: str,
+    leads: Optional[str] = Query(None, description="Comma separated lead names, e.g. I,II,V1"),
+):
+    if not is_valid_record_id(record_id):
+        raise HTTPException(status_code=400, detail="Invalid record id.")
+
+    lead_list = [lead.strip() for lead in leads.split(",") if lead.strip()] if leads else list(CANONICAL_LEADS)
+    unknown_leads = [lead for lead in lead_list if lead not in CANONICAL_LEADS]
+    if unknown_leads:
+        raise HTTPException(status_code=400, detail=f"Unknown leads: {', '.join(unknown_leads)}")
+
+    meta = await run_in_threadpool(load_meta, record_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+    sample_rate = meta.get("sample_rate", 500)
+
+    template = await run_in_threadpool(load_beat, record_id)
+    if template is None and "beat" not in meta:  # records stored before beats were kept at ingestion
+        ecg_matrix = await run_in_threadpool(load_matrix, record_id)
+        if ecg_matrix is None:
+            raise HTTPException(status_code=404, detail="ECG record not found.")
+        with traced_stage("measure"):
+            measurements, template = await run_in_threadpool(measure_stored_matrix, ecg_matrix, sample_rate, True)
+        if template is not None:
+            template = template.astype(np.float32)  # as stored
+            await run_in_threadpool(save_beat, record_id, template)
+            await run_in_threadpool(update_meta, record_id, measurements=meta.get("measurements") or measurements, beat={"samples": int(template.shape[0]), "r_index": beat_r_index(sample_rate)})
+    if template is None:
+        raise HTTPException(status_code=404, detail="No complete beat in this record.")
+
+    return {
+        "record_id": record_id,
+        "sample_rate": sample_rate,
+        "r_index": beat_r_index(sample_rate),
+        "samples": int(template.shape[0]),
+        "leads": lead_list,
+        "data": np.round(template[:, [CANONICAL_LEADS.index(lead) for lead in lead_list]].T.astype(np.float64), 4).tolist(),
+    }
+
+## [GET] : HR, intervals and axes stored at ingestion
+@router.get("/{record_id}/measurements", name="Get ECG measurements", description="Get heart rate, PR / QRS / QT(c) intervals and frontal axes of a record", include_in_schema=True)
+async def get_ecg_measurements(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    record_id: str,
+):
+    if not is_valid_record_id(record_id):
+        raise HTTPException(status_code=400, detail="Invalid record id.")
+
+    meta = await run_in_threadpool(load_meta, record_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+
+    measurements = meta.get("measurements")
+    if measurements is None:  # records stored before measurements were computed at ingestion
+        ecg_matrix = await run_in_threadpool(load_matrix, record_id)
+        if ecg_matrix is None:
+            raise HTTPException(status_code=404, detail="ECG record not found.")
+        with traced_stage("measure"):
+            measurements = await run_in_threadpool(measure_stored_matrix, ecg_matrix, meta.get("sample_rate", 500))
+        await run_in_threadpool(save_measurements, record_id, measurements)
+
+    return {"record_id": record_id, "measurements": measurements}
+
+## [GET] : Resampled 12-lead matrix for research clients; the format follows Accept (npy, Arrow IPC stream or JSON)
+@router.get("/{record_id}/matrix", name="Get ECG matrix", description="Get the resampled matrix (mV, leads x samples) as `application/x-npy`, `application/vnd.apache.arrow.stream` or JSON, chosen by the Accept header", include_in_schema=True)
+async def get_ecg_matrix(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    record_id: str,
+    leads: Optional[str] = Query(None, description="Comma separated lead names, e.g. I,II,V1"),
+    dtype: str = Query("float32", pattern="^(float32|float64)$", description="Sample type of npy / Arrow / JSON values"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    if not is_valid_record_id(record_id):
+        raise HTTPException(status_code=400, detail="Invalid record id.")
+
+    fmt = negotiate_matrix_format(accept, allow_arrow=arrow_available())
+    if fmt is None:
+        supported = [media_type for fmt, media_type in MATRIX_MEDIA_TYPES.items() if fmt != "arrow" or arrow_available()]
+        raise HTTPException(status_code=406, detail=f"Acceptable formats: {', '.join(supported)}")
+
+    lead_list = [lead.strip() for lead in leads.split(",") if lead.strip()] if leads else list(CANONICAL_LEADS)
+    unknown_leads = [lead for lead in lead_list if lead not in CANONICAL_LEADS]
+    if unknown_leads:
+        raise HTTPException(status_code=400, detail=f"Unknown leads: {', '.join(unknown_leads)}")
+
+    meta = await run_in_threadpool(load_meta, record_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+
+    sample_rate = meta.get("sample_rate", 500)
+    etag = rendition_etag(meta["matrix_digest"], f"matrix-{fmt}", dtype, lead_list)
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "private, max-age=86400",
+        "Vary": "Accept",
+        "X-ECG-Leads": ",".join(lead_list),
+        "X-ECG-Sample-Rate": str(sample_rate),
+        "X-ECG-Unit": "mV",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    ecg_matrix = await run_in_threadpool(load_matrix, record_id)
+    if ecg_matrix is None:
+        raise HTTPException(status_code=404, detail="ECG record not found.")
+    lead_matrix = ecg_matrix[:, [CANONICAL_LEADS.index(lead) for lead in lead_list]].T.astype(MATRIX_DTYPES[dtype])  # (leads, samples), C-contiguous
+
+    if fmt == "npy":
+        return Response(npy_bytes(lead_matrix), media_type=MATRIX_MEDIA_TYPES["npy"], headers=headers)
+
+    metadata = {"record_id": record_id, "sample_rate": sample_rate, "unit": "mV", "samples": lead_matrix.shape[1], "observation": (meta.get("metadata") or {}).get("id") or ""}
+    if fmt == "arrow":
+        with traced_stage("arrow_encode"):
+            body = await run_in_threadpool(arrow_stream_bytes, lead_matrix, lead_list, metadata)
+        return Response(body, media_type=MATRIX_MEDIA_TYPES["arrow"], headers=headers)
+
+    return FastJSONResponse(headers=headers, content={**metadata, "leads": lead_list, "data": lead_matrix})
+
 # ## [GET]：Root
 # @router.get("")
 # async def root(request:Request):
@@ -1,21 +1,62 @@
-# from datetime import datetime
-# from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List
 
 
-# """
-# Smart ECG Pydantic Schema
-# """
+"""
+Smart ECG Pydantic Schema
+"""
 
 
-# class SmartECGBase(BaseModel):
-    
-#     uid: int | None = Field(None, description="Id")
-#     file_path: str | None = Field(None, max_length=200, description="File path")
-#     create_time: datetime | None = Field(None, description="Create time of data")
-#     is_analyzed: bool | None = Field(None, description="Is analyzed?")
-#     result: dict | None = Field(None, description="Analysis result in JSON format")
+class SmartECGBase(BaseModel):
 
-#     class Config:
-      
-#         from_attributes = True  # Enable direct conversion from ORM models
-#         json_encoders = {datetime: lambda v: v.isoformat()}  # Convert datetime to ISO 8601 string
\ No newline at end of file
+    uid: int | None = Field(None, description="Id")
+    file_path: str | None = Field(None, max_length=200, description="File path")
+    create_time: datetime | None = Field(None, description="Create time of data")
+    is_analyzed: bool | None = Field(None, description="Is analyzed?")
+    result: dict | None = Field(None, description="Analysis result in JSON format")
+
+    class Config:
+
+        from_attributes = True  # Enable direct conversion from ORM models
+
+
+class SmartECGLabelScore(BaseModel):
+
+    label: str = Field(..., description="Predicted label")
+    score: float = Field(..., description="Prediction score")
+
+    class Config:
+
+        from_attributes = True
+
+
+class SmartECGSummary(BaseModel):
+
+    record_id: str = Field(..., description="Record id")
+    subject: str | None = Field(None, description="FHIR subject reference")
+    effective_time: datetime = Field(..., description="effectiveDateTime (UTC)")
+    device: str | None = Field(None, description="Acquisition device")
+    is_analyzed: bool | None = Field(None, description="Is analyzed?")
+    heart_rate: float | None = Field(None, description="Heart rate (bpm)")
+    qtc: float | None = Field(None, description="QTc, Bazett (ms)")
+    top_label: str | None = Field(None, description="Label with the highest score")
+    top_score: float | None = Field(None, description="Score of the top label")
+    labels: List[SmartECGLabelScore] = Field(default_factory=list, description="Top predicted labels")
+
+    class Config:
+
+        from_attributes = True
+
+
+class SmartECGSearchResult(BaseModel):
+
+    items: List[SmartECGSummary] = Field(default_factory=list, description="Matching records, newest first")
+    next_cursor: str | None = Field(None, description="Pass as `cursor` to get the next page")
+
+
+class WebhookSubscriptionCreate(BaseModel):
+
+    url: str = Field(..., max_length=2000, description="Callback URL (https, public host) receiving POSTed event batches")
+    events: List[str] = Field(default_factory=lambda: ["ecg.analyzed"], description="Event types to deliver")
+    secret: str | None = Field(None, min_length=16, max_length=200, description="HMAC signing secret, generated when omitted")
@@ -1,15 +1,20 @@
 import base64
+import gzip
+import logging
 import os
 import sys
 
-from requests import post, exceptions
+from requests import get, post, RequestException
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 from middleware.exception import exception_message
 
 
-def upload_fhir_ecg_to_ai(file_path: str, headers: dict = None) -> dict:
+system_logger = logging.getLogger('custom.error')
+
+
+def upload_fhir_ecg_to_ai(file_path: str, headers: dict = None, compress: bool = True) -> dict:
     try:
         url = "http://127.0.0.1:8000/api/v1/SMART-ECG"
         # url = "http://0.0.0.0:5433/api/v1/SMART-ECG"
@@ -22,22 +27,28 @@ def upload_fhir_ecg_to_ai(file_path: str, headers: dict = None) -> dict:
             default_headers.update(headers)
 
         with open(file_path, 'rb') as f:
-            files = {'file': (os.path.basename(file_path), f, 'application/json')}
+            # FHIR sampled data is ASCII decimals, gzip typically shrinks it 5-10x on the wire
+            if compress:
+                files = {'file': (f"{os.path.basename(file_path)}.gz", gzip.compress(f.read(), compresslevel=6), 'application/gzip')}
+            else:
+                files = {'file': (os.path.basename(file_path), f, 'application/json')}
 
             response = post(url, files=files, headers=default_headers)
             
             if response.status_code == 200 and response.headers.get("Content-Type") == "application/json":
-                print("Upload FHIR ECG file successfully")
+                system_logger.info("Upload FHIR ECG file successfully")
                 response_data = response.json()
                 return { 
                     "success": True,
                     "file_name": response_data.get('file_name'),
                     "file_path": response_data.get('file_path'),
-                    "fig_path": response_data.get('fig_path'),
-                    # "result": response_data.get('result'),  
+                    "record_id": response_data.get('record_id'),
+                    "image_url": response_data.get('image_url'),
+                    "thumbnail_url": response_data.get('thumbnail_url'),
+                    "result": response_data.get('result'),  
                 }
             else:
-                print("Failed to upload FHIR ECG file")
+                system_logger.warning("Failed to upload FHIR ECG file: HTTP %s", response.status_code)
                 return {
                     "success": False,
                     "error": f"API response is not json format: {response.text}"
@@ -52,6 +63,31 @@ def upload_fhir_ecg_to_ai(file_path: str, headers: dict = None) -> dict:
             "success": False,
             "error": f"An error occurred while processing the FHIR file: {exception_message(e)}"
         }
+
+def get_ecg_image(image_url: str, headers: dict = None, etag: str = None) -> dict:
+    try:
+        url = f"http://127.0.0.1:8000{image_url}"
+
+        default_headers = {}
+        if headers:
+            default_headers.update(headers)
+        if etag:
+            default_headers["If-None-Match"] = etag
+
+        response = get(url, headers=default_headers)
+
+        if response.status_code == 304:
+            return {"success": True, "not_modified": True, "etag": etag}
+        elif response.status_code == 200:
+            return {"success": True, "not_modified": False, "etag": response.headers.get("ETag"), "content": response.content}
+        else:
+            return {"success": False, "error": f"Failed to get ECG image: {response.text}"}
+
+    except RequestException as e:
+        return {
+            "success": False,
+            "error": f"API call failed: {exception_message(e)}"
+        }
     
 # def upload_fhir_ecg_to_ai(file_path: str) -> dict:
 #     try:
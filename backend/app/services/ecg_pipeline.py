@@ -0,0 +1,156 @@
+import logging
+import os
+import sys
+
+from anyio import from_thread
+from fastapi.concurrency import run_in_threadpool
+from functools import partial
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.configs.config import basicSettings
+from app.core.logger import get_stage_timings
+from app.core.deadline import current_deadline
+from app.core.tracing import traced_stage
+from app.misc.utils.ecg_measurements import beat_r_index, measure_ecg
+from app.misc.utils.image_cache import save_thumbnail
+from app.misc.utils.inference_backend import get_inference_backend
+from app.misc.utils.parse_ecg_from_fhir import convert_to_matrix, extract_ecg_data, fhir_resolution, render_ecg_image
+from app.misc.utils.preprocess_ecg import fhir_lead_limits, is_recording_usable, preprocess_ecg_matrix
+from app.misc.utils.record_store import save_record
+from app.misc.utils.waveform_lod import build_pyramid, save_pyramid
+from app.misc.utils.window_ecg import analyze_windows, fhir_sampling_rate, fit_length, is_long_recording, resample_to_rate, TARGET_SAMPLE_RATE, WINDOW_SECONDS
+
+
+system_logger = logging.getLogger('custom.error')
+
+
+class ECGDataError(Exception):
+    """The upload is valid JSON but carries no usable ECG leads."""
+
+
+class ECGQualityError(Exception):
+    """Signal quality is too low to be worth an inference call."""
+
+    def __init__(self, quality):
+        super().__init__("ECG signal quality is too low for analysis.")
+        self.quality = quality
+
+    def __reduce__(self):  # keeps `quality` when the error is shared between workers
+        return (ECGQualityError, (self.quality,))
+
+
+### Quality gate applied to each window of a long recording ###
+def gate_window(preprocess, window):
+    filtered_window, quality, _ = preprocess(window)
+    return filtered_window, is_recording_usable(quality, min_score=basicSettings.QUALITY_MIN_SCORE, min_usable_leads=basicSettings.QUALITY_MIN_USABLE_LEADS)
+
+### Parse -> normalize -> resample -> quality gate -> persist (CPU and disk bound, run in a worker thread) ###
+def prepare_fhir_data(file_data, record_id):
+
+    with traced_stage("parse"):
+        leads_data, metadata = extract_ecg_data(file_data)
+        ecg_matrix = convert_to_matrix(leads_data)
+    if ecg_matrix is None:
+        raise ECGDataError("No valid ECG leads in the FHIR data.")
+
+    # the matrix holds the samples from here on: the per-lead arrays are released once the source step is known
+    resolution = fhir_resolution(leads_data)
+    for lead_info in leads_data.values():
+        lead_info["data"] = None
+
+    # long (e.g. Holter) recordings keep their first 10 s for display and are analyzed window by window; the parsed
+    # (time, 12) matrix is held whole, only the resampled and filtered copies are made per window
+    sample_rate = fhir_sampling_rate(leads_data)
+    long_recording = is_long_recording(ecg_matrix.shape[0], sample_rate)
+    display_matrix = ecg_matrix[:int(round(WINDOW_SECONDS * sample_rate))] if long_recording else ecg_matrix
+    # a strip shorter than the model input keeps its real length: the zero padding would score as lead-off / flatline
+    # and skew the measurements, so only the model's copy is padded
+    model_samples = int(WINDOW_SECONDS * TARGET_SAMPLE_RATE)
+    with traced_stage("resample"):
+        resampled_matrix = resample_to_rate(display_matrix, sample_rate)[:model_samples]
+
+    # filter and score signal quality before spending AI-server capacity on the record
+    lower_limits, upper_limits = fhir_lead_limits(leads_data)
+    preprocess = partial(preprocess_ecg_matrix, sample_rate=TARGET_SAMPLE_RATE, lower_limits=lower_limits, upper_limits=upper_limits, powerline_hz=basicSettings.POWERLINE_HZ)
+    with traced_stage("preprocess"):
+        filtered_matrix, quality, preprocess_ms = preprocess(resampled_matrix)
+    if preprocess_ms > basicSettings.PREPROCESS_BUDGET_MS:
+        system_logger.warning("Preprocessing of %s took %.1f ms (budget %s ms)", record_id, preprocess_ms, basicSettings.PREPROCESS_BUDGET_MS, extra={"stages": get_stage_timings()})
+    # a long recording is gated window by window at inference instead, so a noisy first 10 s does not reject it
+    usable = is_recording_usable(quality, min_score=basicSettings.QUALITY_MIN_SCORE, min_usable_leads=basicSettings.QUALITY_MIN_USABLE_LEADS)
+    if not usable and not long_recording:
+        raise ECGQualityError(quality)
+
+    # HR, intervals and axes from the filtered 500 Hz matrix, stored with the record for dashboards and triage,
+    # with the median beat they were measured on for quick-look views and beat-level models
+    with traced_stage("measure"):
+        measurements, beat_template = measure_ecg(filtered_matrix, sample_rate=TARGET_SAMPLE_RATE, with_template=True)
+
+    # full-size renditions are rendered lazily by the image endpoint, only the thumbnail and the min/max pyramid
+    # of the waveform endpoint are made here
+    with traced_stage("persist"):
+        save_record(
+            record_id, resampled_matrix, metadata=metadata, sample_rate=TARGET_SAMPLE_RATE, measurements=measurements,
+            beat_template=beat_template, beat_r_index=beat_r_index(TARGET_SAMPLE_RATE),
+            codec=basicSettings.RECORD_CODEC, resolution=resolution or basicSettings.ECG_CODEC_RESOLUTION_UV / 1000
+        )
+        save_pyramid(record_id, build_pyramid(resampled_matrix))
+        save_thumbnail(record_id, render_ecg_image(resampled_matrix, fmt="png", dpi=basicSettings.THUMBNAIL_DPI))
+
+    return {
+        "metadata": metadata,
+        "signal_quality": quality,
+        "measurements": measurements,
+        "matrix_data": fit_length(filtered_matrix, model_samples).T,
+        "long_recording": long_recording,
+        "ecg_matrix": ecg_matrix,
+        "sample_rate": sample_rate,
+        "preprocess": preprocess,
+    }
+
+### Measurements (and optionally the median beat) of a stored, unfiltered matrix, for records saved before they were computed at ingestion ###
+def measure_stored_matrix(ecg_matrix, sample_rate=TARGET_SAMPLE_RATE, with_template=False):
+    filtered_matrix, _, _ = preprocess_ecg_matrix(ecg_matrix, sample_rate=sample_rate, powerline_hz=basicSettings.POWERLINE_HZ)
+    return measure_ecg(filtered_matrix, sample_rate=sample_rate, with_template=with_template)
+
+### Inference awaited on the event loop (remote API or local ONNX session); only the windowing of long recordings needs a worker thread ###
+async def run_inference(prepared, deadline=None):
+
+    backend = get_inference_backend()
+    if not prepared["long_recording"]:
+        return await backend.infer(prepared["matrix_data"], deadline=deadline)
+
+    # windows are cut in a worker thread, each batch is handed back to the event loop
+    infer_batch = lambda batch: from_thread.run(partial(backend.infer_batch, deadline=deadline), batch)
+    result = await run_in_threadpool(
+        analyze_windows,
+        prepared["ecg_matrix"],
+        prepared["sample_rate"],
+        infer_batch,
+        preprocess=partial(gate_window, prepared["preprocess"]),
+        overlap_seconds=basicSettings.WINDOW_OVERLAP_SECONDS,
+        batch_size=basicSettings.INFERENCE_BATCH_SIZE
+    )
+    if not result["aggregate"]["windows"]:
+        raise ECGQualityError(prepared["signal_quality"])
+    return result
+
+async def process_fhir_data(file_data, record_id):
+
+    prepared = await run_in_threadpool(prepare_fhir_data, file_data, record_id)
+
+    processed_result = None
+    if basicSettings.ENABLE_AI_INFERENCE:
+        with traced_stage("inference"):
+            processed_result = await run_inference(prepared, deadline=current_deadline())
+
+    return {
+        "metadata": prepared["metadata"],
+        "signal_quality": prepared["signal_quality"],
+        "measurements": prepared["measurements"],
+        "result": processed_result,
+    }
+
+if __name__ == "__main__":
+    pass
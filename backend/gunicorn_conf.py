@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.append("./")
+
+from app.configs.config import basicSettings
+from app.core.startup import freeze_before_fork, prewarm
+
+
+# gunicorn -c gunicorn_conf.py main:APP
+bind = f"127.0.0.1:{basicSettings.SERVICE_PORT}"
+workers = basicSettings.WORKER_COUNT
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True  # import main:APP once in the master, workers are forked from it
+logconfig_dict = None
+
+
+def on_starting(server):
+    prewarm()
+
+def pre_fork(server, worker):
+    freeze_before_fork()
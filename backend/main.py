@@ -1,11 +1,13 @@
+import argparse
+import asyncio
 import logging
 import os
-import requests
 import sys
 import time
-import uvicorn
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
@@ -21,16 +23,77 @@ sys.path.append("./")
 
 
 from app.configs.config import basicSettings
-# from app.database.smart import Engine
+from app.core.deadline import set_request_deadline
+from app.core.health import get_health_monitor
+from app.core.logger import get_stage_timings, new_request_id, start_logging, stop_logging
+from app.core.startup import prewarm
+from app.core.tracing import current_trace_ids, setup_tracing, start_span
+from app.middleware.admission import AdmissionMiddleware
+from app.middleware.compression import CompressionMiddleware
+from app.misc.utils.fast_json import FastJSONResponse
+from app.misc.utils.fhir_writeback import get_fhir_writeback
+from app.misc.utils.inference_backend import get_inference_backend
+from app.misc.utils.rate_limit import create_limiter_store
+from app.misc.utils.storage import retention_loop
+from app.misc.utils.webhooks import get_webhook_dispatcher
 from app.routers.v1.base import router_v1
 from app.middleware.exception import exception_message
+from app.security.jwtAuth import decode_token_subject
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    setup_tracing(basicSettings.TRACING_EXPORTER, basicSettings.TRACING_FILE)
+
+    # log records are formatted and written by a background listener thread
+    start_logging(basicSettings.LOG_CONFIG or None, rate_limit_interval=basicSettings.LOG_RATE_LIMIT_SECONDS, rate_limit_burst=basicSettings.LOG_RATE_LIMIT_BURST)
+
+    # no-op when the master already pre-warmed before fork (preload mode)
+    if basicSettings.PREWARM_ON_STARTUP:
+        prewarm()
+
+    # ONNX Runtime sessions own thread pools that do not survive fork, so every worker loads its own here
+    if basicSettings.ENABLE_AI_INFERENCE and basicSettings.INFERENCE_BACKEND == "local":
+        await run_in_threadpool(get_inference_backend().session)
+
+    if basicSettings.ECG_INDEX_ENABLED:
+        from app.database.smart import init_db
+
+        try:
+            await run_in_threadpool(init_db)
+        except Exception as e:
+            system_logger.error("ECG result index unavailable: %s", exception_message(e))
+
+    retention_task = asyncio.create_task(retention_loop())
+    health_task = asyncio.create_task(get_inference_backend().health_loop()) if basicSettings.ENABLE_AI_INFERENCE else None
+    writeback_task = asyncio.create_task(get_fhir_writeback().run()) if basicSettings.FHIR_WRITEBACK_ENABLED else None
+    webhook_task = asyncio.create_task(get_webhook_dispatcher().run()) if basicSettings.WEBHOOKS_ENABLED else None
+    monitor_task = asyncio.create_task(get_health_monitor().run())
+
+    yield
+
+    monitor_task.cancel()
+    retention_task.cancel()
+    if health_task is not None:
+        health_task.cancel()
+        await get_inference_backend().aclose()
+    if writeback_task is not None:
+        writeback_task.cancel()
+        await get_fhir_writeback().aclose()
+    if webhook_task is not None:
+        webhook_task.cancel()
+        await get_webhook_dispatcher().aclose()
+    stop_logging()
 
 
 def init_app():
 
     app = FastAPI(
         version=basicSettings.VERSION,
-        titie="Smart app"
+        titie="Smart app",
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse
     )
     
     app.include_router(router_v1, prefix=basicSettings.BASE_PREFIX)
@@ -42,6 +105,29 @@ def init_app():
     
     origins = ["http://localhost"]
     
+    # gzip / zstd request bodies and responses
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=basicSettings.RESPONSE_COMPRESSION_MIN_BYTES,
+        max_request_bytes=basicSettings.MAX_UPLOAD_BYTES
+    )
+
+    # rejects floods of uploads from the headers alone, before the body is read
+    if basicSettings.ADMISSION_ENABLED:
+        app.add_middleware(
+            AdmissionMiddleware,
+            store=create_limiter_store(basicSettings.ADMISSION_BACKEND, basicSettings.ADMISSION_SQLITE_PATH or None),
+            routes=[("POST", f"{basicSettings.BASE_PREFIX}/SMART-ECG")],
+            user_rate=basicSettings.RATE_LIMIT_USER_PER_MINUTE / 60,
+            user_burst=basicSettings.RATE_LIMIT_USER_BURST,
+            ip_rate=basicSettings.RATE_LIMIT_IP_PER_MINUTE / 60,
+            ip_burst=basicSettings.RATE_LIMIT_IP_BURST,
+            max_concurrency=basicSettings.MAX_CONCURRENT_UPLOADS or None,
+            trust_forwarded=basicSettings.ADMISSION_TRUST_FORWARDED,
+            token_subject=decode_token_subject
+        )
+
+    # added last = outermost, so admission's 429 / 503 responses carry the CORS headers as well
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
@@ -58,6 +144,7 @@ APP = init_app()
 
 uvicorn_logger = logging.getLogger('uvicorn.error')
 system_logger = logging.getLogger('custom.error')
+request_logger = logging.getLogger('custom.request')
 
 
 @APP.middleware("http")
@@ -67,20 +154,37 @@ async def log_middleware(request:Request, call_next):
     # print(request.client.host)
     
     start_time = time.time()
+    request_id = new_request_id(request.headers.get("X-Request-ID"))
+    set_request_deadline(request.headers.get("X-Request-Timeout"), basicSettings.REQUEST_TIMEOUT_SECONDS)
     
-    try:
-        response = await call_next(request)
-    
-    except Exception as e:
-        system_logger.error(exception_message(e))
-        response = JSONResponse(
-            status_code=500,
-            content={"message":"internal server error"}
-        )
-        
-    finally:
-        process_time = time.time() - start_time
+    # server span, continuing the caller's trace when a traceparent header is sent
+    with start_span(f"{request.method} {request.url.path}", kind="server", traceparent=request.headers.get("traceparent"), **{"http.method": request.method, "http.target": request.url.path, "request.id": request_id}) as span:
+        response = None
+        try:
+            response = await call_next(request)
+
+        except Exception as e:
+            system_logger.error(exception_message(e))
+            response = JSONResponse(
+                status_code=500,
+                content={"message":"internal server error"}
+            )
+
+        finally:
+            # response stays None when call_next is interrupted by a BaseException (cancellation, shutdown); it propagates after logging
+            process_time = time.time() - start_time
+            status_code = response.status_code if response is not None else 500
+            span.set_attribute("http.status_code", status_code)
+            request_logger.info(
+                f"{request.method} {request.url.path} {status_code}",
+                extra={"method": request.method, "path": request.url.path, "status": status_code, "duration_ms": round(process_time * 1000, 2), "stages": get_stage_timings()}
+            )
+
+        trace_id, _ = current_trace_ids()
         response.headers["X-Process-Time"] = str(process_time)
+        response.headers["X-Request-ID"] = request_id
+        if trace_id:
+            response.headers["X-Trace-ID"] = trace_id
         return response
 
 # Define Exception Handler
@@ -106,12 +210,22 @@ async def http_exception_handler(
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preload", action="store_true", help="import and pre-warm once in the master, then fork workers (gunicorn)")
+    args = parser.parse_args()
+
+    if args.preload:
+        # gunicorn forks workers after importing the app, so they share its memory copy-on-write
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn_conf.py", "main:APP"])
+
+    import uvicorn
+
     uvicorn.run(
         "main:APP",        # 指定檔案名稱和 APP 實例
         host="127.0.0.1",  # 預設運行在本機
-        port=8000,         # 預設端口為 8000
-        workers=5,
-        reload=True        # 開發模式下使用自動重載
+        port=basicSettings.SERVICE_PORT,  # FASTAPI_PORT, the same port gunicorn_conf.py binds
+        workers=1 if basicSettings.SERVICE_DEBUG else basicSettings.WORKER_COUNT,
+        reload=basicSettings.SERVICE_DEBUG  # 開發模式下使用自動重載 (reload 只支援單一 worker)
     )
     
     # expose_port = os.environ['FASTAPI_PORT']
@@ -0,0 +1,46 @@
+import os
+import re
+import subprocess
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+### Run `python -X importtime -c "import <module>"` and return [(cumulative_us, self_us, depth, name)] ###
+def measure_import_time(module="main"):
+
+    env = dict(os.environ)
+    env.setdefault("FASTAPI_PORT", "8000")
+    env.setdefault("WORKER_COUNT", "1")
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+    return entries
+
+if __name__ == "__main__":
+
+    # python scripts/check_import_time.py [budget_ms] -> exit 1 when `import main` exceeds the budget
+    from app.configs.config import basicSettings
+
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else basicSettings.IMPORT_TIME_BUDGET_MS
+    entries = measure_import_time("main")
+    total_ms = next(cumulative for cumulative, _, _, name in entries if name == "main") / 1000
+
+    print(f"import main: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    print("Slowest top-level imports:")
+    for cumulative, _, depth, name in sorted((e for e in entries if e[2] <= 1), reverse=True)[:15]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    sys.exit(0 if total_ms <= budget_ms else 1)
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+### Stand-in for the FHIR server: transaction Bundles with conditional creates, injectable latency and failures ###
+def create_stub_app(latency_ms=20.0, failure_rate=0.0):
+    """
+    POST / takes a `transaction` Bundle: entries with `ifNoneExist` that match a stored identifier answer 200 with the
+    existing resource, others are created (201) and urn:uuid references are rewritten to the assigned ids.
+    failure_rate: share of transactions answered with 503. GET /_stats and GET /{type} (all stored resources) help tests.
+    """
+
+    app = FastAPI()
+    state = {"resources": {}, "identifiers": {}, "transactions": 0, "failures": 0}
+    ids = itertools.count(1)
+
+    @app.get("/_stats")
+    async def stats():
+        counts = {}
+        for resource_type, _ in state["resources"]:
+            counts[resource_type] = counts.get(resource_type, 0) + 1
+        return {"transactions": state["transactions"], "failures": state["failures"], "resources": counts}
+
+    @app.get("/{resource_type}")
+    async def search(resource_type: str):
+        resources = [resource for (kind, _), resource in state["resources"].items() if kind == resource_type]
+        return {"resourceType": "Bundle", "type": "searchset", "total": len(resources), "entry": [{"resource": resource} for resource in resources]}
+
+    @app.post("/")
+    async def transaction(request: Request):
+        await asyncio.sleep(max(0.0, random.gauss(latency_ms, latency_ms / 4)) / 1000)
+        if random.random() < failure_rate:
+            state["failures"] += 1
+            return JSONResponse(status_code=503, content={"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "transient"}]})
+
+        bundle = await request.json()
+        if bundle.get("resourceType") != "Bundle" or bundle.get("type") != "transaction":
+            return JSONResponse(status_code=400, content={"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "invalid"}]})
+
+        state["transactions"] += 1
+        resolved, responses = {}, []
+        for entry in bundle.get("entry", []):
+            resource, request_info = entry["resource"], entry["request"]
+            condition = request_info.get("ifNoneExist", "").removeprefix("identifier=")
+            existing = state["identifiers"].get((resource["resourceType"], condition)) if condition else None
+            if existing:
+                resolved[entry.get("fullUrl")] = existing
+                responses.append({"response": {"status": "200 OK", "location": existing}})
+                continue
+
+            resource_id = str(next(ids))
+            location = f"{resource['resourceType']}/{resource_id}"
+            resolved[entry.get("fullUrl")] = location
+            state["resources"][(resource["resourceType"], resource_id)] = {**resource, "id": resource_id}
+            if condition:
+                state["identifiers"][(resource["resourceType"], condition)] = location
+            responses.append({"response": {"status": "201 Created", "location": location}})
+
+        for resource in state["resources"].values():  # rewrite urn:uuid references within this transaction
+            for reference in resource.get("result", []):
+                reference["reference"] = resolved.get(reference["reference"], reference["reference"])
+
+        return {"resourceType": "Bundle", "type": "transaction-response", "entry": responses}
+
+    return app
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Local stub of the FHIR server for testing the FHIR write-back")
+    parser.add_argument("--port", type=int, default=10004)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_stub_app(args.latency_ms, args.failure_rate), host="127.0.0.1", port=args.port)
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+### Stand-in for the model server with injectable latency and failures ###
+def create_stub_app(latency_ms=50.0, jitter_ms=20.0, slow_rate=0.0, slow_ms=2000.0, failure_rate=0.0):
+    """
+    Serves POST /api/v1/standard/inference and GET /health like the real AI server.
+    slow_rate: share of requests delayed by slow_ms (tail latency); failure_rate: share answered with 503.
+    """
+
+    app = FastAPI()
+    state = {"requests": 0}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "requests": state["requests"]}
+
+    @app.post("/api/v1/standard/inference")
+    async def inference(request: Request):
+        state["requests"] += 1
+        body = await request.json()
+        n_leads = len(json.loads(body["data"]))
+
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms))
+        if random.random() < slow_rate:
+            delay += slow_ms
+        await asyncio.sleep(delay / 1000)
+
+        if random.random() < failure_rate:
+            return JSONResponse(status_code=503, content={"message": "injected failure"})
+        return {"leads": n_leads, "traceparent": request.headers.get("traceparent"), "prediction": {"afib": random.random(), "lvef_low": random.random()}}
+
+    return app
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Local stub of the AI inference server for testing the inference client")
+    parser.add_argument("--port", type=int, default=18392)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_stub_app(args.latency_ms, args.jitter_ms, args.slow_rate, args.slow_ms, args.failure_rate), host="127.0.0.1", port=args.port)
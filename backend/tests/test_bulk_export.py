@@ -0,0 +1,83 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from app.misc.utils import record_store
+from app.misc.utils.bulk_export import BulkExport, export_manifest, iter_ndjson
+from app.misc.utils.storage import BlobStore, LocalStorage
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    monkeypatch.setattr(record_store, "RECORD_DIR", str(tmp_path / "record"))
+    (tmp_path / "record").mkdir()
+    return BulkExport(str(tmp_path / "export"), blob_store=BlobStore(LocalStorage(str(tmp_path / "json"))))
+
+
+def run_export(exporter, **kwargs):
+
+    async def scenario():
+        job_id = await exporter.start("http://test/$export", **kwargs)
+        await asyncio.gather(*exporter._tasks.values())
+        return exporter.status(job_id)
+
+    return asyncio.run(scenario())
+
+
+def read_output(exporter, job, resource_type):
+    lines = []
+    for output in job["output"] + job["error"]:
+        if output["type"] == resource_type:
+            with gzip.open(exporter.file_path(job["id"], output["file"]), "rt") as f:
+                lines += [json.loads(line) for line in f]
+    return lines
+
+
+def test_evicted_source_blob_is_reported(exporter):
+    matrix = np.zeros((500, 12))
+    for record_id in ("kept", "evicted"):
+        record_store.save_record(record_id, matrix)
+        record_store.update_meta(record_id, source_key=exporter.blob_store.put(json.dumps({"resourceType": "Observation", "id": record_id}).encode()))
+    exporter.blob_store.backend.delete(record_store.load_meta("evicted")["source_key"])
+
+    job = run_export(exporter)
+
+    assert job["state"] == "complete" and job["processed"] == 2
+    assert [resource["id"] for resource in read_output(exporter, job, "Observation")] == ["kept"]
+    assert sorted(resource["id"] for resource in read_output(exporter, job, "ECGRecord")) == ["evicted", "kept"]
+    outcomes = read_output(exporter, job, "OperationOutcome")
+    assert [outcome["issue"][0]["diagnostics"] for outcome in outcomes] == ["evicted: source blob evicted"]
+
+
+def test_missing_matrix_since_filter_and_manifest(exporter, tmp_path):
+    for record_id in ("old", "new", "broken"):
+        record_store.save_record(record_id, np.full((500, 12), 0.5))
+    os.utime(record_store.meta_path("old"), (1000, 1000))
+    os.remove(record_store.matrix_path("broken"))
+
+    job = run_export(exporter, since=datetime(2000, 1, 1, tzinfo=timezone.utc), types=("ECGRecord",))
+
+    assert job["processed"] == 2 and job["types"] == ["ECGRecord"]
+    (ecg_record,) = read_output(exporter, job, "ECGRecord")
+    assert ecg_record["id"] == "new" and ecg_record["shape"] == [500, 12]
+    assert np.frombuffer(base64.b64decode(ecg_record["data"]), dtype="<f4").reshape(500, 12).tolist() == np.full((500, 12), 0.5).tolist()
+    (outcome,) = read_output(exporter, job, "OperationOutcome")
+    assert outcome["issue"][0]["diagnostics"].startswith("broken: ")
+
+    manifest = export_manifest(job, lambda job_id, file_name: f"http://test/{job_id}/{file_name}")
+    assert [(output["type"], output["count"]) for output in manifest["output"]] == [("ECGRecord", 1)]
+    assert [(output["type"], output["count"]) for output in manifest["error"]] == [("OperationOutcome", 1)]
+    assert b"".join(iter_ndjson(exporter.file_path(job["id"], manifest["output"][0]["url"].rsplit("/", 1)[1]))).count(b"\n") == 1
+
+
+def test_deleted_job_is_gone(exporter):
+    job = run_export(exporter)
+    assert exporter.delete(job["id"]) and exporter.status(job["id"]) is None
+    assert not exporter.delete(job["id"])
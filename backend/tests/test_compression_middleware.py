@@ -0,0 +1,36 @@
+import gzip
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.middleware.compression import CompressionMiddleware
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        try:
+            return {"length": len(await request.body())}
+        except Exception:  # handlers swallowing the error still answer with the middleware's status
+            return {"length": None}
+
+    app.add_middleware(CompressionMiddleware, max_request_bytes=1000)
+    return TestClient(app)
+
+
+def test_inflated_request_body():
+    response = make_client().post("/echo", content=gzip.compress(b"x" * 500), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 200 and response.json() == {"length": 500}
+
+
+def test_corrupt_or_truncated_request_body_is_400():
+    client = make_client()
+    assert client.post("/echo", content=b"\x1f\x8bnot gzip", headers={"Content-Encoding": "gzip"}).status_code == 400
+    assert client.post("/echo", content=gzip.compress(b"x" * 500)[:-8], headers={"Content-Encoding": "gzip"}).status_code == 400
+
+
+def test_oversized_request_body_is_413():
+    response = make_client().post("/echo", content=gzip.compress(b"x" * 5000), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
@@ -0,0 +1,37 @@
+import numpy as np
+
+from app.misc.utils import record_store
+from app.misc.utils.ecg_codec import decode_matrix, encode_matrix, is_lossless
+from app.misc.utils.lead_normalize import PROJECTION
+
+
+def source_matrix(resolution=0.005, n_samples=5000, seed=0):
+    # 8 independent leads of integer counts, the limb leads derived from them sit on half steps
+    counts = np.cumsum(np.random.default_rng(seed).integers(-20, 21, size=(n_samples, 8)), axis=0)
+    return (counts * resolution) @ PROJECTION.T
+
+
+def test_round_trip_on_the_source_grid_is_exact():
+    matrix = source_matrix()
+    assert is_lossless(matrix, 0.005)
+    assert np.abs(decode_matrix(encode_matrix(matrix, 0.005)) - matrix).max() < 0.005 * 1e-6
+
+
+def test_flat_and_short_leads_round_trip():
+    matrix = np.zeros((3, 12))
+    matrix[:, 0] = [0.01, -0.02, 0.03]
+    assert np.array_equal(decode_matrix(encode_matrix(matrix, 0.01)), matrix)
+
+
+def test_off_grid_matrix_is_stored_as_npy(tmp_path, monkeypatch):
+    monkeypatch.setattr(record_store, "RECORD_DIR", str(tmp_path))
+    resampled = source_matrix() + np.random.default_rng(1).normal(0, 1e-4, size=(5000, 12))
+    assert not is_lossless(resampled, 0.005)
+
+    meta = record_store.save_record("off_grid", resampled, codec="ecg", resolution=0.005)
+    assert meta["codec"] == "npy"
+    assert np.array_equal(record_store.load_matrix("off_grid"), resampled)
+
+    meta = record_store.save_record("on_grid", source_matrix(), codec="ecg", resolution=0.005)
+    assert meta["codec"] == "ecg"
+    assert np.abs(record_store.load_matrix("on_grid") - source_matrix()).max() < 0.005 * 1e-6
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from app.misc.utils import record_store
+from app.misc.utils.ecg_measurements import beat_r_index, beat_windows, detect_r_peaks, measure_ecg, median_beat
+from app.misc.utils.lead_normalize import LEAD_INDEX
+
+
+SAMPLE_RATE = 500
+R_TIMES = np.arange(0.4, 10, 0.8)  # 75 bpm
+LEAD_GAINS = np.array([1.0, 1.2, 0.2, -1.1, 0.4, 0.7, -0.5, 0.3, 0.8, 1.2, 1.1, 0.9])
+
+
+def waves(t, centers, sigma, amplitude):
+    return amplitude * np.exp(-((t[:, None] - centers[None, :]) ** 2) / (2 * sigma ** 2)).sum(axis=1)
+
+
+def beat_train(seconds=10, axis_deg=60):
+    """P 160 ms before R, Q / R / S, T 300 ms after R; leads I and aVF put the frontal axis at `axis_deg`."""
+
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    beat = waves(t, R_TIMES - 0.16, 0.02, 0.15) \
+        + waves(t, R_TIMES, 0.012, 1.0) - waves(t, R_TIMES - 0.025, 0.008, 0.15) - waves(t, R_TIMES + 0.025, 0.008, 0.2) \
+        + waves(t, R_TIMES + 0.3, 0.04, 0.3)
+    ecg_matrix = beat[:, None] * LEAD_GAINS[None, :]
+    ecg_matrix[:, LEAD_INDEX['I']] = beat * np.cos(np.radians(axis_deg))
+    ecg_matrix[:, LEAD_INDEX['aVF']] = beat * np.sin(np.radians(axis_deg)) * np.sqrt(3) / 2
+    return ecg_matrix
+
+
+def test_r_peaks_of_a_beat_train():
+    r_peaks = detect_r_peaks(beat_train(), SAMPLE_RATE)
+    np.testing.assert_allclose(r_peaks, R_TIMES * SAMPLE_RATE, atol=2)
+    assert detect_r_peaks(beat_train()[:SAMPLE_RATE // 2], SAMPLE_RATE).size == 0  # under a second
+
+
+def test_intervals_and_axes_of_a_beat_train():
+    measurements = measure_ecg(beat_train(axis_deg=30), SAMPLE_RATE)
+
+    assert measurements["beats"] == R_TIMES.size
+    assert measurements["heart_rate_bpm"] == pytest.approx(75, abs=0.5)
+    assert measurements["rr_ms"] == pytest.approx(800, abs=5)
+    assert 130 <= measurements["pr_ms"] <= 190
+    assert 70 <= measurements["qrs_ms"] <= 110
+    assert 380 <= measurements["qt_ms"] <= 460
+    assert measurements["qtc_bazett_ms"] == pytest.approx(measurements["qt_ms"] / np.sqrt(0.8), abs=1)
+    for field in ("p_axis_deg", "qrs_axis_deg", "t_axis_deg"):
+        assert measurements[field] == pytest.approx(30, abs=3)
+
+
+def test_vendor_values_take_precedence():
+    measurements = measure_ecg(beat_train(), SAMPLE_RATE, vendor={"qt_ms": 400, "qrs_ms": None})
+
+    assert measurements["qt_ms"] == 400 and measurements["vendor_fields"] == ["qt_ms"]
+    assert measurements["qtc_bazett_ms"] == pytest.approx(400 / np.sqrt(0.8), abs=1)
+    assert 70 <= measurements["qrs_ms"] <= 110
+
+
+def test_no_beats_in_a_flat_strip():
+    measurements = measure_ecg(np.zeros((10 * SAMPLE_RATE, 12)), SAMPLE_RATE)
+    assert measurements["beats"] == 0 and measurements["heart_rate_bpm"] is None and measurements["qrs_ms"] is None
+
+
+def test_beat_windows_are_slices_around_each_r_peak():
+    ecg_matrix = beat_train()
+    beats, kept = beat_windows(ecg_matrix, [100, 1000, 1400, 4900], 200, 300)
+
+    assert kept.tolist() == [1000, 1400]  # peaks too close to either edge are dropped
+    np.testing.assert_array_equal(beats[0], ecg_matrix[800:1300].T)
+
+
+def test_median_beat_ignores_an_outlier_beat():
+    clean = beat_train()
+    ecg_matrix = clean.copy()
+    r_peaks = (R_TIMES * SAMPLE_RATE).astype(int)
+    ecg_matrix[r_peaks[5] - 100:r_peaks[5] + 100] += 2.0  # one artefact-ridden beat
+
+    template, r_index = median_beat(ecg_matrix, r_peaks, SAMPLE_RATE)
+
+    assert r_index == beat_r_index(SAMPLE_RATE) == 200 and template.shape == (500, 12)
+    np.testing.assert_allclose(template, clean[r_peaks[3] - 200:r_peaks[3] + 300], atol=1e-9)
+    assert template[:, LEAD_INDEX['II']].argmax() == r_index
+
+
+def test_beat_template_is_stored_with_the_record(tmp_path, monkeypatch):
+    monkeypatch.setattr(record_store, "RECORD_DIR", str(tmp_path))
+    measurements, template = measure_ecg(beat_train(), SAMPLE_RATE, with_template=True)
+
+    meta = record_store.save_record("r1", beat_train(), measurements=measurements, beat_template=template, beat_r_index=beat_r_index(SAMPLE_RATE))
+
+    assert meta["beat"] == {"samples": 500, "r_index": 200}
+    stored = record_store.load_beat("r1")
+    assert stored.dtype == np.float32 and stored.shape == (500, 12)
+    np.testing.assert_allclose(stored, template, atol=1e-6)
+    assert measure_ecg(np.zeros((10 * SAMPLE_RATE, 12)), SAMPLE_RATE, with_template=True)[1] is None
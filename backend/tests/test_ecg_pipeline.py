@@ -0,0 +1,38 @@
+import copy
+import json
+import os
+import pytest
+
+from app.misc.utils import image_cache, record_store, waveform_lod
+from app.services import ecg_pipeline
+
+
+TEST_JSON = os.path.join(os.path.dirname(__file__), "..", "app", "misc", "utils", "file", "test.json")
+
+
+@pytest.fixture
+def observation(tmp_path, monkeypatch):
+    for module, name in ((record_store, "RECORD_DIR"), (waveform_lod, "RECORD_DIR"), (image_cache, "THUMBNAIL_DIR")):
+        monkeypatch.setattr(module, name, str(tmp_path))
+    with open(TEST_JSON, "rb") as f:
+        return json.load(f)
+
+
+def cut(observation, seconds):
+    # test.json is a clean 6.5 s strip at 1000 Hz
+    cut_observation = copy.deepcopy(observation)
+    for component in cut_observation["component"]:
+        sampled_data = component["valueSampledData"]
+        sampled_data["data"] = " ".join(sampled_data["data"].split()[:int(seconds * 1000)])
+    return cut_observation
+
+
+@pytest.mark.parametrize("seconds", [3, 4, 6.5])
+def test_short_clean_strip_passes_the_quality_gate(observation, seconds):
+    prepared = ecg_pipeline.prepare_fhir_data(cut(observation, seconds), f"short_{seconds}")
+
+    assert not any(lead["lead_off"] or lead["flatline"] for lead in prepared["signal_quality"].values())
+    assert prepared["matrix_data"].shape == (12, 5000)  # the model still gets its fixed-length input
+    assert record_store.load_matrix(f"short_{seconds}").shape == (int(seconds * 500), 12)
+    full_length = ecg_pipeline.prepare_fhir_data(observation, "full")
+    assert abs(prepared["measurements"]["heart_rate_bpm"] - full_length["measurements"]["heart_rate_bpm"]) < 5
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import httpx
+
+from app.misc.utils.fhir_writeback import FhirWriteback, IDENTIFIER_SYSTEM, report_entries
+
+
+METADATA = {"id": "ecg-1", "subject": "Patient/1", "effectiveDateTime": "2026-01-01T00:00:00Z"}
+RESULT = {"prediction": {"af": 0.2, "normal": 0.7}}
+
+
+def test_report_entries_are_conditional_creates():
+    entries = report_entries("r1", METADATA, RESULT)
+    *observations, report = entries
+
+    assert [entry["resource"]["code"]["coding"][0]["code"] for entry in observations] == ["normal", "af"]
+    assert all(entry["request"]["ifNoneExist"] == f"identifier={IDENTIFIER_SYSTEM}|{entry['resource']['identifier'][0]['value']}" for entry in entries)
+    assert observations[0]["resource"]["derivedFrom"] == [{"reference": "Observation/ecg-1"}]
+    assert report["resource"]["result"] == [{"reference": entry["fullUrl"]} for entry in observations]
+    assert report["resource"]["subject"] == {"reference": "Patient/1"}
+    assert [entry["fullUrl"] for entry in report_entries("r1", METADATA, RESULT)] == [entry["fullUrl"] for entry in entries]
+    assert report_entries("r1", METADATA, {"prediction": {}}) == []
+
+
+def run(handler, submissions, **kwargs):
+    bundles = []
+
+    def record(request):
+        bundles.append(json.loads(request.content))
+        return handler(request, bundles[-1])
+
+    async def scenario():
+        writeback = FhirWriteback("http://fhir", backoff=0.0, transport=httpx.MockTransport(record), **kwargs)
+        for record_id in submissions:
+            writeback.submit(record_id, METADATA, RESULT)
+        flushed = await writeback.flush()
+        await writeback.aclose()
+        return writeback, flushed
+
+    return (*asyncio.run(scenario()), bundles)
+
+
+def report_ids(bundle):
+    return [entry["resource"]["identifier"][0]["value"] for entry in bundle["entry"] if entry["resource"]["resourceType"] == "DiagnosticReport"]
+
+
+def test_reports_are_sent_in_transaction_bundles():
+    writeback, flushed, bundles = run(lambda request, bundle: httpx.Response(200), ["r1", "r2", "r3", "r4", "r5"], batch_size=2)
+
+    assert flushed and writeback.pending() == 0 and writeback.stats["sent"] == 5
+    assert [report_ids(bundle) for bundle in bundles] == [["r1", "r2"], ["r3", "r4"], ["r5"]]
+    assert {bundle["type"] for bundle in bundles} == {"transaction"}
+
+
+def test_rejected_bundle_is_split_to_isolate_the_bad_report():
+    handler = lambda request, bundle: httpx.Response(422 if "bad" in report_ids(bundle) else 200)
+    writeback, flushed, bundles = run(handler, ["r1", "bad", "r2", "r3"], batch_size=4)
+
+    assert flushed and writeback.stats["sent"] == 3 and writeback.stats["rejected"] == 1
+    assert report_ids(bundles[0]) == ["r1", "bad", "r2", "r3"]
+
+
+def test_unavailable_server_keeps_the_batch():
+    writeback, flushed, bundles = run(lambda request, bundle: httpx.Response(503), ["r1", "r2"], max_retries=2)
+
+    assert not flushed and writeback.pending() == 2 and writeback.stats["sent"] == 0
+    assert len(bundles) == 3 * 2  # first flush and the final flush at aclose, each with 2 retries
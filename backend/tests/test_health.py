@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from app.core.health import HealthMonitor
+
+
+def test_required_probe_failures_make_the_worker_not_ready():
+
+    async def up():
+        return True
+
+    async def down():
+        raise ConnectionError("refused")
+
+    async def hangs():
+        await asyncio.sleep(1)
+
+    async def scenario():
+        monitor = HealthMonitor(probe_timeout=0.05, required=["database"])
+        monitor.add_probe("inference", up)
+        monitor.add_probe("fhir", hangs)
+        monitor.add_probe("database", down)
+        monitor.add_gauge("webhook_outbox", lambda: 3)
+        await monitor.check_dependencies()
+        return monitor.readiness()
+
+    ready, report = asyncio.run(scenario())
+    assert not ready and report["reasons"] == ["database unavailable"]
+    assert report["dependencies"]["inference"]["healthy"]
+    assert report["dependencies"]["fhir"]["error"] == "timeout after 0.05 s"  # optional dependency: reported only
+    assert "refused" in report["dependencies"]["database"]["error"]
+    assert report["queues"] == {"webhook_outbox": 3}
+
+
+def test_blocked_event_loop_sheds_load():
+
+    async def scenario():
+        monitor = HealthMonitor(max_loop_lag=0.1, interval=0.01)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+        healthy = monitor.readiness()
+        time.sleep(0.3)  # a handler blocking the loop
+        await asyncio.sleep(0.02)
+        blocked = monitor.readiness()
+        task.cancel()
+        return healthy, blocked
+
+    (was_ready, _), (ready, report) = asyncio.run(scenario())
+    assert was_ready
+    assert not ready and report["reasons"][0].startswith("event loop lag") and report["max_loop_lag_ms"] >= 200
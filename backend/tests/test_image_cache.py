@@ -0,0 +1,29 @@
+import os
+
+from app.misc.utils.image_cache import etag_matches, ImageCache, rendition_etag
+
+
+def test_etag_changes_with_matrix_and_rendition():
+    etag = rendition_etag("digest", "png", 100)
+    assert etag == rendition_etag("digest", "png", 100)
+    assert len({etag, rendition_etag("other", "png", 100), rendition_etag("digest", "svg", 100), rendition_etag("digest", "png", 200), rendition_etag("digest", "png", 100, ["II"])}) == 5
+
+
+def test_if_none_match():
+    assert etag_matches('"x", "abc"', "abc")
+    assert etag_matches("*", "abc")
+    assert not etag_matches('"abcd"', "abc")
+    assert not etag_matches(None, "abc")
+
+
+def test_least_recently_used_renditions_are_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=250)
+    for index, etag in enumerate(("a", "b")):
+        cache.put(etag, "png", b"x" * 100)
+        os.utime(cache.path(etag, "png"), (1000 + index, 1000 + index))
+
+    assert cache.get("a", "png") == b"x" * 100  # now the most recently used
+    cache.put("c", "png", b"x" * 100)
+
+    assert cache.get("b", "png") is None
+    assert cache.get("a", "png") is not None and cache.get("c", "png") is not None
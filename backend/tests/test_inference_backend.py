@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from app.core.deadline import DeadlineExceeded
+from app.misc.utils.inference_backend import OnnxInferenceBackend, prediction_scores
+
+
+def lead_means_model(path, layout="NCL"):
+    """ONNX graph whose first output is the mean of each lead and whose second is its maximum."""
+
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import helper, TensorProto
+
+    axis = 2 if layout == "NCL" else 1
+    shape = ["N", 12, "L"] if layout == "NCL" else ["N", "L", 12]
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["ecg", "axes"], ["score"], keepdims=0),
+            helper.make_node("ReduceMax", ["ecg", "axes"], ["peak"], keepdims=0),
+        ],
+        "lead_means",
+        [helper.make_tensor_value_info("ecg", TensorProto.FLOAT, shape)],
+        [helper.make_tensor_value_info("score", TensorProto.FLOAT, ["N", 12]), helper.make_tensor_value_info("peak", TensorProto.FLOAT, ["N", 12])],
+        [helper.make_tensor("axes", TensorProto.INT64, [1], [axis])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 18)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+BATCH = np.arange(5, dtype=np.float64)[:, None, None] + np.zeros((5, 12, 100))  # record i is constant i
+
+
+@pytest.mark.parametrize("layout", ["NCL", "NLC"])
+def test_onnx_backend_batches_and_labels(tmp_path, layout):
+    labels = [f"label_{index}" for index in range(12)]
+    backend = OnnxInferenceBackend(lead_means_model(tmp_path / "model.onnx", layout), input_layout=layout, labels=labels, max_batch_size=2)
+
+    assert not asyncio.run(backend.ready())
+    results = asyncio.run(backend.infer_batch(BATCH))
+
+    assert [result["prediction"]["label_3"] for result in results] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert results[4]["peak"] == [4.0] * 12
+    assert asyncio.run(backend.ready())
+    assert asyncio.run(backend.infer(BATCH[2]))["prediction"]["label_0"] == 2.0
+
+
+def test_onnx_backend_respects_the_deadline(tmp_path):
+    backend = OnnxInferenceBackend(lead_means_model(tmp_path / "model.onnx"))
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(backend.infer_batch(BATCH, deadline=time.monotonic() - 1))
+
+
+def test_prediction_scores():
+    assert prediction_scores({"prediction": {"af": 0.7, "flag": True, "note": "x"}}) == {"af": 0.7}
+    assert prediction_scores({"aggregate": {"max": {"prediction.af": 0.9}}}) == {"af": 0.9}
+    assert prediction_scores(None) == {}
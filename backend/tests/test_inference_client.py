@@ -0,0 +1,130 @@
+import asyncio
+import httpx
+import numpy as np
+import pytest
+import time
+
+from app.core.deadline import DeadlineExceeded
+from app.misc.utils.inference_client import InferenceClient, InferenceUnavailableError
+
+
+MATRIX = np.zeros((12, 10))
+
+
+def make_client(status):
+    def handler(request):
+        return httpx.Response(status["code"], json={"result": "ok"})
+    return InferenceClient(["http://model"], failure_threshold=2, reset_timeout=0.05, hedging=False, transport=httpx.MockTransport(handler))
+
+
+def test_breaker_recovers_after_expired_deadline_in_half_open():
+
+    async def scenario():
+        status = {"code": 500}
+        client = make_client(status)
+        breaker = client.endpoints[0].breaker
+
+        for _ in range(2):
+            with pytest.raises(InferenceUnavailableError):
+                await client.infer(MATRIX)
+        assert breaker.state == "open"
+        with pytest.raises(InferenceUnavailableError):
+            await client.infer(MATRIX)
+
+        await asyncio.sleep(0.06)
+        assert breaker.state == "half_open"
+        with pytest.raises(DeadlineExceeded):
+            await client.infer(MATRIX, deadline=time.monotonic() - 1)
+        assert not breaker.probing
+
+        # a spent deadline reaching _attempt after allow() (e.g. a hedge) gives the probe back too
+        assert breaker.allow()
+        with pytest.raises(DeadlineExceeded):
+            await client._attempt(client.endpoints[0], b"{}", time.monotonic() - 1)
+        assert not breaker.probing
+
+        status["code"] = 200
+        assert await client.infer(MATRIX) == {"result": "ok"}
+        assert breaker.state == "closed"
+        await client.aclose()
+
+    asyncio.run(scenario())
+
+
+def make_replicas(handlers, **kwargs):
+    """Client over http://a, http://b, ... whose requests go to handlers[host](request) (sync or async)."""
+
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.host)
+        response = handlers[request.url.host](request)
+        return await response if asyncio.iscoroutine(response) else response
+
+    kwargs = {"failure_threshold": 2, "reset_timeout": 0.05, "hedging": False, **kwargs}
+    return InferenceClient([f"http://{host}" for host in handlers], transport=httpx.MockTransport(handler), **kwargs), calls
+
+
+def ok(request):
+    return httpx.Response(200, json={"result": request.url.host})
+
+
+def test_load_is_spread_over_endpoints():
+
+    async def scenario():
+        client, calls = make_replicas({"a": ok, "b": ok})
+        for _ in range(4):
+            await client.infer(MATRIX)
+        await client.aclose()
+        return calls
+
+    assert sorted(asyncio.run(scenario())) == ["a", "a", "b", "b"]
+
+
+def test_failover_and_breaker_open_close():
+
+    async def scenario():
+        status = {"a": 500}
+        client, calls = make_replicas({"a": lambda request: httpx.Response(status["a"], json={"result": "a"}), "b": ok})
+        breaker = client.endpoints[0].breaker
+
+        # every call succeeds: a's errors fail over to b until a's breaker opens
+        results = [await client.infer(MATRIX) for _ in range(4)]
+        assert all(result == {"result": "b"} for result in results)
+        assert breaker.state == "open" and calls.count("a") == 2
+
+        calls.clear()
+        assert [await client.infer(MATRIX) for _ in range(2)] == [{"result": "b"}] * 2
+        assert calls == ["b", "b"]  # an open endpoint gets no traffic
+
+        status["a"] = 200
+        await asyncio.sleep(0.06)
+        for _ in range(2):
+            await client.infer(MATRIX)
+        assert "a" in calls and breaker.state == "closed"
+        await client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_slow_request_is_hedged_to_another_replica():
+
+    async def slow(request):
+        await asyncio.sleep(1.0)
+        return ok(request)
+
+    async def scenario():
+        client, calls = make_replicas({"a": slow, "b": ok}, hedging=True, hedge_min_samples=1, hedge_min_delay=0.01)
+        primary = client.endpoints[0]
+        primary.latencies.append(0.01)
+        client._next = len(client.endpoints) - 1  # next pick starts at a
+
+        start = time.monotonic()
+        assert await client.infer(MATRIX) == {"result": "b"}
+        assert time.monotonic() - start < 0.5
+        assert calls == ["a", "b"]
+        await asyncio.sleep(0.01)  # the cancelled primary unwinds
+        assert primary.breaker.failures == 0 and primary.in_flight == 0  # the lost race counts as neither outcome
+        await client.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from app.misc.utils.lead_normalize import canonical_lead_name, interval_to_sampling_rate, normalize_leads
+from app.misc.utils.parse_ecg_from_fhir import parse_samples
+
+
+def test_missing_limb_leads_are_derived_from_i_and_ii():
+    rng = np.random.default_rng(0)
+    lead_i, lead_ii = rng.normal(size=100), rng.normal(size=100)
+    ecg_matrix, sample_rate, missing = normalize_leads({"Lead I": lead_i, "MDC_ECG_LEAD_II": lead_ii, "V1": lead_ii}, {"Lead I": 500, "MDC_ECG_LEAD_II": 500, "V1": 500})
+
+    assert sample_rate == 500 and ecg_matrix.shape == (100, 12)
+    np.testing.assert_allclose(ecg_matrix[:, 2], lead_ii - lead_i)          # III
+    np.testing.assert_allclose(ecg_matrix[:, 3], -(lead_i + lead_ii) / 2)   # aVR
+    np.testing.assert_allclose(ecg_matrix[:, 6], lead_ii)                   # V1 as read
+    assert missing == ["V2", "V3", "V4", "V5", "V6"]
+    assert not ecg_matrix[:, 7:].any()
+
+
+def test_samples_parsed_in_chunks_match_whole_string():
+    data = " ".join(f"{value:.3f}" for value in np.linspace(-2, 2, 1001))
+    np.testing.assert_array_equal(parse_samples(data, chunk_chars=7), parse_samples(data, chunk_chars=1 << 20))
+    assert parse_samples(data, chunk_chars=7).shape == (1001,)
+    np.testing.assert_array_equal(parse_samples("1  2\n3", chunk_chars=1), [1.0, 2.0, 3.0])  # irregular spacing falls back per chunk
+
+
+@pytest.mark.parametrize("vendor_name, lead", [
+    ("Lead I", "I"), ("leadaVR", "aVR"), ("MDC_ECG_LEAD_V1", "V1"), ("131389", "III"), ("avf", "aVF"), ("Lead_V6", "V6"), ("X", None), (None, None),
+])
+def test_vendor_lead_names(vendor_name, lead):
+    assert canonical_lead_name(vendor_name) == lead
+
+
+def test_lead_i_is_recovered_from_ii_and_iii():
+    lead_ii, lead_iii = np.arange(10.0), np.ones(10)
+    ecg_matrix, _, missing = normalize_leads({"II": lead_ii, "III": lead_iii})
+
+    np.testing.assert_allclose(ecg_matrix[:, 0], lead_ii - lead_iii)
+    np.testing.assert_allclose(ecg_matrix[:, 5], lead_ii - (lead_ii - lead_iii) / 2)  # aVF
+    assert missing == ["V1", "V2", "V3", "V4", "V5", "V6"]
+
+
+def test_inconsistent_leads_are_rejected():
+    with pytest.raises(ValueError):
+        normalize_leads({"I": np.zeros(10), "II": np.zeros(11)})
+    with pytest.raises(ValueError):
+        normalize_leads({"I": np.zeros(10), "II": np.zeros(10)}, {"I": 500, "II": 250})
+    with pytest.raises(ValueError):
+        normalize_leads({"X": np.zeros(10)})
+    assert interval_to_sampling_rate(2, "ms") == pytest.approx(500)
+    with pytest.raises(ValueError):
+        interval_to_sampling_rate(2, "min")
@@ -0,0 +1,90 @@
+import json
+import logging
+import threading
+
+from app.core import logger as app_logger
+from app.core.logger import get_stage_timings, JsonFormatter, new_request_id, RateLimitFilter, stage_timer, start_logging, stop_logging
+
+
+def make_record(msg, *args, level=logging.WARNING, **extra):
+    record = logging.LogRecord("custom.error", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_repeated_warnings_are_rate_limited():
+    rate_filter = RateLimitFilter(interval=60.0, burst=2)
+    passed = [rate_filter.filter(make_record("Lead %s without data", lead)) for lead in ("I", "II", "III", "aVR")]
+    assert passed == [True, True, False, False]
+    assert rate_filter.filter(make_record("Lead %s without data", "V1", level=logging.ERROR))
+
+    rate_filter.interval = 0.0  # next window
+    record = make_record("Lead %s without data", "V2")
+    assert rate_filter.filter(record) and record.suppressed == 2
+    assert record.getMessage() == "Lead V2 without data [2 similar warnings suppressed]"
+
+
+def test_json_lines_carry_request_id_timings_and_extras():
+    new_request_id("req-1")
+    with stage_timer("parse"):
+        pass
+    with stage_timer("parse"):
+        pass
+    assert set(get_stage_timings()) == {"parse"}
+
+    entry = json.loads(JsonFormatter().format(make_record("upload %s", "a", level=logging.INFO, record_id="r1")))
+    assert entry["message"] == "upload a" and entry["level"] == "INFO"
+    assert entry["request_id"] == "req-1" and entry["record_id"] == "r1"
+    assert new_request_id("bad\nid") != "bad\nid"
+
+
+def test_records_are_written_on_the_listener_thread():
+    written = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            written.append((record.getMessage(), record.request_id, threading.current_thread()))
+
+    saved_handlers = {name: logging.getLogger(name).handlers[:] for name in app_logger.APP_LOGGERS}
+    for name in app_logger.APP_LOGGERS:
+        logging.getLogger(name).handlers = []
+    logger = logging.getLogger("custom.trace")
+    logger.handlers = [Capture()]
+    try:
+        start_logging()
+        new_request_id("req-2")
+        logger.warning("span %s", "done")
+        stop_logging()
+    finally:
+        for name, handlers in saved_handlers.items():
+            logging.getLogger(name).handlers = handlers
+
+    assert [(message, request_id) for message, request_id, _ in written] == [("span done", "req-2")]
+    assert written[0][2] is not threading.current_thread()
+
+
+def test_interrupted_request_is_logged_and_propagates():
+    import asyncio
+    import pytest
+    from starlette.requests import Request
+
+    import main
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    main.request_logger.addHandler(handler)
+    level = main.request_logger.level
+    main.request_logger.setLevel(logging.INFO)
+
+    async def call_next(request):
+        raise asyncio.CancelledError()
+
+    request = Request({"type": "http", "method": "GET", "path": "/SMART-ECG", "headers": [], "query_string": b""})
+    try:
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(main.log_middleware(request, call_next))
+    finally:
+        main.request_logger.removeHandler(handler)
+        main.request_logger.setLevel(level)
+    assert [record.status for record in records] == [500]
@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pytest
+
+from app.misc.utils.matrix_formats import arrow_stream_bytes, negotiate_matrix_format, npy_bytes
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "json"),
+    ("*/*", "json"),
+    ("application/*", "json"),
+    ("application/x-npy", "npy"),
+    ("application/x-npy, */*", "npy"),
+    ("application/json, application/x-npy", "npy"),
+    ("application/x-npy;q=0.5, application/json", "json"),
+    ("application/vnd.apache.arrow.stream, application/json;q=0.9", "arrow"),
+    ("application/x-npy;q=0, */*;q=0.1", "json"),
+    ("text/html", None),
+    ("application/json;q=0", None),
+])
+def test_accept_negotiation(accept, expected):
+    assert negotiate_matrix_format(accept) == expected
+
+
+def test_arrow_not_offered_without_pyarrow():
+    assert negotiate_matrix_format("application/vnd.apache.arrow.stream", allow_arrow=False) is None
+    assert negotiate_matrix_format("application/vnd.apache.arrow.stream, application/json;q=0.5", allow_arrow=False) == "json"
+
+
+@pytest.mark.parametrize("dtype", ["<f4", "<f8"])
+def test_npy_loads_with_numpy(dtype):
+    matrix = np.arange(24, dtype=np.float64).reshape(6, 4)[:, ::2].astype(dtype)  # copy of a strided view
+    loaded = np.load(io.BytesIO(npy_bytes(matrix)))
+    assert loaded.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(loaded, matrix)
+
+
+def test_arrow_stream_has_one_column_per_lead():
+    pa = pytest.importorskip("pyarrow")
+    matrix = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    table = pa.ipc.open_stream(arrow_stream_bytes(matrix, ["I", "II"], {"record_id": "r1", "sample_rate": 500})).read_all()
+    assert table.column_names == ["I", "II"]
+    assert table.column("II").to_pylist() == [3.0, 4.0, 5.0]
+    assert table.schema.metadata[b"sample_rate"] == b"500"
@@ -0,0 +1,57 @@
+import copy
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.misc.utils import fast_json, parse_ecg_from_fhir
+from app.misc.utils.parse_ecg_from_fhir import extract_ecg_data, parse_samples, sampled_data_metadata
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "app", "misc", "utils", "file", "test.json"), "r", encoding="utf-8") as f:
+    OBSERVATION = json.load(f)
+
+
+def test_leads_and_metadata_are_decoded():
+    leads_data, metadata = extract_ecg_data(OBSERVATION)
+
+    assert len(leads_data) == 12 and metadata["resourceType"] == "Observation"
+    lead = leads_data["Lead II"]
+    sampled_data = next(component["valueSampledData"] for component in OBSERVATION["component"] if component["code"]["coding"][0]["code"] == "131330")
+    expected = (np.array(sampled_data["data"].split(), dtype=np.float64) - sampled_data["origin"]["value"]) * sampled_data.get("factor", 1)
+    np.testing.assert_allclose(lead["data"], expected)
+    assert set(lead["metadata"]) == {"factor", "origin", "interval", "intervalUnit", "lowerLimit", "upperLimit"}
+
+
+def test_broken_leads_are_skipped():
+    observation = copy.deepcopy(OBSERVATION)
+    observation["component"][0]["valueSampledData"]["factor"] = "2"
+    observation["component"][1]["valueSampledData"]["data"] = "1 2 x"
+    observation["component"][2]["valueSampledData"]["data"] = ""
+
+    leads_data, _ = extract_ecg_data(observation)
+    assert len(leads_data) == 9
+
+
+@pytest.mark.parametrize("field, value", [("factor", True), ("interval", "2"), ("lowerLimit", None), ("origin", {})])
+def test_sampled_data_types_are_checked(field, value):
+    sampled_data = copy.deepcopy(OBSERVATION["component"][0]["valueSampledData"])
+    sampled_data[field] = value
+    with pytest.raises(TypeError):
+        sampled_data_metadata(sampled_data)
+
+
+@pytest.mark.parametrize("orjson", [True, False])
+def test_same_values_with_and_without_orjson(monkeypatch, orjson):
+    if orjson and not fast_json.ORJSON:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setattr(parse_ecg_from_fhir, "ORJSON", orjson)
+    monkeypatch.setattr(fast_json, "ORJSON", orjson)
+
+    np.testing.assert_array_equal(parse_samples("1 -2.5 3e-3 4"), [1, -2.5, 0.003, 4])
+    with pytest.raises(ValueError):
+        parse_samples("1 E 2")
+
+    body = fast_json.dumps({"matrix": np.arange(3, dtype=np.float32), "rate": np.int64(500), 1: "x"})
+    assert fast_json.loads(body) == {"matrix": [0.0, 1.0, 2.0], "rate": 500, "1": "x"}
@@ -0,0 +1,51 @@
+import numpy as np
+
+from app.misc.utils.preprocess_ecg import assess_signal_quality, is_recording_usable, preprocess_ecg_matrix
+
+
+SAMPLE_RATE = 500
+
+
+def synthetic_ecg(seconds=10):
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    beats = np.exp(-((t % 0.8) - 0.4) ** 2 / (2 * 0.01 ** 2))  # narrow R waves at 75 bpm
+    rng = np.random.default_rng(0)
+    return t, np.stack([beats * (0.5 + index / 12) + 0.01 * rng.normal(size=t.size) for index in range(12)], axis=1)
+
+
+def test_quality_flags_bad_leads():
+    _, ecg_matrix = synthetic_ecg()
+    ecg_matrix[:, 0] = 0.0                                  # lead off
+    ecg_matrix[:, 1] = 0.3                                  # flat line
+    ecg_matrix[:, 2] = np.clip(ecg_matrix[:, 2], -0.1, 0.1) # clipped at the recorder's limits
+
+    lower_limits, upper_limits = np.full(12, np.nan), np.full(12, np.nan)
+    lower_limits[2], upper_limits[2] = -0.1, 0.1
+    quality = assess_signal_quality(ecg_matrix, lower_limits=lower_limits, upper_limits=upper_limits)
+
+    assert quality["I"]["lead_off"] and quality["I"]["score"] == 0
+    assert quality["II"]["flatline"] and quality["II"]["score"] == 0
+    assert quality["III"]["saturated"]
+    assert all(quality[lead]["score"] > 0.9 for lead in ("aVF", "V1", "V6"))
+    assert is_recording_usable(quality) and not is_recording_usable(quality, min_usable_leads=10)
+
+
+def test_filters_remove_baseline_wander_and_powerline():
+    t, ecg_matrix = synthetic_ecg()
+    noisy = ecg_matrix + (0.5 * np.sin(2 * np.pi * 0.1 * t) + 0.2 * np.sin(2 * np.pi * 60 * t))[:, None]
+
+    filtered, quality, elapsed_ms = preprocess_ecg_matrix(noisy, SAMPLE_RATE, powerline_hz=60)
+    reference, _, _ = preprocess_ecg_matrix(ecg_matrix, SAMPLE_RATE, powerline_hz=60)
+
+    middle = slice(SAMPLE_RATE, -SAMPLE_RATE)  # away from the filter edges
+    assert np.abs(filtered[middle] - reference[middle]).max() < 0.05
+    assert set(quality) == {"I", "II", "III", "aVR", "aVL", "aVF", "V1", "V2", "V3", "V4", "V5", "V6"}
+    assert elapsed_ms >= 0
+
+
+def test_stages_applied_by_the_device_are_skipped():
+    t, ecg_matrix = synthetic_ecg()
+    hum = ecg_matrix + 0.2 * np.sin(2 * np.pi * 60 * t)[:, None]
+
+    filtered, _, _ = preprocess_ecg_matrix(hum, SAMPLE_RATE, powerline_hz=60, high_pass_hz=0.5, low_pass_hz=40)
+    np.testing.assert_array_equal(filtered, hum)  # baseline and notch both already done by the recorder
@@ -0,0 +1,92 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+from app.middleware.admission import AdmissionMiddleware
+from app.misc.utils import rate_limit
+from app.misc.utils.rate_limit import MemoryLimiterStore, SQLiteLimiterStore
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryLimiterStore(prune_every=4)
+    return SQLiteLimiterStore(str(tmp_path / "admission.sqlite3"), prune_every=4)
+
+
+def bucket_keys(store):
+    if isinstance(store, MemoryLimiterStore):
+        return set(store._buckets)
+    return {row[0] for row in store._connect().conn.execute("SELECT key FROM token_buckets")}
+
+
+def test_tokens_refill_at_rate(store, clock):
+    assert [store.take("ip:a", rate=1.0, capacity=2)[0] for _ in range(3)] == [True, True, False]
+    assert store.take("ip:a", rate=1.0, capacity=2) == (False, pytest.approx(1.0))
+
+    clock.now += 1.0
+    assert store.take("ip:a", rate=1.0, capacity=2) == (True, 0.0)
+    assert not store.take("ip:a", rate=1.0, capacity=2)[0]
+
+
+def test_refilled_buckets_are_pruned(store, clock):
+    store.take("ip:a", rate=1.0, capacity=2)
+    store.take("ip:b", rate=0.1, capacity=2)
+    clock.now += 2.0  # a is full again, b is not
+    store.take("ip:c", rate=1.0, capacity=2)
+    store.take("ip:c", rate=1.0, capacity=2)  # 4th take sweeps
+
+    assert bucket_keys(store) == {"ip:b", "ip:c"}
+
+
+def make_client(store):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, store=store, routes=[("POST", "/upload")], ip_rate=0.5, ip_burst=1)
+    app.add_middleware(CORSMiddleware, allow_origins=["http://localhost"], allow_credentials=True, allow_methods=['*'], allow_headers=['*'])
+    return TestClient(app)
+
+
+def test_rejection_has_retry_after_and_cors_headers(clock):
+    client = make_client(MemoryLimiterStore())
+    headers = {"Origin": "http://localhost"}
+    assert client.post("/upload", headers=headers).status_code == 200
+
+    response = client.post("/upload", headers=headers)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    assert response.headers["access-control-allow-origin"] == "http://localhost"
+
+
+def test_concurrency_limit_is_503(clock):
+    store = MemoryLimiterStore()
+    client = make_client(store)
+    slot_id = store.acquire_slot(1, 60)
+    response = client.post("/upload")
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+
+    store.release_slot(slot_id)
+    clock.now += 2.0
+    assert client.post("/upload").status_code == 200
@@ -0,0 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.misc.utils import record_store
+
+
+def test_concurrent_meta_updates_are_not_lost(tmp_path, monkeypatch):
+    monkeypatch.setattr(record_store, "RECORD_DIR", str(tmp_path))
+    record_store.write_meta("r1", {"record_id": "r1"})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: record_store.update_meta("r1", **{f"field_{i}": i}), range(64)))
+
+    meta = record_store.load_meta("r1")
+    assert all(meta[f"field_{i}"] == i for i in range(64))
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.crud.smart_ecg import search_ecg_results, upsert_ecg_result
+from app.models.smart import Base, SmartECGLabel
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine, autoflush=False)() as session:
+        # seven records, two pairs sharing a time, so the uid tie-break is exercised
+        for index, hour in enumerate([1, 2, 2, 3, 4, 4, 5]):
+            upsert_ecg_result(
+                session, f"r{index}",
+                metadata={"subject": "Patient/1" if index % 2 else "Patient/2", "effectiveDateTime": f"2026-01-01T{hour:02d}:00:00+00:00", "device": "MAC"},
+                result={"prediction": {"af": index / 10, "normal": 1 - index / 10}},
+                measurements={"heart_rate_bpm": 60 + index},
+            )
+        yield session
+
+
+def all_pages(db, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = search_ecg_results(db, limit=limit, cursor=cursor, **filters)
+        pages.append([row.record_id for row in rows])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_are_newest_first_without_gaps_or_repeats(db):
+    pages = all_pages(db, 3)
+    assert pages == [["r6", "r5", "r4"], ["r3", "r2", "r1"], ["r0"]]
+
+
+def test_filters(db):
+    assert sum(all_pages(db, 2, subject="Patient/1"), []) == ["r5", "r3", "r1"]
+    assert sum(all_pages(db, 2, label="af", min_score=0.35), []) == ["r6", "r5", "r4"]
+    assert sum(all_pages(db, 10, start=datetime(2026, 1, 1, 2), end=datetime(2026, 1, 1, 4)), []) == ["r3", "r2", "r1"]
+    assert sum(all_pages(db, 10, device="other"), []) == []
+
+
+def test_reindexing_replaces_labels(db):
+    ecg = upsert_ecg_result(db, "r0", metadata={"effectiveDateTime": "2026-01-01T01:00:00Z"}, result={"prediction": {"pvc": 0.9}})
+    assert [label.label for label in ecg.labels] == ["pvc"] and ecg.top_label == "pvc"
+    assert db.query(SmartECGLabel).filter(SmartECGLabel.uid == ecg.uid).count() == 1
+
+
+def test_invalid_cursor(db):
+    with pytest.raises(ValueError):
+        search_ecg_results(db, cursor="not-a-cursor")
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from app.misc.utils.single_flight import SingleFlight
+
+
+class Computation():
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+
+    async def __call__(self, value):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if self.error:
+            raise self.error
+        return {"value": value}
+
+
+def test_concurrent_callers_join_one_computation(tmp_path):
+    compute = Computation()
+
+    async def scenario():
+        flight = SingleFlight(str(tmp_path))
+        results = await asyncio.gather(*(flight.do("k", compute, 1) for _ in range(5)), flight.do("other", compute, 2))
+        return results, flight._flights
+
+    results, flights = asyncio.run(scenario())
+    assert compute.calls == 2 and flights == {}
+    assert results == [{"value": 1}] * 5 + [{"value": 2}]
+
+
+def test_other_workers_reuse_the_stored_result(tmp_path):
+    compute = Computation()
+    assert asyncio.run(SingleFlight(str(tmp_path)).do("k", compute, 1)) == {"value": 1}
+    assert asyncio.run(SingleFlight(str(tmp_path)).do("k", compute, 2)) == {"value": 1}
+    assert compute.calls == 1
+
+    assert asyncio.run(SingleFlight(str(tmp_path), result_ttl=0).do("k", compute, 3)) == {"value": 3}  # expired
+
+
+def test_only_cacheable_errors_are_shared(tmp_path):
+    rejected, crashed = Computation(ValueError("bad ECG")), Computation(RuntimeError("worker died"))
+
+    for compute, key in ((rejected, "rejected"), (crashed, "crashed")):
+        for _ in range(2):
+            with pytest.raises(type(compute.error)):
+                asyncio.run(SingleFlight(str(tmp_path), cacheable=(ValueError,)).do(key, compute, 1))
+
+    assert rejected.calls == 1 and crashed.calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_others(tmp_path):
+    compute = Computation()
+
+    async def scenario():
+        flight = SingleFlight(str(tmp_path))
+        first = asyncio.ensure_future(flight.do("k", compute, 1))
+        second = asyncio.ensure_future(flight.do("k", compute, 1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == {"value": 1} and compute.calls == 1
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+from scripts.check_import_time import BACKEND_DIR, measure_import_time
+
+
+HEAVY_MODULES = ("matplotlib", "scipy", "onnxruntime", "sqlalchemy", "requests", "boto3")
+
+
+def test_heavy_modules_are_not_imported_with_the_app():
+    code = f"import sys, main; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_import_time_is_measured():
+    entries = measure_import_time("main")
+    assert any(name == "main" and cumulative > 0 for cumulative, _, _, name in entries)
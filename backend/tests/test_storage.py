@@ -0,0 +1,34 @@
+import os
+
+from app.misc.utils.storage import BlobStore, LocalStorage
+
+
+def age(backend, key, seconds):
+    path = backend._path(key)
+    modified = os.path.getmtime(path) - seconds
+    os.utime(path, (modified, modified))
+
+
+def test_reupload_is_stored_once_and_not_evicted_as_old(tmp_path):
+    store = BlobStore(LocalStorage(str(tmp_path)), compression="gzip")
+    old_key = store.put(b'{"n": 1}')
+    new_key = store.put(b'{"n": 2}')
+    age(store.backend, old_key, 7200)
+    age(store.backend, new_key, 7200)
+
+    assert store.put(b'{"n": 1}') == old_key  # dedup hit refreshes the age
+    assert len(list(store.backend.iter_objects())) == 2
+
+    assert store.evict(max_age_seconds=3600) == 1
+    assert store.get(old_key) == b'{"n": 1}'
+    assert store.get(new_key) is None
+
+
+def test_evict_oldest_over_max_bytes(tmp_path):
+    store = BlobStore(LocalStorage(str(tmp_path)))
+    keys = [store.put(f'{{"n": {n}}}'.encode()) for n in range(3)]
+    for seconds, key in zip((300, 200, 100), keys):
+        age(store.backend, key, seconds)
+
+    assert store.evict(max_bytes=2 * len(b'{"n": 0}')) == 1
+    assert store.get(keys[0]) is None and store.get(keys[2]) is not None
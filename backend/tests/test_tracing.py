@@ -0,0 +1,61 @@
+import json
+import logging
+
+import pytest
+
+from app.core import tracing
+from app.core.tracing import inject_trace_headers, parse_traceparent, setup_tracing, start_span, traced_stage
+
+
+TRACE_ID, PARENT_ID = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+
+@pytest.fixture
+def spans():
+    finished = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            finished.append(json.loads(record.getMessage()))
+
+    setup_tracing("none")  # built-in tracer, whether or not the OpenTelemetry SDK is installed
+    tracing.trace_logger.setLevel(logging.INFO)
+    tracing.trace_logger.handlers = [Capture()]
+    yield finished
+    setup_tracing("none")
+
+
+@pytest.mark.parametrize("header, ids", [
+    (f"00-{TRACE_ID}-{PARENT_ID}-01", (TRACE_ID, PARENT_ID)),
+    (f"00-{TRACE_ID.upper()}-{PARENT_ID}-00", (TRACE_ID, PARENT_ID)),
+    (f"00-{'0' * 32}-{PARENT_ID}-01", (None, None)),
+    (f"01-{TRACE_ID}-{PARENT_ID}", (None, None)),
+    (None, (None, None)),
+])
+def test_parse_traceparent(header, ids):
+    assert parse_traceparent(header) == ids
+
+
+def test_spans_continue_the_incoming_trace(spans):
+    with start_span("POST /SMART-ECG", kind="server", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01") as server:
+        with traced_stage("parse", leads=12):
+            headers = inject_trace_headers({"Content-Type": "application/json"})
+        with pytest.raises(ValueError):
+            with start_span("render"):
+                raise ValueError("bad matrix")
+
+    parse, render, request = spans
+    assert {span["trace_id"] for span in spans} == {TRACE_ID}
+    assert request["parent_id"] == PARENT_ID and request["kind"] == "server"
+    assert parse["parent_id"] == server.span_id and parse["attributes"] == {"leads": 12}
+    assert headers["traceparent"] == f"00-{TRACE_ID}-{parse['span_id']}-01"
+    assert render["status"] == "error" and render["attributes"]["exception.message"] == "bad matrix"
+    assert inject_trace_headers() == {}  # no active span outside
+
+
+def test_new_trace_without_incoming_context(spans):
+    with start_span("job"):
+        pass
+    with start_span("job"):
+        pass
+    assert spans[0]["parent_id"] is None and spans[0]["trace_id"] != spans[1]["trace_id"]
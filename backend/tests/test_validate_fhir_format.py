@@ -0,0 +1,52 @@
+import copy
+import json
+import os
+
+import pytest
+
+from app.misc.utils.validate_fhir_format import count_tokens, validate_ecg_observation
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "app", "misc", "utils", "file", "test.json"), "r", encoding="utf-8") as f:
+    OBSERVATION = json.load(f)
+
+
+def sampled_data(observation, index=0):
+    return observation["component"][index]["valueSampledData"]
+
+
+def test_sample_observation_is_valid():
+    assert validate_ecg_observation(OBSERVATION) == []
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (lambda o: o.update(resourceType="Patient"), "must be 'Observation'"),
+    (lambda o: o.update(status="done"), "must be one of"),
+    (lambda o: sampled_data(o).pop("origin"), "origin.value is required"),
+    (lambda o: sampled_data(o).update(factor=0), "factor must be a non-zero number"),
+    (lambda o: sampled_data(o).update(interval=-2), "interval must be a positive number"),
+    (lambda o: sampled_data(o).update(intervalUnit="min"), "intervalUnit must be one of"),
+    (lambda o: sampled_data(o).update(lowerLimit=5000, upperLimit=-5000), "lowerLimit must be below upperLimit"),
+    (lambda o: sampled_data(o).update(data=sampled_data(o)["data"] + " 1.0"), "different sample counts"),
+    (lambda o: sampled_data(o).update(data="1.0 2.0 µ"), "ASCII numbers only"),
+    (lambda o: o["component"].append(copy.deepcopy(o["component"][0])), "duplicate lead"),
+    (lambda o: o.update(component=[]), "must be a non-empty list"),
+])
+def test_profile_violations_are_reported(mutate, message):
+    observation = copy.deepcopy(OBSERVATION)
+    mutate(observation)
+    issues = validate_ecg_observation(observation)
+    assert any(message in issue["message"] for issue in issues), issues
+
+
+def test_issue_count_is_capped():
+    observation = copy.deepcopy(OBSERVATION)
+    for component in observation["component"]:
+        component["valueSampledData"] = {}
+    assert len(validate_ecg_observation(observation, max_issues=5)) == 5
+    assert validate_ecg_observation([]) == [{"path": "", "message": "must be a JSON object"}]
+
+
+@pytest.mark.parametrize("data, count", [("1 2 3", 3), ("  1\n2\t3  ", 3), ("", 0), ("   ", 0), ("-0.5", 1)])
+def test_count_tokens(data, count):
+    assert count_tokens(data) == count
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from app.misc.utils import waveform_lod
+from app.misc.utils.waveform_lod import build_pyramid, delta_encode, level_lengths, load_pyramid, quantize, save_pyramid, waveform_view
+
+
+ECG_MATRIX = np.random.default_rng(0).normal(scale=0.5, size=(5001, 12))  # odd length on purpose
+
+
+def brute_force_buckets(start, end, bucket, leads):
+    samples = quantize(ECG_MATRIX)[:, leads]
+    first = start // bucket * bucket
+    points = []
+    for low in range(first, end, bucket):
+        chunk = samples[low:min(low + bucket, samples.shape[0])]
+        points += [chunk.min(axis=0), chunk.max(axis=0)]
+    return np.stack(points, axis=1)
+
+
+def test_pyramid_levels_hold_bucket_min_max():
+    pyramid = build_pyramid(ECG_MATRIX)
+    assert pyramid.shape == (sum(level_lengths(5001)), 2, 12) and pyramid.dtype == np.int16
+    assert waveform_lod.MIN_BUCKETS // 2 < level_lengths(5001)[-1] <= waveform_lod.MIN_BUCKETS
+
+
+@pytest.mark.parametrize("start, end, width", [(0, 5001, 100), (1234, 4321, 200), (4000, 5001, 64)])
+def test_zoomed_out_views_are_exact_min_max_buckets(start, end, width):
+    data, bucket, first_sample = waveform_view(ECG_MATRIX, build_pyramid(ECG_MATRIX), start, end, width, [1, 7])
+
+    assert bucket > 1 and first_sample <= start < first_sample + bucket
+    assert data.shape[1] >= 2 * width
+    np.testing.assert_array_equal(data, brute_force_buckets(start, end, bucket, [1, 7]))
+
+
+def test_zoomed_in_views_are_raw_samples():
+    data, bucket, first_sample = waveform_view(ECG_MATRIX, build_pyramid(ECG_MATRIX), 100, 300, 200)
+    assert bucket == 1 and first_sample == 100
+    np.testing.assert_array_equal(data, quantize(ECG_MATRIX[100:300]).T)
+    with pytest.raises(ValueError):
+        waveform_view(ECG_MATRIX, build_pyramid(ECG_MATRIX), 6000, 7000, 100)
+
+
+def test_delta_encoding_and_storage_round_trip(tmp_path, monkeypatch):
+    data = quantize(ECG_MATRIX[:50]).T
+    np.testing.assert_array_equal(np.cumsum(delta_encode(data), axis=1), data)
+
+    monkeypatch.setattr(waveform_lod, "RECORD_DIR", str(tmp_path))
+    assert load_pyramid("r1") is None
+    save_pyramid("r1", build_pyramid(ECG_MATRIX))
+    np.testing.assert_array_equal(load_pyramid("r1"), build_pyramid(ECG_MATRIX))
@@ -0,0 +1,135 @@
+import asyncio
+import httpx
+import json
+import pytest
+import socket
+
+from app.misc.utils.webhooks import check_callback_url, sign_payload, SIGNATURE_HEADER, TIMESTAMP_HEADER, WebhookDispatcher, WebhookStore
+
+
+@pytest.mark.parametrize("url", [
+    "http://93.184.216.34/hook",
+    "https://127.0.0.1/hook",
+    "https://localhost/hook",
+    "https://10.0.0.5/hook",
+    "https://172.18.0.58:8080/hook",
+    "https://192.168.1.20/hook",
+    "https://169.254.169.254/latest/meta-data",
+    "https://100.64.0.1/hook",
+    "https://0.0.0.0/hook",
+    "https://[::1]/hook",
+    "https://[fd00::1]/hook",
+    "https://[::ffff:127.0.0.1]/hook",
+    "ftp://93.184.216.34/hook",
+    "https:///hook",
+])
+def test_callback_url_rejected(url):
+    with pytest.raises(ValueError):
+        asyncio.run(check_callback_url(url))
+
+
+def test_callback_url_accepted():
+    asyncio.run(check_callback_url("https://93.184.216.34/hook"))
+    asyncio.run(check_callback_url("http://93.184.216.34:8080/hook", allow_http=True))
+    with pytest.raises(ValueError):
+        asyncio.run(check_callback_url("http://127.0.0.1/hook", allow_http=True))
+
+
+URL = "https://93.184.216.34/hook"
+
+
+def make_dispatcher(tmp_path, handler):
+    store = WebhookStore(str(tmp_path / "webhooks.sqlite3"))
+    subscription = store.add_subscription("alice", URL)
+    return WebhookDispatcher(store, backoff=0.0, max_backoff=0.0, transport=httpx.MockTransport(handler)), subscription
+
+
+def attempts(store):
+    with store._connect() as conn:
+        return [row[0] for row in conn.execute("SELECT attempts FROM outbox").fetchall()]
+
+
+def test_outbox_batches_signs_and_retries(tmp_path):
+    received = []
+
+    def handler(request):
+        received.append(request)
+        return httpx.Response(503 if len(received) == 1 else 200)
+
+    async def scenario():
+        dispatcher, subscription = make_dispatcher(tmp_path, handler)
+        for record_id in ("a", "b"):
+            await dispatcher.notify("alice", "ecg.analyzed", {"record_id": record_id})
+        await dispatcher.notify("bob", "ecg.analyzed", {"record_id": "c"})
+
+        await dispatcher.dispatch()
+        await asyncio.gather(*dispatcher._deliveries)
+        assert attempts(dispatcher.store) == [1, 1]
+
+        await dispatcher.dispatch()
+        await asyncio.gather(*dispatcher._deliveries)
+        assert dispatcher.store.pending() == 0
+        await dispatcher.aclose()
+        return subscription
+
+    subscription = asyncio.run(scenario())
+    assert len(received) == 2
+    request = received[-1]
+    assert request.headers[SIGNATURE_HEADER] == sign_payload(subscription["secret"], request.headers[TIMESTAMP_HEADER], request.content)
+    assert [event["data"]["record_id"] for event in json.loads(request.content)["events"]] == ["a", "b"]
+
+
+def test_outbox_counts_unexpected_errors_as_attempts(tmp_path):
+
+    def handler(request):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        dispatcher, _ = make_dispatcher(tmp_path, handler)
+        dispatcher.max_attempts = 2
+        await dispatcher.notify("alice", "ecg.analyzed", {"record_id": "a"})
+
+        await dispatcher.dispatch()
+        await asyncio.gather(*dispatcher._deliveries)
+        assert attempts(dispatcher.store) == [1]
+
+        await dispatcher.dispatch()
+        await asyncio.gather(*dispatcher._deliveries)
+        assert dispatcher.store.pending() == 0
+        assert dispatcher.stats["dropped"] == 1
+        assert "boom" in dispatcher.store.list_subscriptions("alice")[0]["last_error"]
+        await dispatcher.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_delivery_connects_to_the_checked_address(tmp_path, monkeypatch):
+    resolved = []
+    received = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        resolved.append(host)
+        address = "93.184.216.34" if len(resolved) == 1 else "127.0.0.1"  # rebinds after the first answer
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    def handler(request):
+        received.append(request)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+
+    async def scenario():
+        store = WebhookStore(str(tmp_path / "webhooks.sqlite3"))
+        store.add_subscription("alice", "https://hooks.example.com:8443/hook")
+        dispatcher = WebhookDispatcher(store, transport=httpx.MockTransport(handler))
+        await dispatcher.notify("alice", "ecg.analyzed", {"record_id": "a"})
+        await dispatcher.dispatch()
+        await asyncio.gather(*dispatcher._deliveries)
+        await dispatcher.aclose()
+
+    asyncio.run(scenario())
+    assert resolved == ["hooks.example.com"]
+    (request,) = received
+    assert str(request.url) == "https://93.184.216.34:8443/hook"
+    assert request.headers["host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
@@ -0,0 +1,37 @@
+import numpy as np
+
+from app.misc.utils.window_ecg import analyze_windows, iter_windows
+
+
+def test_windows_cover_the_recording_at_the_model_rate():
+    ecg_matrix = np.tile(np.arange(35 * 250, dtype=np.float64)[:, None] / 250, (1, 12))  # 35 s at 250 Hz, value = time
+
+    windows = list(iter_windows(ecg_matrix, 250))
+
+    assert [start for start, _ in windows] == [0, 8, 16, 24, 25]  # the last one ends with the recording
+    assert all(window.shape == (5000, 12) for _, window in windows)
+    for start, window in windows:
+        np.testing.assert_allclose(window[1000:4000, 0], start + np.arange(1000, 4000) / 500, atol=0.02)
+
+
+def test_windows_are_gated_batched_and_aggregated():
+    ecg_matrix = np.zeros((35 * 500, 12))
+    batch_sizes = []
+
+    def infer_batch(batch):
+        batch_sizes.append(len(batch))
+        return [{"risk": {"af": 0.1 * (index + 1)}, "label": "x"} for index in range(len(batch))]
+
+    def preprocess(window):
+        preprocess.starts += 1
+        return window, preprocess.starts != 3  # the window at 16 s is unusable
+    preprocess.starts = 0
+
+    result = analyze_windows(ecg_matrix, 500, infer_batch, preprocess=preprocess, batch_size=3, keep_windows=True)
+
+    assert batch_sizes == [3, 1]
+    assert result["duration"] == 35 and result["skipped_windows"] == [16]
+    assert [window["start"] for window in result["windows"]] == [0, 8, 24, 25]
+    assert result["aggregate"]["windows"] == 4
+    assert np.isclose(result["aggregate"]["mean"]["risk.af"], (0.1 + 0.2 + 0.3 + 0.1) / 4)
+    assert np.isclose(result["aggregate"]["max"]["risk.af"], 0.3)
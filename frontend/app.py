@@ -2,12 +2,13 @@ import os
 import streamlit as st
 import sys
 import requests
+from io import BytesIO
 from PIL import Image
 
 # 確保可以導入後端模組
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend', 'app')))
 
-from services.api import upload_fhir_ecg_to_ai
+from services.api import get_ecg_image, upload_fhir_ecg_to_ai
 # streamlit run app.py
 
 def login(username, password):
@@ -130,10 +131,11 @@ def main():
                         st.write(result.get("file_name", "No file name provided"))
                         st.json(result.get("result", {}))
 
-                        # 顯示圖像
-                        image_path = result.get("fig_path")
-                        if image_path and os.path.exists(image_path):
-                            image = Image.open(image_path)
+                        # 顯示圖像 (由後端依需求渲染並快取)
+                        image_url = result.get("image_url")
+                        image_result = get_ecg_image(image_url, headers=headers) if image_url else {"success": False}
+                        if image_result.get("success") and image_result.get("content"):
+                            image = Image.open(BytesIO(image_result["content"]))
                             st.image(image, caption="ECG Plot", use_container_width =True)
                         else:
                             st.warning("No image results found")